@@ -2,6 +2,8 @@
 ASGI config for ImpulsaMente project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Besides the Django application it serves the chat event stream
+(Server-Sent Events) at /api/chat/stream/.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -13,4 +15,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ImpulsaMente_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importar después de inicializar Django
+from servicios.chat_stream import with_chat_stream  # noqa: E402
+
+application = with_chat_stream(django_application)
@@ -141,19 +141,52 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Cache configuration
-CACHES = {
-    'default': {
+# La caché debe ser compartida por todos los workers: la invalidación del
+# catálogo y los límites de django-ratelimit dependen de ello.
+#   sqlite    - archivo SQLite común a los procesos de un mismo host (sin dependencias)
+#   memcached - servidor memcached, para varios hosts (requiere pylibmc)
+#   locmem    - memoria de cada proceso (solo desarrollo con un único proceso)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')
+CACHE_BACKENDS = {
+    'sqlite': {
+        'BACKEND': 'servicios.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'impulsamente-cache',
         'OPTIONS': {
             'MAX_ENTRIES': 1000
         }
-    }
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND]
 }
 
 # Cache time to live (in seconds)
 CACHE_TTL = 60 * 15  # 15 minutes
 
+# Chat en tiempo real (stream SSE servido por asgi.py)
+# Broker de eventos: en memoria del proceso o uno compartido para varios procesos
+CHAT_PUBSUB_BACKEND = os.getenv('CHAT_PUBSUB_BACKEND', 'servicios.chat_events.InProcessBroker')
+CHAT_STREAM_HEARTBEAT = 15  # segundos entre pings del stream
+
+# Long-polling del chat para despliegues sin ASGI (0 = desactivado).
+# Cada petición en espera ocupa un worker: dimensionar los workers en consecuencia.
+CHAT_LONG_POLL_TIMEOUT = int(os.getenv('CHAT_LONG_POLL_TIMEOUT', '0'))  # segundos
+CHAT_LONG_POLL_INTERVAL = 0.5  # segundos entre lecturas del contador en caché
+
+# Antigüedad a partir de la cual archive_chat_messages mueve mensajes al archivo frío
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', '180'))
+
 # Login settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'cliente_dashboard'
@@ -9,8 +9,199 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Filters
     initFilters();
+    
+    // Cargar la pestaña visible al abrir el dashboard
+    const panelActivo = document.querySelector('.tab-panel.active');
+    if (panelActivo) {
+        activarSeccion(panelActivo.id.replace(/-tab$/, ''));
+    }
 });
 
+// Pestañas cuyo contenido se pide al servidor al abrirlas. Los filtros se
+// aplican en el servidor: parametros() arma la consulta y contador(total) el texto
+const SECCIONES_DIFERIDAS = {
+    solicitudes: {},
+    empleados: {},
+    clientes: {
+        parametros: () => ({ q: valorFiltro('buscar-cliente') })
+    },
+    asignaciones: {
+        parametros: () => ({
+            q: valorFiltro('buscar-cliente-asignacion'),
+            empleado: valorFiltro('buscar-empleado-asignacion'),
+            servicio: valorFiltro('filtro-servicio-asignacion'),
+            estado: valorFiltro('filtro-estado-asignacion'),
+            fecha_desde: valorFiltro('fecha-desde-asignacion'),
+            fecha_hasta: valorFiltro('fecha-hasta-asignacion')
+        }),
+        contador: total => ['contador-asignaciones', `${total} asignaciones`]
+    },
+    sesiones: {
+        parametros: () => ({
+            q: valorFiltro('buscar-sesion'),
+            empleado: valorFiltro('filtro-empleado'),
+            servicio: valorFiltro('filtro-servicio'),
+            estado: valorFiltro('filtro-estado-sesion'),
+            fecha_desde: valorFiltro('fecha-desde'),
+            fecha_hasta: valorFiltro('fecha-hasta')
+        }),
+        contador: total => ['contador-sesiones', `${total} sesiones`]
+    },
+    archivos: {
+        parametros: () => ({ asignacion: valorFiltro('filtro-asignacion') })
+    },
+    auditoria: {
+        parametros: () => ({
+            q: valorFiltro('buscar-usuario-auditoria'),
+            accion: valorFiltro('filtro-accion-auditoria'),
+            descripcion: valorFiltro('buscar-descripcion-auditoria'),
+            ip: valorFiltro('buscar-ip-auditoria'),
+            fecha_desde: valorFiltro('fecha-desde-auditoria'),
+            fecha_hasta: valorFiltro('fecha-hasta-auditoria')
+        }),
+        contador: total => ['contador-auditoria', `${total} registros`]
+    }
+};
+
+// Espera tras la última tecla antes de volver a pedir una pestaña filtrada
+const ESPERA_FILTRO_MS = 300;
+
+// Selects llenados bajo demanda: data-opciones -> tipo pedido al servidor y formato [valor, texto]
+const FORMATOS_OPCIONES = {
+    'clientes': {
+        tipo: 'clientes',
+        formato: o => [o.id, `${o.username} - ${o.first_name} ${o.last_name}`.trim()]
+    },
+    'empleados': {
+        tipo: 'empleados',
+        formato: o => [o.id, `${o.username} - ${o.first_name} ${o.last_name}`.trim()]
+    },
+    'empleados-usuario': {
+        tipo: 'empleados',
+        formato: o => [o.username, o.username]
+    },
+    'asignaciones': {
+        tipo: 'asignaciones',
+        formato: o => [o.id, `${o.client} - ${o.employee}`]
+    },
+    'asignaciones-activas': {
+        tipo: 'asignaciones',
+        incluir: o => o.is_active,
+        formato: o => [o.id, `${o.client} → ${o.employee} (${o.service})`]
+    }
+};
+
+const estadoSecciones = {};
+const solicitudesOpciones = {};
+
+// Cargar la primera página de una pestaña y sus selects (solo la primera vez)
+function activarSeccion(seccion) {
+    const panel = document.getElementById(seccion + '-tab');
+    if (panel) {
+        cargarOpciones(panel);
+    }
+    if (SECCIONES_DIFERIDAS[seccion] && !estadoSecciones[seccion]) {
+        cargarSeccion(seccion);
+    }
+}
+
+function valorFiltro(id) {
+    const elemento = document.getElementById(id);
+    return elemento ? elemento.value.trim() : '';
+}
+
+// Pedir la siguiente página de una pestaña (con sus filtros) y agregarla al final
+async function cargarSeccion(seccion) {
+    if (!estadoSecciones[seccion]) {
+        estadoSecciones[seccion] = { pagina: 0, cargando: false, completa: false };
+    }
+    const estado = estadoSecciones[seccion];
+    if (estado.cargando || estado.completa) return;
+    estado.cargando = true;
+    
+    const config = SECCIONES_DIFERIDAS[seccion];
+    const paginacion = document.getElementById('paginacion-' + seccion);
+    const indicador = paginacion.querySelector('.seccion-cargando');
+    const boton = paginacion.querySelector('button');
+    indicador.style.display = '';
+    boton.style.display = 'none';
+    
+    const parametros = new URLSearchParams({ page: estado.pagina + 1 });
+    Object.entries(config.parametros ? config.parametros() : {}).forEach(([nombre, valor]) => {
+        if (valor) parametros.set(nombre, valor);
+    });
+    
+    try {
+        const response = await fetch(`/admin/api/${seccion}/?${parametros}`);
+        const data = await response.json();
+        // Los filtros cambiaron mientras tanto: esta respuesta ya no sirve
+        if (estadoSecciones[seccion] !== estado) return;
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        
+        const contenedor = document.querySelector(`[data-seccion="${seccion}"]`);
+        contenedor.insertAdjacentHTML('beforeend', data.html);
+        estado.pagina = data.page;
+        estado.completa = !data.has_next;
+        boton.style.display = data.has_next ? '' : 'none';
+        
+        if (config.contador) {
+            const [id, texto] = config.contador(data.total);
+            document.getElementById(id).textContent = texto;
+        }
+    } catch (error) {
+        console.error('Error al cargar la sección:', error);
+        mostrarNotificacion('Error al cargar la sección', 'error');
+        boton.style.display = '';
+    } finally {
+        estado.cargando = false;
+        if (estadoSecciones[seccion] === estado) {
+            indicador.style.display = 'none';
+        }
+    }
+}
+
+// Volver a pedir la primera página de una pestaña con los filtros actuales
+function recargarSeccion(seccion) {
+    estadoSecciones[seccion] = null;
+    document.querySelector(`[data-seccion="${seccion}"]`).innerHTML = '';
+    cargarSeccion(seccion);
+}
+
+const recargasPendientes = {};
+
+// recargarSeccion tras una pausa al escribir en los filtros
+function programarRecarga(seccion) {
+    clearTimeout(recargasPendientes[seccion]);
+    recargasPendientes[seccion] = setTimeout(() => recargarSeccion(seccion), ESPERA_FILTRO_MS);
+}
+
+// Llenar los selects marcados con data-opciones dentro de un panel
+function cargarOpciones(panel) {
+    panel.querySelectorAll('select[data-opciones]:not([data-opciones-cargadas])').forEach(select => {
+        const config = FORMATOS_OPCIONES[select.dataset.opciones];
+        if (!config) return;
+        select.dataset.opcionesCargadas = '1';
+        
+        if (!solicitudesOpciones[config.tipo]) {
+            solicitudesOpciones[config.tipo] = fetch(`/admin/api/opciones/${config.tipo}/`)
+                .then(response => response.json())
+                .then(data => data.success ? data.options : []);
+        }
+        solicitudesOpciones[config.tipo].then(opciones => {
+            opciones.filter(config.incluir || (() => true)).forEach(opcion => {
+                const [valor, texto] = config.formato(opcion);
+                select.add(new Option(texto, valor));
+            });
+        }).catch(error => {
+            console.error('Error al cargar opciones:', error);
+            delete select.dataset.opcionesCargadas;
+            delete solicitudesOpciones[config.tipo];
+        });
+    });
+}
+
 // Inicializar tabs
 function initTabs() {
     const tabButtons = document.querySelectorAll('.admin-tab-btn');
@@ -34,6 +225,7 @@ function initTabs() {
             const targetPanel = document.getElementById(targetTab + '-tab');
             if (targetPanel) {
                 targetPanel.classList.add('active');
+                activarSeccion(targetTab);
             }
         });
     });
@@ -243,7 +435,7 @@ function initFilters() {
     const filtroAsignacion = document.getElementById('filtro-asignacion');
     if (filtroAsignacion) {
         filtroAsignacion.addEventListener('change', function() {
-            filtrarTabla('archivos-tab', 4, this.value);
+            programarRecarga('archivos');
         });
     }
     
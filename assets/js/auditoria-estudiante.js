@@ -51,7 +51,7 @@ function showMaterialDetails(materialItem) {
     const title = materialItem.querySelector('h4').textContent;
     const description = materialItem.querySelector('p').textContent;
     const status = materialItem.getAttribute('data-status');
-    const sessionId = materialItem.getAttribute('data-session-id'); // Obtener ID único
+    const itemIndex = Array.from(document.querySelectorAll('.material-item')).indexOf(materialItem);
     
     let statusText = '';
     let statusColor = '';
@@ -68,7 +68,7 @@ function showMaterialDetails(materialItem) {
             <div style="margin-bottom:15px;"><strong>Estado:</strong> <span style="color:${statusColor}; font-weight:600;">${statusText}</span></div>
             <div style="margin-bottom:20px; color:#555; line-height:1.5;">${description}</div>
             <div style="display:flex; gap:10px; justify-content:flex-end;">
-                ${status !== 'completed' ? `<button onclick="markAsCompleted(this, '${sessionId}')" style="background:#a9d380; color:white; border:none; padding:10px 20px; border-radius:8px; cursor:pointer; font-weight:600;">Marcar Completado</button>` : ''}
+                ${status !== 'completed' ? `<button onclick="markAsCompleted(this, ${itemIndex})" style="background:#a9d380; color:white; border:none; padding:10px 20px; border-radius:8px; cursor:pointer; font-weight:600;">Marcar Completado</button>` : ''}
                 <button onclick="this.closest('div').parentElement.remove()" style="background:#95a5a6; color:white; border:none; padding:10px 20px; border-radius:8px; cursor:pointer; font-weight:600;">Cerrar</button>
             </div>
         </div>
@@ -77,33 +77,53 @@ function showMaterialDetails(materialItem) {
     document.body.appendChild(modal);
 }
 
-function markAsCompleted(btn, sessionId) {
+// Id de la sesión del elemento; las ocurrencias pendientes de una repetición
+// no tienen fila y se materializan primero
+function resolveSessionId(item) {
+    const sessionId = item.getAttribute('data-session-id');
+    if (sessionId) {
+        return Promise.resolve(sessionId);
+    }
+    const body = new URLSearchParams({ occurrence: item.getAttribute('data-occurrence') });
+    return fetch(`/api/recurrence/${item.getAttribute('data-recurrence-id')}/materialize/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+        },
+        body: body
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        item.setAttribute('data-session-id', data.session_id);
+        return String(data.session_id);
+    });
+}
+
+function markAsCompleted(btn, itemIndex) {
+    const item = document.querySelectorAll('.material-item')[itemIndex];
     // Guardar en la base de datos
-    fetch(`/api/session/${sessionId}/update-status/`, {
+    resolveSessionId(item)
+    .then(sessionId => fetch(`/api/session/${sessionId}/update-status/`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify({ status: 'completed' })
-    })
+    }))
     .then(response => response.json())
     .then(data => {
         if (data.success) {
             // Actualizar visualmente el elemento
-            const materialItems = document.querySelectorAll('.material-item');
-            let completedTitle = '';
-            
-            materialItems.forEach(item => {
-                if (item.getAttribute('data-session-id') === sessionId) {
-                    completedTitle = item.querySelector('h4').textContent;
-                    item.setAttribute('data-status', 'completed');
-                    item.className = 'material-item completed';
-                    item.querySelector('p').textContent = `Completado el ${new Date().toLocaleDateString('es-ES')}`;
-                    item.querySelector('.status-indicator').className = 'status-indicator completed-status';
-                    item.querySelector('.status-indicator').textContent = '✓';
-                    item.querySelector('.material-icon').textContent = '📁';
-                }
-            });
+            const completedTitle = item.querySelector('h4').textContent;
+            item.setAttribute('data-status', 'completed');
+            item.className = 'material-item completed';
+            item.querySelector('p').textContent = `Completado el ${new Date().toLocaleDateString('es-ES')}`;
+            item.querySelector('.status-indicator').className = 'status-indicator completed-status';
+            item.querySelector('.status-indicator').textContent = '✓';
+            item.querySelector('.material-icon').textContent = '📁';
             
             updateStats();
             btn.closest('div').parentElement.remove();
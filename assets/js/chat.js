@@ -1,9 +1,24 @@
 // Sistema de Chat Interno
+
+// Segundos que se pide al servidor esperar en el long-polling (lo limita CHAT_LONG_POLL_TIMEOUT)
+const CHAT_LONG_POLL_WAIT = 25;
+
 class ChatSystem {
     constructor() {
         this.currentAssignmentId = null;
-        this.messagePollingInterval = null;
+        this.messagePollingTimer = null;
+        this.messagePollingGeneration = 0;
+        this.unreadVersion = null;
         this.conversations = [];
+        // Cursores de la conversación abierta
+        this.newestMessageId = null;
+        this.oldestMessageId = null;
+        this.hasOlderMessages = false;
+        this.loadingOlder = false;
+        this.renderedMessageIds = new Set();
+        // Stream de eventos (ASGI); mientras está abierto se omite el polling
+        this.eventSource = null;
+        this.pushActive = false;
         this.init();
     }
 
@@ -11,6 +26,42 @@ class ChatSystem {
         this.loadConversations();
         this.setupEventListeners();
         this.startUnreadCountPolling();
+        this.connectEventStream();
+    }
+
+    connectEventStream() {
+        if (!window.EventSource) return;
+
+        let opened = false;
+        this.eventSource = new EventSource('/api/chat/stream/');
+
+        this.eventSource.onopen = () => {
+            opened = true;
+            this.pushActive = true;
+        };
+
+        this.eventSource.onerror = () => {
+            this.pushActive = false;
+            // Sin servidor ASGI la ruta no existe: quedarse con el polling
+            if (!opened) {
+                this.eventSource.close();
+                this.eventSource = null;
+            }
+        };
+
+        this.eventSource.addEventListener('message', (e) => {
+            const data = JSON.parse(e.data);
+            if (data.assignment_id === this.currentAssignmentId) {
+                // Pedir por cursor para que el servidor registre la lectura
+                this.loadNewMessages(this.currentAssignmentId);
+            }
+            this.loadConversations();
+        });
+
+        this.eventSource.addEventListener('unread', (e) => {
+            const data = JSON.parse(e.data);
+            this.updateUnreadBadge(data.unread_count);
+        });
     }
 
     setupEventListeners() {
@@ -30,6 +81,16 @@ class ChatSystem {
         if (sendBtn) {
             sendBtn.addEventListener('click', () => this.sendMessage());
         }
+
+        // Cargar historial anterior al llegar arriba
+        const container = document.getElementById('chatMessagesContainer');
+        if (container) {
+            container.addEventListener('scroll', () => {
+                if (container.scrollTop === 0 && this.hasOlderMessages) {
+                    this.loadOlderMessages();
+                }
+            });
+        }
     }
 
     async loadConversations() {
@@ -102,6 +163,10 @@ class ChatSystem {
             const data = await response.json();
 
             if (data.success) {
+                this.renderedMessageIds = new Set(data.messages.map(msg => msg.id));
+                this.newestMessageId = data.newest_id;
+                this.oldestMessageId = data.oldest_id;
+                this.hasOlderMessages = data.has_more;
                 this.renderMessages(data.messages);
                 this.updateChatHeader(data.other_user, data.service_name);
             }
@@ -110,6 +175,52 @@ class ChatSystem {
         }
     }
 
+    async loadNewMessages(assignmentId, wait = 0) {
+        // Solo pide los mensajes posteriores al último recibido
+        if (this.newestMessageId === null) {
+            return this.loadMessages(assignmentId);
+        }
+
+        try {
+            let url = `/api/chat/${assignmentId}/messages/?since_id=${this.newestMessageId}`;
+            if (wait) {
+                url += `&wait=${wait}`;
+            }
+            const response = await fetch(url);
+            const data = await response.json();
+
+            if (data.success && assignmentId === this.currentAssignmentId) {
+                data.messages.forEach(msg => this.appendMessage(msg));
+            }
+            return data;
+        } catch (error) {
+            console.error('Error loading new messages:', error);
+        }
+    }
+
+    async loadOlderMessages() {
+        if (this.loadingOlder || this.oldestMessageId === null) return;
+        this.loadingOlder = true;
+
+        const assignmentId = this.currentAssignmentId;
+        try {
+            const response = await fetch(`/api/chat/${assignmentId}/messages/?before_id=${this.oldestMessageId}`);
+            const data = await response.json();
+
+            if (data.success && assignmentId === this.currentAssignmentId) {
+                this.hasOlderMessages = data.has_more;
+                if (data.oldest_id !== null) {
+                    this.oldestMessageId = data.oldest_id;
+                }
+                this.prependMessages(data.messages);
+            }
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            this.loadingOlder = false;
+        }
+    }
+
     updateChatHeader(otherUser, serviceName) {
         const headerInfo = document.querySelector('.chat-header-info');
         if (headerInfo) {
@@ -179,55 +290,101 @@ class ChatSystem {
         }
     }
 
+    buildMessageElement(message) {
+        const messageEl = document.createElement('div');
+        messageEl.className = `chat-message ${message.is_mine ? 'mine' : ''}`;
+        messageEl.innerHTML = `
+            <div class="message-bubble">
+                <p class="message-text">${this.escapeHtml(message.message)}</p>
+                <span class="message-time">${message.created_at}</span>
+            </div>
+        `;
+        return messageEl;
+    }
+
+    prependMessages(messages) {
+        const container = document.getElementById('chatMessagesContainer');
+        if (!container || messages.length === 0) return;
+
+        // Mantener la posición de lectura al insertar arriba
+        const previousHeight = container.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        messages.forEach(msg => {
+            if (this.renderedMessageIds.has(msg.id)) return;
+            this.renderedMessageIds.add(msg.id);
+            fragment.appendChild(this.buildMessageElement(msg));
+        });
+        container.insertBefore(fragment, container.firstChild);
+        container.scrollTop = container.scrollHeight - previousHeight;
+    }
+
     appendMessage(message) {
         const container = document.getElementById('chatMessagesContainer');
         if (!container) return;
 
+        if (this.renderedMessageIds.has(message.id)) return;
+        this.renderedMessageIds.add(message.id);
+        if (this.newestMessageId === null || message.id > this.newestMessageId) {
+            this.newestMessageId = message.id;
+        }
+
         // Remover estado vacío si existe
         const emptyState = container.querySelector('.chat-empty-state');
         if (emptyState) {
             emptyState.remove();
         }
 
-        const messageEl = document.createElement('div');
-        messageEl.className = `chat-message ${message.is_mine ? 'mine' : ''}`;
-        messageEl.innerHTML = `
-            <div class="message-bubble">
-                <p class="message-text">${this.escapeHtml(message.message)}</p>
-                <span class="message-time">${message.created_at}</span>
-            </div>
-        `;
-        container.appendChild(messageEl);
+        container.appendChild(this.buildMessageElement(message));
         container.scrollTop = container.scrollHeight;
     }
 
     startMessagePolling() {
-        // Limpiar polling anterior
-        if (this.messagePollingInterval) {
-            clearInterval(this.messagePollingInterval);
+        // Limpiar polling anterior; la generación descarta respuestas en vuelo
+        if (this.messagePollingTimer) {
+            clearTimeout(this.messagePollingTimer);
         }
-
-        // Polling cada 3 segundos
-        this.messagePollingInterval = setInterval(() => {
-            if (this.currentAssignmentId) {
-                this.loadMessages(this.currentAssignmentId);
+        const generation = ++this.messagePollingGeneration;
+
+        // El servidor indica cuándo volver a consultar (poll_interval)
+        const poll = async () => {
+            let delay = 3000;
+            if (this.currentAssignmentId && !this.pushActive) {
+                const data = await this.loadNewMessages(this.currentAssignmentId, CHAT_LONG_POLL_WAIT);
+                if (data && data.success && data.poll_interval !== undefined) {
+                    delay = data.poll_interval;
+                }
+            }
+            if (generation === this.messagePollingGeneration) {
+                this.messagePollingTimer = setTimeout(poll, delay);
             }
-        }, 3000);
+        };
+        this.messagePollingTimer = setTimeout(poll, 3000);
     }
 
     startUnreadCountPolling() {
-        setInterval(async () => {
-            try {
-                const response = await fetch('/api/chat/unread-count/');
-                const data = await response.json();
+        const poll = async () => {
+            let delay = 10000;
+            if (!this.pushActive) {
+                try {
+                    let url = `/api/chat/unread-count/?wait=${CHAT_LONG_POLL_WAIT}`;
+                    if (this.unreadVersion !== null) {
+                        url += `&since_version=${this.unreadVersion}`;
+                    }
+                    const response = await fetch(url);
+                    const data = await response.json();
 
-                if (data.success) {
-                    this.updateUnreadBadge(data.unread_count);
+                    if (data.success) {
+                        this.updateUnreadBadge(data.unread_count);
+                        this.unreadVersion = data.version;
+                        delay = data.poll_interval;
+                    }
+                } catch (error) {
+                    console.error('Error fetching unread count:', error);
                 }
-            } catch (error) {
-                console.error('Error fetching unread count:', error);
             }
-        }, 10000); // Cada 10 segundos
+            setTimeout(poll, delay);
+        };
+        setTimeout(poll, 10000);
     }
 
     updateUnreadBadge(count) {
@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import Service, Price, Customer, Order
+from .order_processing import FAILED, GENERATED, approvable_orders, process_orders
 
 
 @admin.register(Service)
@@ -56,4 +57,16 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['customer__name', 'customer__email', 'notes']
     date_hierarchy = 'created_at'
     readonly_fields = ['created_at', 'updated_at']
+    actions = ['generate_sessions']
 
+    def generate_sessions(self, request, queryset):
+        """Generar las sesiones de las órdenes seleccionadas que estén listas"""
+        order_ids = list(approvable_orders().filter(id__in=queryset.values('id')).values_list('id', flat=True))
+        results = process_orders(order_ids, user=request.user)
+        generated = sum(1 for result in results if result.outcome == GENERATED)
+        failed = [result for result in results if result.outcome == FAILED]
+        skipped = queryset.count() - generated - len(failed)
+        self.message_user(request, f'Sesiones generadas para {generated} orden(es); {skipped} omitida(s).')
+        for result in failed:
+            self.message_user(request, f'Orden #{result.order_id}: {result.message}', messages.ERROR)
+    generate_sessions.short_description = "Generar sesiones de las órdenes pendientes"
@@ -0,0 +1,334 @@
+"""
+Secciones del dashboard de administración servidas bajo demanda.
+
+El dashboard solo renderiza la navegación y los contadores; cada pestaña pide
+su contenido paginado a admin_section cuando se abre por primera vez, y los
+selects de los formularios se llenan con admin_options. Los filtros de cada
+pestaña se aplican en la consulta (SECTION_FILTERS), no sobre las filas ya
+cargadas en el navegador.
+"""
+from datetime import datetime, time, timedelta
+from heapq import merge
+from itertools import islice
+
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator, EmptyPage
+from django.db.models import Q, Count, OuterRef, Subquery, IntegerField, F, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import Order, ClientAssignment, ClientSessionStats, Session, SessionRecurrence, FileUpload, AuditLog
+from .recurrence import pending_sessions
+from .views import is_admin
+
+# Tamaño de página de las secciones del dashboard
+ADMIN_SECTION_PAGE_SIZE = 25
+ADMIN_SECTION_MAX_PAGE_SIZE = 100
+
+
+def _count_subquery(queryset, field):
+    """Conteo correlacionado por usuario (evita multiplicar filas con JOINs)"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def employees_queryset():
+    """Empleados: staff o con grupos de Psicólogo/Tutor, excluyendo Cliente"""
+    return User.objects.filter(
+        Q(is_staff=True) |
+        Q(groups__name='Psicólogo') |
+        Q(groups__name='Tutor')
+    ).exclude(groups__name='Cliente').distinct()
+
+
+def clients_queryset():
+    """Clientes del sistema"""
+    return User.objects.filter(groups__name='Cliente')
+
+
+def _orders():
+    return Order.objects.select_related(
+        'customer', 'service', 'price', 'preferred_employee',
+        'preferred_tutor', 'preferred_therapist'
+    ).order_by('-created_at')
+
+
+def _employees():
+    return employees_queryset().prefetch_related('groups').order_by('username')
+
+
+def clients_with_stats():
+    """
+    Clientes con sus contadores, sin JOINs uno-a-muchos.
+
+    Las sesiones salen de ClientSessionStats y el resto de subconsultas
+    correlacionadas independientes, así el costo crece linealmente con la
+    cantidad de clientes (ver el comando benchmark_admin_clients).
+    """
+    return clients_queryset().annotate(
+        active_assignments_count=_count_subquery(
+            ClientAssignment.objects.filter(is_active=True), 'client'
+        ),
+        total_sessions=Coalesce(F('session_stats__total_sessions'), 0),
+        files_count=_count_subquery(FileUpload.objects.all(), 'assignment__client'),
+        audit_count=_count_subquery(AuditLog.objects.all(), 'user'),
+    ).prefetch_related(
+        Prefetch(
+            'client_assignments',
+            queryset=ClientAssignment.objects.filter(is_active=True).select_related('employee', 'service'),
+            to_attr='active_assignments'
+        )
+    ).order_by('-date_joined', '-id')
+
+
+def _assignments():
+    return ClientAssignment.objects.select_related(
+        'client', 'employee', 'service'
+    ).order_by('-assigned_at', '-id')
+
+
+def _sessions():
+    # De más reciente a más antigua (para ver las nuevas primero)
+    return Session.objects.select_related(
+        'assignment__client', 'assignment__employee', 'assignment__service'
+    ).order_by('-scheduled_date', '-id')
+
+
+class SessionsWithPending:
+    """
+    Filas de la pestaña de sesiones (consulta, de más reciente a más antigua)
+    intercaladas con las ocurrencias pendientes de las repeticiones (lista en
+    el mismo orden), para el Paginator.
+
+    Una página [start, stop) solo necesita las filas desde start menos la
+    cantidad de pendientes: la consulta sigue paginada en la base.
+    """
+
+    def __init__(self, rows, pending):
+        self.rows = rows
+        self.pending = pending
+
+    def count(self):
+        return self.rows.count() + len(self.pending)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        first_row = max(page.start - len(self.pending), 0)
+        rows = list(self.rows[first_row:page.stop])
+        if first_row == 0:
+            first_pending = 0
+        elif rows:
+            # Pendientes que van antes de la primera fila (con la misma fecha, primero las filas)
+            first_pending = sum(1 for session in self.pending if session.scheduled_date > rows[0].scheduled_date)
+        else:
+            return []
+        position = first_row + first_pending
+        merged = merge(
+            rows, self.pending[first_pending:], key=lambda session: session.scheduled_date, reverse=True
+        )
+        return list(islice(merged, page.start - position, page.stop - position))
+
+
+def _pending_sessions(params):
+    """Ocurrencias pendientes (más recientes primero) que pasan los filtros de la pestaña de sesiones"""
+    status = params.get('estado', '').strip()
+    if status and status != 'scheduled':
+        return []
+    recurrences = SessionRecurrence.objects.select_related(
+        'assignment__client', 'assignment__employee', 'assignment__service'
+    )
+    # Los filtros sobre la asignación valen igual para las repeticiones
+    filters = SECTION_FILTERS['sesiones']
+    for name in ('q', 'empleado', 'servicio'):
+        value = params.get(name, '').strip()
+        if value:
+            recurrences = recurrences.filter(filters[name](value))
+    start = params.get('fecha_desde', '').strip()
+    end = params.get('fecha_hasta', '').strip()
+    return pending_sessions(
+        recurrences,
+        _day_start(start) if start else None,
+        _day_start(end) + timedelta(days=1) if end else None
+    )[::-1]
+
+
+def _files():
+    return FileUpload.objects.select_related(
+        'assignment__client', 'assignment__employee', 'uploaded_by'
+    ).order_by('-uploaded_at', '-id')
+
+
+def _audit_logs():
+    return AuditLog.objects.select_related('user').order_by('-timestamp', '-id')
+
+
+# Pestaña del dashboard -> consulta de sus elementos
+ADMIN_SECTIONS = {
+    'solicitudes': _orders,
+    'empleados': _employees,
+    'clientes': clients_with_stats,
+    'asignaciones': _assignments,
+    'sesiones': _sessions,
+    'archivos': _files,
+    'auditoria': _audit_logs,
+}
+
+
+def _day_start(value):
+    """Inicio del día local de una fecha YYYY-MM-DD (ValueError si no es válida)"""
+    return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min))
+
+
+def _date_filters(field):
+    """fecha_desde y fecha_hasta (ambas incluidas) sobre un DateTimeField"""
+    return {
+        'fecha_desde': lambda value: Q(**{f'{field}__gte': _day_start(value)}),
+        'fecha_hasta': lambda value: Q(**{f'{field}__lt': _day_start(value) + timedelta(days=1)}),
+    }
+
+
+def _assignment_state(value):
+    if value not in ('activa', 'inactiva'):
+        raise ValueError(value)
+    return Q(is_active=value == 'activa')
+
+
+# Pestaña -> parámetro de la petición -> condición sobre su consulta
+SECTION_FILTERS = {
+    'clientes': {
+        'q': lambda value: (
+            Q(username__icontains=value) | Q(first_name__icontains=value) |
+            Q(last_name__icontains=value) | Q(email__icontains=value)
+        ),
+    },
+    'asignaciones': {
+        'q': lambda value: Q(client__username__icontains=value),
+        'empleado': lambda value: Q(employee__username__icontains=value),
+        'servicio': lambda value: Q(service__name__icontains=value),
+        'estado': _assignment_state,
+        **_date_filters('assigned_at'),
+    },
+    'sesiones': {
+        'q': lambda value: (
+            Q(assignment__client__username__icontains=value) |
+            Q(assignment__client__email__icontains=value)
+        ),
+        'empleado': lambda value: Q(assignment__employee__username=value),
+        'servicio': lambda value: Q(assignment__service__name__icontains=value),
+        'estado': lambda value: Q(status=value),
+        **_date_filters('scheduled_date'),
+    },
+    'archivos': {
+        'asignacion': lambda value: Q(assignment_id=int(value)),
+    },
+    'auditoria': {
+        'q': lambda value: Q(user__username__icontains=value),
+        'accion': lambda value: Q(action=value),
+        'descripcion': lambda value: Q(description__icontains=value),
+        'ip': lambda value: Q(ip_address__icontains=value),
+        **_date_filters('timestamp'),
+    },
+}
+
+
+def filter_section(section, queryset, params):
+    """Aplicar a la consulta de una pestaña los filtros presentes en params (ValueError si no son válidos)"""
+    for name, condition in SECTION_FILTERS.get(section, {}).items():
+        value = params.get(name, '').strip()
+        if value:
+            queryset = queryset.filter(condition(value))
+    return queryset
+
+
+def dashboard_summary():
+    """Contadores de la cabecera del dashboard (solo COUNT/SUM, sin cargar filas)"""
+    return {
+        'orders': Order.objects.count(),
+        'assignments': ClientAssignment.objects.count(),
+        # Incluye las ocurrencias pendientes de las repeticiones (ver session_stats.py)
+        'sessions': ClientSessionStats.objects.aggregate(total=Sum('total_sessions'))['total'] or 0,
+        'audit_logs': AuditLog.objects.count(),
+    }
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_section(request, section):
+    """
+    Una página de una pestaña del dashboard como fragmento HTML.
+
+    Parámetros: page, page_size y los filtros de la pestaña (SECTION_FILTERS:
+    q, estado, empleado, servicio, fecha_desde, fecha_hasta...). Retorna el
+    HTML de los elementos junto a la información de paginación para pedir la
+    página siguiente; total cuenta los elementos que pasan los filtros.
+    """
+    if section not in ADMIN_SECTIONS:
+        return JsonResponse({'success': False, 'error': 'Sección no encontrada'}, status=404)
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', ADMIN_SECTION_PAGE_SIZE)), 1), ADMIN_SECTION_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros de paginación inválidos'}, status=400)
+
+    try:
+        items = filter_section(section, ADMIN_SECTIONS[section](), request.GET)
+        if section == 'sesiones':
+            items = SessionsWithPending(items, _pending_sessions(request.GET))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Filtros inválidos'}, status=400)
+
+    paginator = Paginator(items, page_size)
+    try:
+        page = paginator.page(page_number)
+    except EmptyPage:
+        return JsonResponse({
+            'success': True,
+            'html': '',
+            'page': page_number,
+            'has_next': False,
+            'total': paginator.count,
+        })
+
+    html = render_to_string(f'admin-dashboard/{section}.html', {'items': page.object_list}, request=request)
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'page': page_number,
+        'has_next': page.has_next(),
+        'total': paginator.count,
+    })
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_options(request, kind):
+    """Opciones para los selects de los formularios (clientes, empleados o asignaciones)"""
+    if kind == 'clientes':
+        options = list(clients_queryset().order_by('username').values('id', 'username', 'first_name', 'last_name'))
+    elif kind == 'empleados':
+        options = list(employees_queryset().order_by('username').values('id', 'username', 'first_name', 'last_name'))
+    elif kind == 'asignaciones':
+        options = [
+            {
+                'id': row['id'],
+                'client': row['client__username'],
+                'employee': row['employee__username'],
+                'service': row['service__name'],
+                'is_active': row['is_active'],
+            }
+            for row in ClientAssignment.objects.order_by('client__username', 'id').values(
+                'id', 'client__username', 'employee__username', 'service__name', 'is_active'
+            )
+        ]
+    else:
+        return JsonResponse({'success': False, 'error': 'Tipo de opciones no encontrado'}, status=404)
+
+    return JsonResponse({'success': True, 'options': options})
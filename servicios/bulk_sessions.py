@@ -0,0 +1,170 @@
+"""
+Operaciones masivas sobre las sesiones de una asignación o de un empleado.
+
+Cada operación es un solo UPDATE por conjunto dentro de una transacción, con
+un registro de auditoría que resume el cambio. QuerySet.update no dispara
+señales: las estadísticas se recalculan con rebuild_assignments y la caché de
+las asignaciones afectadas se invalida a mano. Las ocurrencias pendientes de
+las repeticiones que caen en el rango se materializan antes (recurrence.py),
+así el UPDATE también las alcanza.
+
+El alcance es un CalendarOwner de tipo 'employee' o 'assignment' (ver
+session_calendar.py).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from .models import AuditLog, ClientAssignment, Session, SessionRecurrence, invalidate_assignments_on_commit
+from .recurrence import materialize_pending
+from .scheduling import employee_calendars, lock_employees, session_interval
+from .session_stats import SCHEDULED_STATUSES, rebuild_assignments
+
+# Estados que se pueden asignar a una lista de sesiones
+BULK_STATUSES = ('completed', 'no_show')
+
+WEEKDAY_NAMES = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+
+def _lookups(owner):
+    return {f'assignment__{field}': value for field, value in owner.assignment_filter.items()}
+
+
+def _active_sessions(owner, start, end=None):
+    """Sesiones programadas o confirmadas del alcance en [start, end)"""
+    sessions = Session.objects.filter(
+        status__in=SCHEDULED_STATUSES, scheduled_date__gte=start, **_lookups(owner)
+    )
+    if end is not None:
+        sessions = sessions.filter(scheduled_date__lt=end)
+    return sessions
+
+
+def _materialize_range(owner, start, end=None):
+    materialize_pending(SessionRecurrence.objects.filter(**_lookups(owner)), start, end)
+
+
+def _finish(owner, assignment_ids, user, description, ip_address):
+    """Estadísticas, caché y auditoría tras un UPDATE masivo (dentro de la transacción)"""
+    rebuild_assignments(assignment_ids)
+    invalidate_assignments_on_commit(ClientAssignment.objects.filter(id__in=assignment_ids))
+    AuditLog.objects.create(
+        user=user,
+        action='other',
+        description=description,
+        ip_address=ip_address,
+        related_object_type='ClientAssignment' if owner.kind == 'assignment' else 'User',
+        related_object_id=owner.id
+    )
+
+
+def _moved_datetime(scheduled_date, days, weekday, at):
+    if days:
+        return scheduled_date + timedelta(days=days)
+    local = timezone.localtime(scheduled_date)
+    day = local.date()
+    if weekday is not None:
+        # Al día indicado de la misma semana o de la siguiente
+        day += timedelta(days=(weekday - day.weekday()) % 7)
+    return timezone.make_aware(datetime.combine(day, at or local.time()))
+
+
+def shift_sessions(owner, user, days=None, weekday=None, at=None, ip_address=None):
+    """
+    Mover las sesiones futuras del alcance N días, o a otro día de la semana y/u hora.
+
+    Las sesiones movidas no pueden chocar con otras del empleado ni entre sí:
+    si alguna choca (o quedaría en el pasado) no se mueve ninguna y se lanza
+    ValueError. Retorna la cantidad de sesiones movidas.
+    """
+    if not days and weekday is None and at is None:
+        raise ValueError('Indique días, día de la semana u hora')
+    if days and (weekday is not None or at is not None):
+        raise ValueError('Indique días o día de la semana y hora, no ambos')
+    if weekday is not None and weekday not in range(7):
+        raise ValueError('Día de la semana inválido (0 = lunes ... 6 = domingo)')
+    now = timezone.now()
+    with transaction.atomic():
+        employee_ids = set(ClientAssignment.objects.filter(
+            **owner.assignment_filter
+        ).values_list('employee_id', flat=True))
+        lock_employees(employee_ids)
+        _materialize_range(owner, now)
+
+        rows = list(_active_sessions(owner, now).values_list(
+            'id', 'assignment_id', 'assignment__employee_id', 'scheduled_date', 'duration_minutes'
+        ))
+        if not rows:
+            return 0
+        moved = {
+            session_id: _moved_datetime(scheduled_date, days, weekday, at)
+            for session_id, _, _, scheduled_date, _ in rows
+        }
+        if min(moved.values()) < now:
+            raise ValueError('Las sesiones no se pueden mover al pasado')
+
+        calendars = employee_calendars(employee_ids, min(moved.values()), exclude_session_ids=list(moved))
+        for session_id, _, employee_id, _, duration_minutes in sorted(rows, key=lambda row: moved[row[0]]):
+            start, end = session_interval(moved[session_id], duration_minutes)
+            busy = calendars[employee_id].conflict(start, end)
+            if busy is not None:
+                local = timezone.localtime(start)
+                raise ValueError(f'La sesión del {local.strftime("%Y-%m-%d %H:%M")} chocaría con otra del empleado')
+            calendars[employee_id].add(start, end)
+
+        if days:
+            new_date = F('scheduled_date') + timedelta(days=days)
+            summary = f'{days:+d} días'
+        else:
+            new_date = Case(
+                *[When(id=session_id, then=Value(scheduled_date)) for session_id, scheduled_date in moved.items()],
+                output_field=DateTimeField()
+            )
+            summary = ' '.join(filter(None, [
+                WEEKDAY_NAMES[weekday] if weekday is not None else '',
+                at.strftime('%H:%M') if at else ''
+            ]))
+        count = Session.objects.filter(id__in=moved).update(scheduled_date=new_date, updated_at=now)
+        _finish(
+            owner, {row[1] for row in rows}, user,
+            f'Sesiones reprogramadas ({owner.kind} #{owner.id}): {count} movidas a {summary}', ip_address
+        )
+    return count
+
+
+def cancel_sessions(owner, user, start_date, end_date, ip_address=None):
+    """Cancelar las sesiones programadas del alcance entre dos fechas (ambas incluidas)"""
+    if end_date < start_date:
+        raise ValueError('La fecha final es anterior a la inicial')
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    with transaction.atomic():
+        _materialize_range(owner, start, end)
+        sessions = _active_sessions(owner, start, end)
+        assignment_ids = set(sessions.values_list('assignment_id', flat=True).distinct())
+        count = sessions.update(status='cancelled', updated_at=timezone.now())
+        if count:
+            _finish(
+                owner, assignment_ids, user,
+                f'Sesiones canceladas ({owner.kind} #{owner.id}): {count} entre {start_date} y {end_date}',
+                ip_address
+            )
+    return count
+
+
+def set_sessions_status(owner, user, session_ids, status, ip_address=None):
+    """Asignar un estado a una lista de sesiones del alcance (las demás se ignoran)"""
+    if status not in BULK_STATUSES:
+        raise ValueError('Estado inválido')
+    with transaction.atomic():
+        sessions = Session.objects.filter(id__in=session_ids, **_lookups(owner)).exclude(status=status)
+        assignment_ids = set(sessions.values_list('assignment_id', flat=True).distinct())
+        count = sessions.update(status=status, updated_at=timezone.now())
+        if count:
+            _finish(
+                owner, assignment_ids, user,
+                f'Sesiones marcadas como {status} ({owner.kind} #{owner.id}): {count}', ip_address
+            )
+    return count
@@ -0,0 +1,191 @@
+"""
+Backend de caché compartido entre procesos sobre un archivo SQLite.
+
+Pensado para despliegues en un solo host con varios workers (gunicorn): todos
+los procesos ven las mismas entradas, así la invalidación del catálogo y los
+contadores de django-ratelimit son comunes a todos. No requiere dependencias
+externas. add e incr son atómicos entre procesos (BEGIN IMMEDIATE toma el
+bloqueo de escritura antes de leer).
+
+Configuración (ver CACHE_BACKEND en settings.py):
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'servicios.cache_backends.SQLiteCache',
+            'LOCATION': '/ruta/cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+Con varios hosts usar un servidor de caché (memcached).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Escrituras entre cada revisión de MAX_ENTRIES
+CULL_EVERY = 100
+
+_MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # Una conexión heredada de otro proceso (fork de gunicorn) no se reutiliza
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _write(self):
+        """Transacción con el bloqueo de escritura tomado desde el inicio"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._cull()
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _live(self, expires):
+        return expires is None or expires > time.time()
+
+    def _prepare(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._prepare(key, version)
+        with self._write() as connection:
+            row = connection.execute('SELECT expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and self._live(row[0]):
+                return False
+            connection.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+                (key, self._dumps(value), self.get_backend_timeout(timeout))
+            )
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self._prepare(key, version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not self._live(row[1]):
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        prepared = {self._prepare(key, version): key for key in keys}
+        if not prepared:
+            return {}
+        placeholders = ','.join('?' * len(prepared))
+        rows = self._connection().execute(
+            f'SELECT key, value, expires FROM cache_entries WHERE key IN ({placeholders})',
+            list(prepared)
+        ).fetchall()
+        return {
+            prepared[key]: pickle.loads(value)
+            for key, value, expires in rows
+            if self._live(expires)
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._prepare(key, version), self._dumps(value), expires) for key, value in data.items()]
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)', rows
+            )
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._prepare(key, version)
+        with self._write() as connection:
+            row = connection.execute('SELECT expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is None or not self._live(row[0]):
+                return False
+            connection.execute(
+                'UPDATE cache_entries SET expires = ? WHERE key = ?', (self.get_backend_timeout(timeout), key)
+            )
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._prepare(key, version)
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or not self._live(row[1]):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache_entries SET value = ? WHERE key = ?', (self._dumps(value), key))
+            return value
+
+    def delete(self, key, version=None):
+        key = self._prepare(key, version)
+        with self._write() as connection:
+            return connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [(self._prepare(key, version),) for key in keys]
+        with self._write() as connection:
+            connection.executemany('DELETE FROM cache_entries WHERE key = ?', keys)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache_entries')
+
+    def _cull(self):
+        """Borrar las entradas vencidas y, si aún sobran, las que vencen antes"""
+        connection = self._connection()
+        connection.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            # Las que no vencen (expires NULL) van al final
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency if self._cull_frequency else count,)
+            )
+
+    def close(self, **kwargs):
+        # La conexión se reutiliza entre peticiones del mismo hilo
+        pass
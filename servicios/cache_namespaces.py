@@ -0,0 +1,168 @@
+"""
+Caché con espacios de nombres versionados.
+
+Cada espacio (catálogo, grupos, un usuario, una asignación) guarda un número
+de versión en la caché y lo incluye en sus claves. Invalidar un espacio es
+incrementar esa versión: las entradas anteriores dejan de leerse y expiran
+solas, sin tocar el resto de la caché (por ejemplo, los contadores de
+django-ratelimit). Las señales de models.py invalidan el catálogo cuando se
+guarda o borra un Service o un Price.
+
+Las claves de estado (state_key) no llevan versión: son contadores que el
+código mantiene por su cuenta (chat_events) y deben sobrevivir a una
+invalidación.
+
+get_or_compute llena la caché con un solo cálculo a la vez (single-flight):
+el primero que no encuentra la clave la calcula y los demás esperan un
+momento o, si hay un valor vencido "blando", lo reciben mientras se refresca
+en segundo plano.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Tiempo de vida por defecto de las entradas versionadas
+DEFAULT_TIMEOUT = 60 * 15
+
+# Single-flight: duración máxima del bloqueo de cálculo y espera de los demás
+FILL_LOCK_TIMEOUT = 30
+FILL_WAIT = 2.0
+FILL_POLL_INTERVAL = 0.05
+
+
+def _store(key, compute, timeout, soft_timeout):
+    value = compute()
+    refresh_at = time.time() + soft_timeout if soft_timeout else None
+    cache.set(key, (value, refresh_at), timeout)
+    return value
+
+
+def _refresh_in_background(key, compute, timeout, soft_timeout, lock_key):
+    def run():
+        try:
+            _store(key, compute, timeout, soft_timeout)
+        except Exception:
+            logger.exception('Error al refrescar la clave de caché %s', key)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, soft_timeout=None):
+    """
+    Valor cacheado de key o compute() si falta, calculado por un solo llamador.
+
+    soft_timeout (segundos, menor que timeout): pasado ese tiempo el valor se
+    sigue sirviendo, pero un llamador lo recalcula en segundo plano. Si otro
+    llamador ya está calculando una clave ausente, se espera hasta FILL_WAIT
+    segundos y, si no aparece, se calcula igualmente.
+    """
+    lock_key = f'{key}:filling'
+    entry = cache.get(key)
+    if entry is not None:
+        value, refresh_at = entry
+        if refresh_at is not None and time.time() >= refresh_at and cache.add(lock_key, 1, FILL_LOCK_TIMEOUT):
+            _refresh_in_background(key, compute, timeout, soft_timeout, lock_key)
+        return value
+
+    if cache.add(lock_key, 1, FILL_LOCK_TIMEOUT):
+        try:
+            return _store(key, compute, timeout, soft_timeout)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.time() + FILL_WAIT
+    while time.time() < deadline:
+        time.sleep(FILL_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return _store(key, compute, timeout, soft_timeout)
+
+
+def _initial_version():
+    # Basada en el reloj: si la versión se pierde (expulsión de la caché) la
+    # nueva nunca coincide con una anterior y no reaparecen datos viejos
+    return int(time.time() * 1000)
+
+
+class CacheNamespace:
+    """Grupo de claves que se invalidan juntas"""
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+
+    @property
+    def version_key(self):
+        return f'ns:{self.name}:version'
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, _initial_version(), None)
+            version = cache.get(self.version_key, 0)
+        return version
+
+    def invalidate(self):
+        """Descartar todas las entradas versionadas del espacio"""
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, _initial_version(), None)
+            return cache.get(self.version_key)
+
+    def key(self, name, version=None):
+        """Clave versionada (version: fijar una versión ya leída en vez de consultarla)"""
+        return f'{self.name}:v{self.version() if version is None else version}:{name}'
+
+    def state_key(self, name):
+        return f'{self.name}:{name}'
+
+    def get(self, name, default=None, version=None):
+        return cache.get(self.key(name, version), default)
+
+    def set(self, name, value, timeout=None, version=None):
+        cache.set(self.key(name, version), value, self.timeout if timeout is None else timeout)
+
+    def delete(self, name):
+        cache.delete(self.key(name))
+
+    def get_or_compute(self, name, compute, timeout=None, soft_timeout=None, version=None):
+        """get_or_compute sobre una clave versionada del espacio"""
+        return get_or_compute(
+            self.key(name, version), compute, self.timeout if timeout is None else timeout, soft_timeout
+        )
+
+
+def versions(namespaces):
+    """Versiones de varios espacios con una sola lectura de la caché"""
+    found = cache.get_many([namespace.version_key for namespace in namespaces])
+    return [
+        found[namespace.version_key] if namespace.version_key in found else namespace.version()
+        for namespace in namespaces
+    ]
+
+
+# Servicios y precios (páginas públicas y dashboard de admin)
+catalog = CacheNamespace('catalog')
+
+# Grupos de usuarios
+groups = CacheNamespace('groups')
+
+
+def user(user_id):
+    """Espacio de un usuario"""
+    return CacheNamespace(f'user:{user_id}')
+
+
+def assignment(assignment_id):
+    """Espacio de una asignación (su conversación de chat, archivos, sesiones)"""
+    return CacheNamespace(f'assignment:{assignment_id}')
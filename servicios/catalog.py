@@ -0,0 +1,152 @@
+"""
+Instantánea del catálogo (servicios y precios) para las páginas públicas.
+
+La instantánea es inmutable y se comparte entre hilos: se arma con dos
+consultas y se reutiliza mientras no cambie la versión del espacio de caché
+del catálogo (las señales de Service y Price la incrementan). El HTML de las
+páginas públicas para visitantes anónimos se guarda en ese mismo espacio, así
+que una edición del catálogo descarta también las páginas renderizadas.
+"""
+import threading
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from .cache_namespaces import catalog
+
+# Las páginas se descartan al cambiar la versión; el vencimiento es un respaldo
+# para cambios que no disparan señales (QuerySet.update)
+CATALOG_PAGE_TIMEOUT = 60 * 60 * 24
+
+# Planes destacados que se muestran en la página principal
+FEATURED_LIMIT = 3
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    id: int
+    plan: str
+    price: Decimal
+    currency: str
+    description: Optional[str]
+    number_of_sessions: Optional[int]
+    tutoring_sessions: Optional[int]
+    therapy_sessions: Optional[int]
+    is_featured: bool
+    image: Optional[str]
+
+
+@dataclass(frozen=True)
+class ServiceSnapshot:
+    id: int
+    name: str
+    slug: str
+    description: Optional[str]
+    # Todos los planes, del más barato al más caro
+    prices: Tuple[PriceSnapshot, ...]
+    # Hasta FEATURED_LIMIT planes destacados
+    featured: Tuple[PriceSnapshot, ...]
+    # Destacados o, si no hay, los primeros planes creados
+    preview: Tuple[PriceSnapshot, ...]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    services: MappingProxyType
+
+    def service(self, slug):
+        return self.services.get(slug)
+
+    def prices(self, slug):
+        service = self.services.get(slug)
+        return service.prices if service else ()
+
+    def featured(self, slug):
+        service = self.services.get(slug)
+        return service.featured if service else ()
+
+    def preview(self, slug):
+        service = self.services.get(slug)
+        return service.preview if service else ()
+
+
+def build_snapshot(version):
+    """Leer servicios y precios (dos consultas) y armar la instantánea"""
+    from .models import Price, Service
+
+    prices_by_service = {}
+    for price in Price.objects.order_by('id'):
+        prices_by_service.setdefault(price.service_id, []).append(PriceSnapshot(
+            id=price.id,
+            plan=price.plan,
+            price=price.price,
+            currency=price.currency,
+            description=price.description,
+            number_of_sessions=price.number_of_sessions,
+            tutoring_sessions=price.tutoring_sessions,
+            therapy_sessions=price.therapy_sessions,
+            is_featured=price.is_featured,
+            image=price.image,
+        ))
+
+    services = {}
+    for service in Service.objects.all():
+        prices = prices_by_service.get(service.id, [])
+        featured = tuple(price for price in prices if price.is_featured)[:FEATURED_LIMIT]
+        services[service.slug] = ServiceSnapshot(
+            id=service.id,
+            name=service.name,
+            slug=service.slug,
+            description=service.description,
+            prices=tuple(sorted(prices, key=lambda price: price.price)),
+            featured=featured,
+            preview=featured or tuple(prices[:FEATURED_LIMIT]),
+        )
+    return CatalogSnapshot(version=version, services=MappingProxyType(services))
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Instantánea vigente (se reconstruye solo si cambió la versión del catálogo)"""
+    global _snapshot
+    version = catalog.version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = build_snapshot(version)
+        return _snapshot
+
+
+def render_catalog_page(request, template_name, build_context):
+    """
+    Renderizar una página pública del catálogo.
+
+    build_context recibe la instantánea y retorna el contexto. Para visitantes
+    anónimos el HTML se sirve desde la caché del catálogo; los usuarios con
+    sesión ven su menú, así que se renderiza en cada petición (sin consultar
+    el catálogo en la base de datos).
+    """
+    if request.user.is_authenticated:
+        return render(request, template_name, build_context(get_snapshot()))
+
+    # La página se guarda bajo la versión de la instantánea con que se renderizó;
+    # tras una edición del catálogo solo una petición la vuelve a renderizar
+    snapshot = get_snapshot()
+    html = catalog.get_or_compute(
+        f'page:{template_name}',
+        lambda: render_to_string(template_name, build_context(snapshot), request=request),
+        CATALOG_PAGE_TIMEOUT,
+        version=snapshot.version,
+    )
+    return HttpResponse(html)
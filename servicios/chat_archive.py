@@ -0,0 +1,169 @@
+"""
+Archivo frío del chat.
+
+Los mensajes antiguos que ambos participantes ya leyeron se mueven de
+chat_messages a segmentos comprimidos por asignación (ChatArchiveSegment),
+así las consultas del día a día solo recorren datos recientes. El comando
+archive_chat_messages hace el traslado; get_chat_messages y la búsqueda leen
+los segmentos cuando el cursor pasa más allá de la tabla caliente.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SEGMENT_SIZE = 500
+
+
+def compress_messages(messages):
+    """Serializar y comprimir una lista de ChatMessage"""
+    payload = [
+        {
+            'id': msg.id,
+            'sender_id': msg.sender_id,
+            'message': msg.message,
+            'created_at': msg.created_at.isoformat(),
+        }
+        for msg in messages
+    ]
+    return zlib.compress(json.dumps(payload).encode('utf-8'))
+
+
+def decompress_messages(segment):
+    """Mensajes de un segmento como instancias de ChatMessage sin guardar (orden por id)"""
+    from .models import ChatMessage
+
+    return [
+        ChatMessage(
+            id=item['id'],
+            assignment_id=segment.assignment_id,
+            sender_id=item['sender_id'],
+            message=item['message'],
+            created_at=parse_datetime(item['created_at']),
+        )
+        for item in json.loads(zlib.decompress(bytes(segment.payload)).decode('utf-8'))
+    ]
+
+
+def archive_assignment(assignment_id, older_than, segment_size=SEGMENT_SIZE):
+    """
+    Archivar los mensajes de una asignación anteriores a older_than.
+
+    Solo se archivan mensajes leídos por ambos participantes, para que los
+    contadores de no leídos sigan saliendo de la tabla caliente. Cada segmento
+    se escribe y se borra de chat_messages en la misma transacción. Retorna
+    la cantidad de mensajes archivados.
+    """
+    from .models import ChatArchiveSegment, ChatConversation, ChatMessage
+
+    summary = ChatConversation.objects.filter(assignment_id=assignment_id).first()
+    if summary is None:
+        return 0
+    read_by_both = min(summary.client_last_read_id, summary.employee_last_read_id)
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                ChatMessage.objects.filter(
+                    assignment_id=assignment_id,
+                    id__lte=read_by_both,
+                    created_at__lt=older_than
+                ).order_by('id')[:segment_size]
+            )
+            if not batch:
+                return archived
+            ChatArchiveSegment.objects.create(
+                assignment_id=assignment_id,
+                first_message_id=batch[0].id,
+                last_message_id=batch[-1].id,
+                first_message_at=batch[0].created_at,
+                last_message_at=batch[-1].created_at,
+                message_count=len(batch),
+                payload=compress_messages(batch)
+            )
+            ChatMessage.objects.filter(id__in=[msg.id for msg in batch]).delete()
+        archived += len(batch)
+
+
+def archive_older_than(days, segment_size=SEGMENT_SIZE):
+    """Archivar en todas las asignaciones los mensajes con más de days días"""
+    from .models import ChatMessage
+
+    older_than = timezone.now() - timedelta(days=days)
+    assignment_ids = ChatMessage.objects.filter(
+        created_at__lt=older_than
+    ).values_list('assignment_id', flat=True).distinct()
+
+    archived = 0
+    for assignment_id in list(assignment_ids):
+        archived += archive_assignment(assignment_id, older_than, segment_size)
+    return archived
+
+
+def load_archived_page(assignment, before_id, limit):
+    """
+    Hasta limit mensajes archivados con id < before_id, en orden ascendente.
+
+    Recorre los segmentos del más nuevo al más antiguo y se detiene en cuanto
+    junta suficientes mensajes.
+    """
+    from .models import ChatArchiveSegment
+
+    segments = ChatArchiveSegment.objects.filter(assignment_id=assignment.id)
+    if before_id is not None:
+        segments = segments.filter(first_message_id__lt=before_id)
+
+    page = []
+    for segment in segments.order_by('-last_message_id').iterator():
+        messages = [
+            msg for msg in decompress_messages(segment)
+            if before_id is None or msg.id < before_id
+        ]
+        page = messages + page
+        if len(page) >= limit:
+            break
+    page = page[-limit:] if limit else []
+    _attach_senders(page, assignment)
+    return page
+
+
+def get_archived_messages(references):
+    """
+    Recuperar mensajes archivados por id.
+
+    references: lista de (assignment_id, message_id). Retorna {message_id: ChatMessage}.
+    """
+    from .models import ChatArchiveSegment
+
+    if not references:
+        return {}
+    condition = Q()
+    for assignment_id, message_id in references:
+        condition |= Q(assignment_id=assignment_id, first_message_id__lte=message_id, last_message_id__gte=message_id)
+
+    wanted = {message_id for _, message_id in references}
+    found = {}
+    for segment in ChatArchiveSegment.objects.filter(condition):
+        for msg in decompress_messages(segment):
+            if msg.id in wanted:
+                found[msg.id] = msg
+    _attach_senders(found.values())
+    return found
+
+
+def _attach_senders(messages, assignment=None):
+    """Asignar el remitente a mensajes archivados (los participantes sin consultar)"""
+    users = {}
+    if assignment is not None:
+        users = {assignment.client_id: assignment.client, assignment.employee_id: assignment.employee}
+    missing = {msg.sender_id for msg in messages} - set(users)
+    if missing:
+        users.update(User.objects.in_bulk(missing))
+    for msg in messages:
+        msg.sender = users.get(msg.sender_id)
@@ -0,0 +1,272 @@
+"""
+Publicación de eventos de chat en tiempo real (nuevos mensajes y no leídos).
+
+Las vistas publican eventos por usuario y el stream SSE servido por la
+aplicación ASGI (ver chat_stream.py) los entrega a cada pestaña abierta.
+El broker es configurable con CHAT_PUBSUB_BACKEND: cualquier clase con
+subscribe, unsubscribe, has_subscribers y publish.
+
+Para el long-polling se mantienen además contadores de cambios en la caché
+(claves de estado de los espacios por asignación y por usuario, ver
+cache_namespaces), que las vistas consultan sin tocar la base de datos
+mientras esperan.
+
+El total de no leídos de cada usuario (el badge) también vive en la caché:
+se incrementa al enviar, se decrementa al leer y el comando
+reconcile_chat_unread corrige cualquier desvío.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import cache_namespaces
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Cola de eventos de una conexión abierta, ligada a su event loop"""
+
+    def __init__(self, user_id, loop, max_pending=100):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, event):
+        """Entregar un evento desde cualquier hilo"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente lento: descartar, el polling de respaldo lo pondrá al día
+            logger.warning('Cola de eventos de chat llena para el usuario %s', self.user_id)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """
+    Broker en memoria del proceso.
+
+    Sirve cuando las vistas y el stream corren en el mismo proceso ASGI. Con
+    varios procesos, configurar un broker compartido en CHAT_PUBSUB_BACKEND.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, loop):
+        subscription = Subscription(user_id, loop)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return user_id in self._subscriptions
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # El event loop de la conexión ya se cerró
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Instancia única del broker configurado"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'CHAT_PUBSUB_BACKEND', 'servicios.chat_events.InProcessBroker')
+                _broker = import_string(backend)()
+    return _broker
+
+
+def _assignment_version_key(assignment_id):
+    return cache_namespaces.assignment(assignment_id).state_key('chat_version')
+
+
+def _user_version_key(user_id):
+    return cache_namespaces.user(user_id).state_key('chat_version')
+
+
+def _user_unread_key(user_id):
+    return cache_namespaces.user(user_id).state_key('chat_unread')
+
+
+def _user_activity_key(user_id):
+    return cache_namespaces.user(user_id).state_key('chat_last_activity')
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # La clave no existe (o expiró): empezar de nuevo
+        cache.add(key, 1, None)
+        return cache.get(key)
+
+
+def get_assignment_version(assignment_id):
+    """Contador de cambios de la conversación"""
+    return cache.get(_assignment_version_key(assignment_id), 0)
+
+
+def get_user_version(user_id):
+    """Contador de cambios en los no leídos del usuario"""
+    return cache.get(_user_version_key(user_id), 0)
+
+
+def bump_assignment_version(assignment_id):
+    return _bump(_assignment_version_key(assignment_id))
+
+
+def bump_user_version(user_id):
+    return _bump(_user_version_key(user_id))
+
+
+def adjust_unread_count(user_id, delta):
+    """Sumar delta al total de no leídos cacheado del usuario"""
+    if not delta:
+        return
+    try:
+        cache.incr(_user_unread_key(user_id), delta)
+    except ValueError:
+        # No está en caché: se calculará en la próxima lectura
+        pass
+
+
+def get_unread_state(user):
+    """
+    Total de no leídos, última actividad y contador de cambios del usuario.
+
+    Una sola lectura de la caché; solo se consulta la base de datos si el
+    total no está cacheado.
+    """
+    from .models import ChatConversation
+
+    unread_key, activity_key = _user_unread_key(user.id), _user_activity_key(user.id)
+    values = cache.get_many([unread_key, activity_key, _user_version_key(user.id)])
+    unread_count = values.get(unread_key)
+    last_activity = values.get(activity_key)
+    if unread_count is None:
+        unread_count, last_activity = ChatConversation.unread_state_for(user)
+        cache.add(unread_key, unread_count, None)
+        cache.set(activity_key, last_activity, None)
+    return max(unread_count, 0), last_activity, values.get(_user_version_key(user.id), 0)
+
+
+def set_unread_totals(totals):
+    """Reemplazar los totales cacheados (reconciliación): {user_id: unread_count}"""
+    cache.set_many({_user_unread_key(user_id): count for user_id, count in totals.items()}, None)
+
+
+def wait_for_change(get_version, initial_version, timeout):
+    """
+    Esperar hasta que el contador cambie o venza el timeout (long-polling).
+
+    Solo consulta la caché; retorna True si hubo un cambio.
+    """
+    interval = getattr(settings, 'CHAT_LONG_POLL_INTERVAL', 0.5)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if get_version() != initial_version:
+            return True
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+    return get_version() != initial_version
+
+
+def suggest_poll_interval(last_activity, minimum=3000):
+    """
+    Intervalo sugerido (ms) para el próximo poll según la última actividad.
+
+    Las conversaciones inactivas se consultan con menos frecuencia.
+    """
+    if last_activity is None:
+        interval = 30000
+    else:
+        idle = (timezone.now() - last_activity).total_seconds()
+        if idle < 120:
+            interval = 3000
+        elif idle < 30 * 60:
+            interval = 10000
+        else:
+            interval = 30000
+    return max(interval, minimum)
+
+
+def publish_unread_count(user):
+    """Notificar un cambio en los no leídos del usuario (contador y stream)"""
+    bump_user_version(user.id)
+
+    broker = get_broker()
+    if not broker.has_subscribers(user.id):
+        # Evitar la consulta si nadie está escuchando
+        return
+    broker.publish(user.id, {
+        'type': 'unread',
+        'unread_count': get_unread_state(user)[0],
+    })
+
+
+def publish_message(message):
+    """
+    Notificar un mensaje nuevo a los dos participantes de la asignación.
+
+    Llamar tras el commit: también actualiza el total cacheado del destinatario.
+    """
+    assignment = message.assignment
+    bump_assignment_version(assignment.id)
+    sender = message.sender
+    payload = {
+        'id': message.id,
+        'sender_id': sender.id,
+        'sender_name': sender.get_full_name() or sender.username,
+        'message': message.message,
+        'created_at': message.created_at.strftime('%d/%m/%Y %H:%M'),
+    }
+
+    broker = get_broker()
+    for participant in (assignment.client, assignment.employee):
+        if not broker.has_subscribers(participant.id):
+            continue
+        broker.publish(participant.id, {
+            'type': 'message',
+            'assignment_id': assignment.id,
+            'message': {**payload, 'is_mine': participant.id == sender.id},
+        })
+
+    recipient = assignment.employee if sender.id == assignment.client_id else assignment.client
+    adjust_unread_count(recipient.id, 1)
+    cache.set_many({
+        _user_activity_key(assignment.client_id): message.created_at,
+        _user_activity_key(assignment.employee_id): message.created_at,
+    }, None)
+    publish_unread_count(recipient)
@@ -0,0 +1,139 @@
+"""
+Stream de eventos de chat (Server-Sent Events) servido por la aplicación ASGI.
+
+Se monta en ImpulsaMente_project/asgi.py, delante de la aplicación Django. Con
+un despliegue WSGI la ruta no existe y chat.js sigue usando el polling.
+
+Cada acceso a la base de datos corre en un hilo y cierra su conexión al
+terminar, como una petición de Django: un stream abierto durante horas no
+retiene una conexión. El broker por defecto (InProcessBroker) solo entrega los
+eventos publicados en el mismo proceso; con varios workers hace falta un
+broker compartido en CHAT_PUBSUB_BACKEND.
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .chat_events import get_broker, get_unread_state
+
+STREAM_PATH = '/api/chat/stream/'
+
+
+class _SessionRequest:
+    """Petición mínima para resolver el usuario con django.contrib.auth.get_user"""
+
+    def __init__(self, session):
+        self.session = session
+
+
+def _get_user(session_key):
+    """Resolver el usuario autenticado de la cookie de sesión"""
+    from django.contrib.auth import get_user
+
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(_SessionRequest(engine.SessionStore(session_key)))
+    return user if user.is_authenticated else None
+
+
+def _session_key_from_scope(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie = SimpleCookie()
+            cookie.load(value.decode('latin-1'))
+            morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+            return morsel.value if morsel else None
+    return None
+
+
+def _database_call(func):
+    """func como corrutina, cerrando las conexiones viejas antes y después"""
+
+    def call(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call)
+
+
+def _format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+
+
+async def chat_event_stream(scope, receive, send):
+    """Aplicación ASGI que entrega los eventos de chat del usuario autenticado"""
+    user = await _database_call(_get_user)(_session_key_from_scope(scope))
+    if user is None:
+        await send({'type': 'http.response.start', 'status': 403,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': 'No autenticado'.encode('utf-8')})
+        return
+
+    broker = get_broker()
+    subscription = broker.subscribe(user.id, asyncio.get_running_loop())
+    heartbeat = getattr(settings, 'CHAT_STREAM_HEARTBEAT', 15)
+
+    async def wait_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    # Esperar a la vez el próximo evento y la desconexión del cliente
+    disconnect = asyncio.ensure_future(wait_disconnect())
+    next_event = None
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+
+        unread_count = (await _database_call(get_unread_state)(user))[0]
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': _format_event({'type': 'unread', 'unread_count': unread_count})})
+
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnect}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                break
+            if next_event in done:
+                body = _format_event(next_event.result())
+                next_event = None
+            else:
+                body = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnect.cancel()
+        if next_event is not None:
+            next_event.cancel()
+        broker.unsubscribe(subscription)
+
+
+def with_chat_stream(django_application):
+    """Envolver la aplicación Django para atender el stream de chat en STREAM_PATH"""
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            await chat_event_stream(scope, receive, send)
+        else:
+            await django_application(scope, receive, send)
+
+    return application
@@ -1,77 +1,76 @@
 """
 Vistas para el sistema de chat interno
 """
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
+from django.db import transaction
 from django.db.models import Q, Count, Max
-from .models import ChatMessage, ClientAssignment, FileUpload
+from .models import ChatMessage, ChatConversation, ClientAssignment, FileUpload
+from .search import search, make_snippet
+from .chat_archive import load_archived_page, get_archived_messages
+from .conditional import conditional_json, chat_conversations_etag
+from .chat_events import (
+    publish_message, publish_unread_count, adjust_unread_count, get_unread_state,
+    get_assignment_version, get_user_version, wait_for_change, suggest_poll_interval
+)
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import os
 
+# Tamaño de página del historial de chat
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 20
+
 
 @login_required
+@conditional_json(chat_conversations_etag)
 def get_chat_conversations(request):
     """Obtener lista de conversaciones del usuario (empleado o cliente)"""
     try:
         user = request.user
         
-        # Verificar si es empleado o cliente
-        employee_assignments = ClientAssignment.objects.filter(
+        # Una sola consulta: asignaciones activas junto a su resumen de chat
+        employee_assignments = list(ClientAssignment.objects.filter(
             employee=user, 
             is_active=True
-        ).select_related('client', 'service')
-        
-        client_assignments = ClientAssignment.objects.filter(
-            client=user,
-            is_active=True
-        ).select_related('employee', 'service')
+        ).select_related('client', 'service', 'chat_summary'))
         
         conversations = []
         
         # Si es empleado, listar sus clientes
-        if employee_assignments.exists():
+        if employee_assignments:
             for assignment in employee_assignments:
-                unread_count = ChatMessage.objects.filter(
-                    assignment=assignment,
-                    is_read=False
-                ).exclude(sender=user).count()
-                
-                last_message = ChatMessage.objects.filter(
-                    assignment=assignment
-                ).order_by('-created_at').first()
-                
+                summary = _get_summary(assignment)
                 conversations.append({
                     'assignment_id': assignment.id,
                     'client_id': assignment.client.id,
                     'client_name': assignment.client.get_full_name() or assignment.client.username,
                     'service_name': assignment.service.name,
-                    'unread_count': unread_count,
-                    'last_message': last_message.message[:50] if last_message else '',
-                    'last_message_time': last_message.created_at.strftime('%d/%m/%Y %H:%M') if last_message else ''
+                    'unread_count': summary.employee_unread_count if summary else 0,
+                    'last_message': summary.last_message_preview if summary else '',
+                    'last_message_time': _format_summary_time(summary)
                 })
         
         # Si es cliente, listar sus empleados
-        elif client_assignments.exists():
+        else:
+            client_assignments = ClientAssignment.objects.filter(
+                client=user,
+                is_active=True
+            ).select_related('employee', 'service', 'chat_summary')
+            
             for assignment in client_assignments:
-                unread_count = ChatMessage.objects.filter(
-                    assignment=assignment,
-                    is_read=False
-                ).exclude(sender=user).count()
-                
-                last_message = ChatMessage.objects.filter(
-                    assignment=assignment
-                ).order_by('-created_at').first()
-                
+                summary = _get_summary(assignment)
                 conversations.append({
                     'assignment_id': assignment.id,
                     'employee_id': assignment.employee.id,
                     'employee_name': assignment.employee.get_full_name() or assignment.employee.username,
                     'service_name': assignment.service.name,
-                    'unread_count': unread_count,
-                    'last_message': last_message.message[:50] if last_message else '',
-                    'last_message_time': last_message.created_at.strftime('%d/%m/%Y %H:%M') if last_message else ''
+                    'unread_count': summary.client_unread_count if summary else 0,
+                    'last_message': summary.last_message_preview if summary else '',
+                    'last_message_time': _format_summary_time(summary)
                 })
         
         return JsonResponse({
@@ -86,11 +85,48 @@ def get_chat_conversations(request):
         }, status=500)
 
 
+def _get_summary(assignment):
+    """Resumen de chat de la asignación (None si aún no hay mensajes)"""
+    try:
+        return assignment.chat_summary
+    except ChatConversation.DoesNotExist:
+        return None
+
+
+def _format_summary_time(summary):
+    """Formatear la hora del último mensaje del resumen"""
+    if summary is None or summary.last_message_at is None:
+        return ''
+    return summary.last_message_at.strftime('%d/%m/%Y %H:%M')
+
+
 @login_required
 def get_chat_messages(request, assignment_id):
-    """Obtener mensajes de una conversación específica"""
+    """
+    Obtener mensajes de una conversación específica, paginados por cursor.
+    
+    - since_id: solo mensajes más nuevos que el cursor (polling)
+    - before_id: página de mensajes anteriores al cursor (historial)
+    - sin cursor: la página más reciente
+    - wait: con since_id, esperar hasta N segundos a que llegue un mensaje (long-polling)
+    """
     try:
-        assignment = get_object_or_404(ClientAssignment, id=assignment_id)
+        try:
+            since_id, before_id, limit = _parse_message_cursor(request)
+            wait = _parse_wait(request)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Parámetros de paginación inválidos'
+            }, status=400)
+        
+        # Leer el contador antes de consultar para no perder cambios intermedios
+        initial_version = get_assignment_version(assignment_id) if wait else None
+        
+        assignment = get_object_or_404(
+            ClientAssignment.objects.select_related('client', 'employee', 'service', 'chat_summary'),
+            id=assignment_id
+        )
         
         # Verificar que el usuario tiene acceso a esta conversación
         if request.user != assignment.client and request.user != assignment.employee:
@@ -99,28 +135,60 @@ def get_chat_messages(request, assignment_id):
                 'error': 'No tienes permiso para ver esta conversación'
             }, status=403)
         
-        # Obtener mensajes
+        summary = _get_summary(assignment)
+        
+        # Long-polling: sin mensajes nuevos, esperar cambios en la caché
+        if wait and since_id is not None:
+            last_message_id = summary.last_message_id if summary else None
+            if not last_message_id or last_message_id <= since_id:
+                wait_for_change(lambda: get_assignment_version(assignment.id), initial_version, wait)
+        
+        # Obtener mensajes por cursor (índice assignment + id)
         messages = ChatMessage.objects.filter(
             assignment=assignment
-        ).select_related('sender').order_by('created_at')
+        ).select_related('sender')
+        
+        if since_id is not None:
+            # Polling: solo mensajes más nuevos que el cursor
+            page = list(messages.filter(id__gt=since_id).order_by('id')[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+        else:
+            # Historial: página más reciente o anterior a before_id
+            if before_id is not None:
+                messages = messages.filter(id__lt=before_id)
+            page = list(messages.order_by('-id')[:limit + 1])
+            if len(page) <= limit:
+                # Fin de la tabla caliente: seguir en los segmentos archivados
+                archive_before_id = page[-1].id if page else before_id
+                page.extend(reversed(load_archived_page(assignment, archive_before_id, limit + 1 - len(page))))
+            has_more = len(page) > limit
+            page = page[:limit]
+            page.reverse()
+        
+        # Estado de lectura según las marcas de cada participante
+        my_last_read_id = summary.last_read_id_for(request.user) if summary else 0
+        other_last_read_id = summary.other_last_read_id_for(request.user) if summary else 0
         
         messages_data = []
-        for msg in messages:
+        for msg in page:
+            is_mine = msg.sender_id == request.user.id
             messages_data.append({
                 'id': msg.id,
                 'sender_id': msg.sender.id,
                 'sender_name': msg.sender.get_full_name() or msg.sender.username,
                 'message': msg.message,
-                'is_read': msg.is_read,
+                'is_read': msg.id <= (other_last_read_id if is_mine else my_last_read_id),
                 'created_at': msg.created_at.strftime('%d/%m/%Y %H:%M'),
-                'is_mine': msg.sender == request.user
+                'is_mine': is_mine
             })
         
-        # Marcar mensajes como leídos
-        ChatMessage.objects.filter(
-            assignment=assignment,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
+        # Marcar como leído hasta el mensaje más nuevo entregado
+        if page and before_id is None and page[-1].id > my_last_read_id:
+            read_count = ChatConversation.mark_read(assignment, request.user, page[-1].id)
+            if read_count:
+                adjust_unread_count(request.user.id, -read_count)
+                publish_unread_count(request.user)
         
         # Información del interlocutor
         other_user = assignment.employee if request.user == assignment.client else assignment.client
@@ -132,7 +200,14 @@ def get_chat_messages(request, assignment_id):
                 'id': other_user.id,
                 'name': other_user.get_full_name() or other_user.username
             },
-            'service_name': assignment.service.name
+            'service_name': assignment.service.name,
+            'has_more': has_more,
+            'oldest_id': page[0].id if page else None,
+            'newest_id': page[-1].id if page else None,
+            # Tras un long-poll se puede volver a consultar de inmediato
+            'poll_interval': 0 if wait and since_id is not None else suggest_poll_interval(
+                page[-1].created_at if page else (summary.last_message_at if summary else None)
+            )
         })
         
     except Exception as e:
@@ -142,12 +217,49 @@ def get_chat_messages(request, assignment_id):
         }, status=500)
 
 
+def _parse_message_cursor(request):
+    """
+    Leer los parámetros de paginación por cursor de la petición.
+    
+    Returns:
+        tuple: (since_id, before_id, limit). Lanza ValueError si son inválidos.
+    """
+    since_id = request.GET.get('since_id')
+    before_id = request.GET.get('before_id')
+    limit = request.GET.get('limit')
+    
+    since_id = int(since_id) if since_id not in (None, '') else None
+    before_id = int(before_id) if before_id not in (None, '') else None
+    limit = int(limit) if limit not in (None, '') else CHAT_PAGE_SIZE
+    
+    if since_id is not None and before_id is not None:
+        raise ValueError('since_id y before_id son excluyentes')
+    if limit < 1:
+        raise ValueError('limit debe ser positivo')
+    
+    return since_id, before_id, min(limit, CHAT_MAX_PAGE_SIZE)
+
+
+def _parse_wait(request):
+    """Segundos de espera pedidos para long-polling, limitados por CHAT_LONG_POLL_TIMEOUT"""
+    wait = request.GET.get('wait')
+    if wait in (None, ''):
+        return 0
+    wait = int(wait)
+    if wait < 0:
+        raise ValueError('wait no puede ser negativo')
+    return min(wait, settings.CHAT_LONG_POLL_TIMEOUT)
+
+
 @login_required
 @require_http_methods(["POST"])
 def send_chat_message(request, assignment_id):
     """Enviar un mensaje de chat"""
     try:
-        assignment = get_object_or_404(ClientAssignment, id=assignment_id)
+        assignment = get_object_or_404(
+            ClientAssignment.objects.select_related('client', 'employee'),
+            id=assignment_id
+        )
         
         # Verificar permisos
         if request.user != assignment.client and request.user != assignment.employee:
@@ -166,12 +278,15 @@ def send_chat_message(request, assignment_id):
                 'error': 'El mensaje no puede estar vacío'
             }, status=400)
         
-        # Crear mensaje
-        message = ChatMessage.objects.create(
-            assignment=assignment,
-            sender=request.user,
-            message=message_text
-        )
+        # Crear mensaje y actualizar el resumen de la conversación
+        with transaction.atomic():
+            message = ChatMessage.objects.create(
+                assignment=assignment,
+                sender=request.user,
+                message=message_text
+            )
+            ChatConversation.register_message(message)
+            transaction.on_commit(lambda: publish_message(message))
         
         return JsonResponse({
             'success': True,
@@ -194,16 +309,110 @@ def send_chat_message(request, assignment_id):
 
 @login_required
 def get_unread_messages_count(request):
-    """Obtener contador de mensajes no leídos"""
+    """
+    Obtener contador de mensajes no leídos.
+    
+    Con wait y since_version espera hasta N segundos a que el contador cambie (long-polling).
+    """
     try:
-        unread_count = ChatMessage.objects.filter(
-            Q(assignment__client=request.user) | Q(assignment__employee=request.user),
-            is_read=False
-        ).exclude(sender=request.user).count()
+        try:
+            wait = _parse_wait(request)
+            since_version = request.GET.get('since_version')
+            since_version = int(since_version) if since_version not in (None, '') else None
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Parámetros inválidos'
+            }, status=400)
+        
+        user_id = request.user.id
+        if wait and since_version is not None:
+            wait_for_change(lambda: get_user_version(user_id), since_version, wait)
+        
+        unread_count, last_activity, version = get_unread_state(request.user)
+        
+        return JsonResponse({
+            'success': True,
+            'unread_count': unread_count,
+            'version': version,
+            'poll_interval': 0 if wait else suggest_poll_interval(last_activity, minimum=10000)
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+
+@login_required
+def search_chat(request):
+    """
+    Buscar en los mensajes y archivos de las asignaciones del usuario.
+    
+    Parámetros: q (texto), page, page_size y assignment_id (opcional).
+    Resultados ordenados por relevancia, con un fragmento del texto.
+    """
+    try:
+        query = request.GET.get('q', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+            page_size = min(max(int(request.GET.get('page_size', SEARCH_PAGE_SIZE)), 1), CHAT_MAX_PAGE_SIZE)
+            assignment_id = request.GET.get('assignment_id')
+            assignment_id = int(assignment_id) if assignment_id else None
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Parámetros de búsqueda inválidos'
+            }, status=400)
+        
+        hits, total, terms = search(request.user, query, page, page_size, assignment_id)
+        
+        # Cargar solo los documentos de la página
+        message_ids = [hit['message_id'] for hit in hits if hit['message_id']]
+        file_ids = [hit['file_id'] for hit in hits if hit['file_id']]
+        messages = ChatMessage.objects.select_related('sender').in_bulk(message_ids)
+        messages.update(get_archived_messages([
+            (hit['assignment_id'], hit['message_id'])
+            for hit in hits if hit['message_id'] and hit['message_id'] not in messages
+        ]))
+        files = FileUpload.objects.in_bulk(file_ids)
+        
+        results = []
+        for hit in hits:
+            if hit['message_id']:
+                msg = messages.get(hit['message_id'])
+                if msg is None:
+                    continue
+                results.append({
+                    'type': 'message',
+                    'id': msg.id,
+                    'assignment_id': hit['assignment_id'],
+                    'sender_name': msg.sender.get_full_name() or msg.sender.username,
+                    'snippet': make_snippet(msg.message, terms),
+                    'created_at': msg.created_at.strftime('%d/%m/%Y %H:%M'),
+                    'score': round(hit['score'], 3)
+                })
+            else:
+                upload = files.get(hit['file_id'])
+                if upload is None:
+                    continue
+                results.append({
+                    'type': 'file',
+                    'id': upload.id,
+                    'assignment_id': hit['assignment_id'],
+                    'file_name': upload.file_name,
+                    'snippet': make_snippet(upload.description or upload.file_name, terms),
+                    'created_at': upload.uploaded_at.strftime('%d/%m/%Y %H:%M'),
+                    'score': round(hit['score'], 3)
+                })
         
         return JsonResponse({
             'success': True,
-            'unread_count': unread_count
+            'results': results,
+            'total': total,
+            'page': page,
+            'has_next': page * page_size < total
         })
         
     except Exception as e:
@@ -0,0 +1,133 @@
+"""
+GET condicional (ETag) para los endpoints JSON que los dashboards consultan
+una y otra vez.
+
+El ETag de cada endpoint se arma con los contadores de cambios de los espacios
+de caché involucrados (usuarios y asignaciones, ver cache_namespaces), que las
+señales de models.py incrementan al guardar asignaciones, sesiones, archivos,
+usuarios y perfiles. Calcularlo cuesta lecturas de caché y, a lo sumo, una
+consulta pequeña; si coincide con If-None-Match se responde 304 sin ejecutar
+la vista.
+
+Las escrituras masivas que no disparan señales (QuerySet.update, bulk_create)
+deben invalidar los espacios a mano.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import cache_namespaces
+from .chat_events import get_unread_state
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def conditional_json(etag_func):
+    """
+    Responder 304 si el ETag no cambió.
+
+    etag_func(request, *args, **kwargs) retorna el ETag o None para atender
+    la petición sin validar. Las respuestas se marcan private/no-cache: el
+    navegador las guarda, pero las revalida en cada uso.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                # Los errores no se validan: se reintentan completos
+                del response['ETag']
+            elif response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def user_etag(request, *user_ids, extra=()):
+    """ETag de lo que ve request.user a partir de las versiones de los usuarios dados"""
+    namespaces = [cache_namespaces.user(user_id) for user_id in user_ids]
+    return make_etag(request.user.id, *cache_namespaces.versions(namespaces), *extra)
+
+
+def client_details_etag(request, client_id):
+    from .models import ClientAssignment
+    from .recurrence import upcoming_session
+
+    # Solo el cliente, sus empleados o un administrador: a nadie más se le
+    # responde 304 (ni se consulta nada que revele si el cliente existe)
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    if user.id != client_id and not (user.is_superuser or user.is_staff) and not ClientAssignment.objects.filter(
+        client_id=client_id, employee_id=user.id
+    ).exists():
+        return None
+
+    # Próxima cita (fila u ocurrencia pendiente): cambia al pasar su hora
+    # aunque no se edite nada
+    next_session = upcoming_session({'client_id': client_id})
+    next_date = next_session.scheduled_date if next_session else None
+    return user_etag(request, client_id, extra=(timezone.now().date(), next_date))
+
+
+def files_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return user_etag(request, request.user.id, extra=(request.GET.get('client_id', ''),))
+
+
+def assignment_files_etag(request, assignment_id):
+    from .models import ClientAssignment
+
+    participants = ClientAssignment.objects.filter(id=assignment_id).values_list(
+        'client_id', 'employee_id'
+    ).first()
+    # Sin acceso (o inexistente): la vista responde el error
+    if participants is None or (request.user.id not in participants and not request.user.is_superuser):
+        return None
+    namespace = cache_namespaces.assignment(assignment_id)
+    return make_etag(request.user.id, namespace.version())
+
+
+def chat_conversations_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    # Contador de no leídos y último mensaje de cualquiera de sus conversaciones
+    unread_count, last_activity, chat_version = get_unread_state(request.user)
+    return user_etag(request, request.user.id, extra=(unread_count, last_activity, chat_version))
+
+
+def available_employees_etag(request):
+    from django.contrib.auth.models import User
+
+    service_slug = request.GET.get('service', '')
+    group_name = {'tutoria': 'Tutor', 'terapia': 'Psicologo'}.get(service_slug)
+    if group_name is None:
+        return None
+    # Los ids cubren altas y bajas en el grupo; las versiones, su carga de clientes
+    employee_ids = list(User.objects.filter(
+        groups__name=group_name, is_active=True
+    ).order_by('id').values_list('id', flat=True))
+    namespaces = [cache_namespaces.user(employee_id) for employee_id in employee_ids]
+    return make_etag(service_slug, employee_ids, *cache_namespaces.versions(namespaces))
+
+
+def calendar_etag(request):
+    from .session_calendar import parse_owner, parse_window
+
+    try:
+        owner = parse_owner(request.GET)
+        start_date, end_date = parse_window(request.GET)
+    except ValueError:
+        return None
+    if not owner.can_view(request.user):
+        return None
+    return make_etag(owner.kind, owner.id, start_date, end_date, owner.namespace.version())
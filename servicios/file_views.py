@@ -7,6 +7,7 @@ from django.contrib import messages
 from django.http import JsonResponse, FileResponse
 from django.views.decorators.http import require_http_methods
 from .models import FileUpload, ClientAssignment, Session, AuditLog
+from .conditional import conditional_json, files_etag
 
 
 def get_client_ip(request):
@@ -197,6 +198,7 @@ def delete_file(request, file_id):
 
 
 @login_required
+@conditional_json(files_etag)
 def list_files(request):
     """Listar archivos del usuario (cliente o empleado)"""
     try:
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from servicios.chat_archive import SEGMENT_SIZE, archive_older_than
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los mensajes de chat antiguos (leídos por ambos participantes) a segmentos '
+        'comprimidos por asignación. Programar periódicamente (ej. cron diario).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+            help='Antigüedad mínima en días (por defecto CHAT_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument(
+            '--segment-size',
+            type=int,
+            default=SEGMENT_SIZE,
+            help='Mensajes por segmento'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Archivando mensajes con más de {options['days']} días..."))
+        archived = archive_older_than(options['days'], options['segment_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Mensajes archivados: {archived}'))
@@ -0,0 +1,153 @@
+import time
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from servicios.admin_views import clients_with_stats
+from servicios.models import AuditLog, ClientAssignment, FileUpload, Service, Session
+from servicios.session_stats import rebuild_all
+
+USERNAME_PREFIX = 'bench-client-'
+COUNTERS = ('id', 'active_assignments_count', 'total_sessions', 'files_count', 'audit_count')
+
+
+class Rollback(Exception):
+    """Deshacer los datos sembrados al terminar"""
+
+
+def legacy_clients():
+    """Consulta anterior: cuatro COUNT DISTINCT sobre JOINs uno-a-muchos"""
+    return User.objects.filter(groups__name='Cliente').distinct().annotate(
+        active_assignments_count=Count(
+            'client_assignments',
+            filter=Q(client_assignments__is_active=True),
+            distinct=True
+        ),
+        total_sessions=Count('client_assignments__sessions', distinct=True),
+        files_count=Count('client_assignments__files', distinct=True),
+        audit_count=Count('audit_logs', distinct=True)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la lista de clientes del dashboard de admin (subconsultas) con la consulta '
+        'anterior de JOINs, sembrando clientes de prueba por tramos. Los datos se deshacen al '
+        'terminar salvo con --keep.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10000, help='Clientes a sembrar en total')
+        parser.add_argument('--steps', type=int, default=4, help='Tramos en los que se mide')
+        parser.add_argument('--sessions', type=int, default=4, help='Sesiones por cliente')
+        parser.add_argument('--audit', type=int, default=4, help='Registros de auditoría por cliente')
+        parser.add_argument('--files', type=int, default=2, help='Archivos por cliente')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por medición (se toma la mejor)')
+        parser.add_argument('--skip-legacy', action='store_true', help='No medir la consulta anterior')
+        parser.add_argument('--keep', action='store_true', help='Conservar los datos sembrados')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['steps'] < 1:
+            raise CommandError('--clients y --steps deben ser mayores que cero')
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f'Ya existen usuarios "{USERNAME_PREFIX}*" de una ejecución anterior con --keep')
+
+        try:
+            with transaction.atomic():
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS('✓ Datos de prueba eliminados'))
+
+    def run(self, options):
+        total = options['clients']
+        steps = options['steps']
+        client_group, _ = Group.objects.get_or_create(name='Cliente')
+        service, _ = Service.objects.get_or_create(slug='bench', defaults={'name': 'Benchmark'})
+        employee = User.objects.create(username='bench-employee', password='!')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sembrando {total} clientes en {steps} tramos "
+            f"({options['sessions']} sesiones, {options['audit']} auditorías, {options['files']} archivos c/u)"
+        ))
+        self.stdout.write(f"{'clientes':>10} {'subconsultas':>14} {'µs/cliente':>11} {'JOINs':>10} {'µs/cliente':>11}")
+
+        seeded = 0
+        for step in range(1, steps + 1):
+            target = total * step // steps
+            self.seed(seeded, target, client_group, service, employee, options)
+            seeded = target
+            rebuild_all()
+
+            fast = self.measure(clients_with_stats().prefetch_related(None), options['repeat'])
+            line = f'{seeded:>10} {fast:>13.3f}s {fast / seeded * 1e6:>11.1f}'
+            if not options['skip_legacy']:
+                slow = self.measure(legacy_clients(), options['repeat'])
+                line += f' {slow:>9.3f}s {slow / seeded * 1e6:>11.1f}'
+            self.stdout.write(line)
+
+        if not options['skip_legacy']:
+            expected = sorted(legacy_clients().values_list(*COUNTERS))
+            actual = sorted(clients_with_stats().prefetch_related(None).values_list(*COUNTERS))
+            if expected != actual:
+                raise CommandError('Las dos consultas no devuelven los mismos contadores')
+            self.stdout.write(self.style.SUCCESS('✓ Ambas consultas devuelven los mismos contadores'))
+
+    def measure(self, queryset, repeat):
+        """Mejor tiempo de evaluar todos los contadores del queryset"""
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            list(queryset.values_list(*COUNTERS))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def seed(self, start, end, client_group, service, employee, options):
+        """Crear los clientes start..end-1 con sus asignaciones, sesiones, archivos y auditoría"""
+        usernames = [f'{USERNAME_PREFIX}{i}' for i in range(start, end)]
+        User.objects.bulk_create([User(username=name, password='!') for name in usernames], batch_size=1000)
+        # bulk_create no retorna ids en MySQL: se vuelven a leer
+        client_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=client_id, group_id=client_group.id) for client_id in client_ids
+        ], batch_size=1000)
+
+        ClientAssignment.objects.bulk_create([
+            ClientAssignment(client_id=client_id, employee=employee, service=service, is_active=index % 4 != 0)
+            for index, client_id in enumerate(client_ids)
+        ], batch_size=1000)
+        assignments = list(
+            ClientAssignment.objects.filter(client_id__in=client_ids).values_list('id', 'client_id')
+        )
+
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(
+                assignment_id=assignment_id,
+                scheduled_date=now,
+                status='completed' if n % 2 else 'scheduled'
+            )
+            for assignment_id, _ in assignments
+            for n in range(options['sessions'])
+        ], batch_size=1000)
+        FileUpload.objects.bulk_create([
+            FileUpload(
+                assignment_id=assignment_id,
+                uploaded_by=employee,
+                file='bench.txt',
+                file_name='bench.txt',
+                file_size=1
+            )
+            for assignment_id, _ in assignments
+            for n in range(options['files'])
+        ], batch_size=1000)
+        AuditLog.objects.bulk_create([
+            AuditLog(user_id=client_id, action='login', description='benchmark')
+            for client_id in client_ids
+            for n in range(options['audit'])
+        ], batch_size=1000)
@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from servicios.order_processing import (
+    DEFAULT_WORKERS, FAILED, GENERATED, SKIPPED, approvable_orders, process_orders
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las sesiones de las órdenes pendientes que tienen empleado, días y horario '
+        'asignados, varias a la vez. Cada orden va en su propia transacción; se puede volver '
+        'a ejecutar sin duplicar sesiones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Órdenes procesadas en paralelo')
+        parser.add_argument('--limit', type=int, help='Procesar como máximo N órdenes (las más antiguas primero)')
+        parser.add_argument('--order', type=int, action='append', dest='order_ids', help='Procesar solo esta orden (repetible)')
+        parser.add_argument('--user', help='Usuario al que se atribuye el registro de auditoría')
+        parser.add_argument('--dry-run', action='store_true', help='Solo listar las órdenes que se procesarían')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers debe ser mayor que cero')
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No existe el usuario {options['user']}")
+
+        orders = approvable_orders()
+        if options['order_ids']:
+            orders = orders.filter(id__in=options['order_ids'])
+        if options['limit']:
+            orders = orders[:options['limit']]
+        order_ids = list(orders.values_list('id', flat=True))
+
+        if not order_ids:
+            self.stdout.write(self.style.SUCCESS('✓ No hay órdenes pendientes para procesar'))
+            return
+        if options['dry_run']:
+            self.stdout.write(f'{len(order_ids)} órdenes por procesar: ' + ', '.join(f'#{i}' for i in order_ids))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Procesando {len(order_ids)} órdenes con {options['workers']} hilos..."
+        ))
+        results = process_orders(order_ids, options['workers'], user, self.report)
+
+        counts = {outcome: sum(1 for r in results if r.outcome == outcome) for outcome in (GENERATED, SKIPPED, FAILED)}
+        self.stdout.write(self.style.SUCCESS(f'✓ Generadas: {counts[GENERATED]}'))
+        self.stdout.write(f'Omitidas: {counts[SKIPPED]}')
+        if counts[FAILED]:
+            self.stdout.write(self.style.ERROR(f'✗ Con error: {counts[FAILED]}'))
+
+    def report(self, result, done, total):
+        line = f'[{done}/{total}] Orden #{result.order_id}: {result.message}'
+        if result.outcome == GENERATED:
+            self.stdout.write(self.style.SUCCESS(f'✓ {line}'))
+        elif result.outcome == FAILED:
+            self.stdout.write(self.style.ERROR(f'✗ {line}'))
+        else:
+            self.stdout.write(f'- {line}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from servicios.session_stats import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas materializadas de sesiones por asignación y por cliente'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Recalculando estadísticas de sesiones...'))
+        assignments, clients = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'✓ Asignaciones: {assignments}'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Clientes: {clients}'))
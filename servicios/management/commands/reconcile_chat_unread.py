@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from servicios.chat_events import set_unread_totals
+from servicios.models import ChatConversation
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el total de mensajes no leídos de cada usuario y corrige el valor '
+        'cacheado del badge de chat. Programar periódicamente (ej. cron cada 15 minutos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recontar además los no leídos de cada conversación desde las marcas de lectura'
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            conversations = ChatConversation.objects.select_related('assignment')
+            for conversation in conversations.iterator():
+                conversation.refresh_unread_counts()
+            self.stdout.write(self.style.SUCCESS('✓ Conversaciones recontadas'))
+
+        # Una consulta agrupada por cada lado de la conversación
+        totals = {}
+        for user_field, unread_field in (
+            ('assignment__client_id', 'client_unread_count'),
+            ('assignment__employee_id', 'employee_unread_count'),
+        ):
+            rows = ChatConversation.objects.values(user_field).annotate(unread=Sum(unread_field))
+            for row in rows:
+                user_id = row[user_field]
+                totals[user_id] = totals.get(user_id, 0) + (row['unread'] or 0)
+
+        set_unread_totals(totals)
+        self.stdout.write(self.style.SUCCESS(f'✓ Totales de no leídos actualizados para {len(totals)} usuarios'))
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_conversation_summaries(apps, schema_editor):
+    """Poblar el resumen de cada asignación a partir de los mensajes existentes"""
+    ClientAssignment = apps.get_model('servicios', 'ClientAssignment')
+    ChatMessage = apps.get_model('servicios', 'ChatMessage')
+    ChatConversation = apps.get_model('servicios', 'ChatConversation')
+
+    assignment_ids = ChatMessage.objects.values_list('assignment_id', flat=True).distinct()
+    for assignment in ClientAssignment.objects.filter(id__in=list(assignment_ids)):
+        messages = ChatMessage.objects.filter(assignment=assignment)
+        last_message = messages.order_by('-id').first()
+        unread = messages.filter(is_read=False)
+        ChatConversation.objects.create(
+            assignment=assignment,
+            last_message_id=last_message.id,
+            last_message_preview=last_message.message[:50],
+            last_message_at=last_message.created_at,
+            last_sender_id=last_message.sender_id,
+            client_unread_count=unread.exclude(sender_id=assignment.client_id).count(),
+            employee_unread_count=unread.exclude(sender_id=assignment.employee_id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('servicios', '0012_price_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatConversation',
+            fields=[
+                ('assignment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='chat_summary', serialize=False, to='servicios.clientassignment')),
+                ('last_message_id', models.IntegerField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=50)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('client_unread_count', models.PositiveIntegerField(default=0)),
+                ('employee_unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Conversación de Chat',
+                'verbose_name_plural': 'Conversaciones de Chat',
+                'db_table': 'chat_conversations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='clientassignment',
+            index=models.Index(fields=['employee', 'is_active'], name='assignment_employee_active'),
+        ),
+        migrations.AddIndex(
+            model_name='clientassignment',
+            index=models.Index(fields=['client', 'is_active'], name='assignment_client_active'),
+        ),
+        migrations.AddField(
+            model_name='chatconversation',
+            name='last_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(build_conversation_summaries, migrations.RunPython.noop),
+    ]
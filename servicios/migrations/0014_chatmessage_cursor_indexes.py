@@ -0,0 +1,21 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0013_chatconversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['assignment', 'id'], name='chat_msg_assignment_id'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['assignment', 'created_at'], name='chat_msg_assignment_created'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:04
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def build_read_watermarks(apps, schema_editor):
+    """Derivar las marcas de lectura a partir de is_read (justo antes del primer no leído)"""
+    ChatConversation = apps.get_model('servicios', 'ChatConversation')
+    ChatMessage = apps.get_model('servicios', 'ChatMessage')
+
+    for conversation in ChatConversation.objects.select_related('assignment'):
+        assignment = conversation.assignment
+        unread = ChatMessage.objects.filter(assignment_id=assignment.id, is_read=False)
+        last_id = conversation.last_message_id or 0
+
+        first_unread_for_client = unread.exclude(sender_id=assignment.client_id).aggregate(first=Min('id'))['first']
+        first_unread_for_employee = unread.exclude(sender_id=assignment.employee_id).aggregate(first=Min('id'))['first']
+
+        conversation.client_last_read_id = first_unread_for_client - 1 if first_unread_for_client else last_id
+        conversation.employee_last_read_id = first_unread_for_employee - 1 if first_unread_for_employee else last_id
+        conversation.save(update_fields=['client_last_read_id', 'employee_last_read_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0014_chatmessage_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatconversation',
+            name='client_last_read_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatconversation',
+            name='employee_last_read_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(build_read_watermarks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+# Copia fija de servicios.search.tokenize al crear la tabla: la migración debe
+# producir siempre el mismo índice aunque el tokenizador cambie después
+TOKEN_MAX_LENGTH = 64
+
+WORD_RE = re.compile(r'\w+')
+
+STOPWORDS = frozenset("""
+a al algo como con de del el ella en era es esa ese eso esta este esto
+ha la las le les lo los me mi muy no nos o para pero por que se si sin
+sobre su sus te tu un una uno y ya yo
+""".split())
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [
+        word[:TOKEN_MAX_LENGTH]
+        for word in WORD_RE.findall(text)
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def build_search_index(apps, schema_editor):
+    """Indexar los mensajes y archivos existentes"""
+    ChatMessage = apps.get_model('servicios', 'ChatMessage')
+    FileUpload = apps.get_model('servicios', 'FileUpload')
+    SearchToken = apps.get_model('servicios', 'SearchToken')
+
+    batch = []
+    documents = chain(
+        (
+            (message.message, message.assignment_id, {'message_id': message.id})
+            for message in ChatMessage.objects.only('id', 'assignment_id', 'message').iterator()
+        ),
+        (
+            (f"{upload.file_name} {upload.description or ''}", upload.assignment_id, {'file_id': upload.id})
+            for upload in FileUpload.objects.only('id', 'assignment_id', 'file_name', 'description').iterator()
+        ),
+    )
+    for text, assignment_id, document in documents:
+        for token, frequency in Counter(tokenize(text)).items():
+            batch.append(SearchToken(
+                token=token, frequency=min(frequency, 32767), assignment_id=assignment_id, **document
+            ))
+        if len(batch) >= 1000:
+            SearchToken.objects.bulk_create(batch)
+            batch = []
+    SearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0015_chat_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='servicios.clientassignment')),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='servicios.fileupload')),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='servicios.chatmessage')),
+            ],
+            options={
+                'verbose_name': 'Término de búsqueda',
+                'verbose_name_plural': 'Términos de búsqueda',
+                'db_table': 'search_tokens',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['token', 'assignment'], name='search_token_assignment'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0016_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchtoken',
+            name='message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='servicios.chatmessage'),
+        ),
+        migrations.CreateModel(
+            name='ChatArchiveSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_message_id', models.IntegerField()),
+                ('last_message_id', models.IntegerField()),
+                ('first_message_at', models.DateTimeField()),
+                ('last_message_at', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField(help_text='JSON comprimido con zlib')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_archive_segments', to='servicios.clientassignment')),
+            ],
+            options={
+                'verbose_name': 'Segmento de Chat Archivado',
+                'verbose_name_plural': 'Segmentos de Chat Archivados',
+                'db_table': 'chat_archive_segments',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='chatarchivesegment',
+            index=models.Index(fields=['assignment', 'last_message_id'], name='chat_archive_assignment_last'),
+        ),
+    ]
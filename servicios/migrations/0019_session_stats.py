@@ -0,0 +1,68 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q
+
+
+def build_session_stats(apps, schema_editor):
+    """Calcular las estadísticas a partir de las sesiones existentes"""
+    ClientAssignment = apps.get_model('servicios', 'ClientAssignment')
+    AssignmentSessionStats = apps.get_model('servicios', 'AssignmentSessionStats')
+    ClientSessionStats = apps.get_model('servicios', 'ClientSessionStats')
+
+    counters = {
+        'total_sessions': Count('sessions'),
+        'completed_sessions': Count('sessions', filter=Q(sessions__status='completed')),
+        'scheduled_sessions': Count('sessions', filter=Q(sessions__status__in=['scheduled', 'confirmed'])),
+    }
+    AssignmentSessionStats.objects.bulk_create([
+        AssignmentSessionStats(assignment_id=row['id'], **{field: row[field] for field in counters})
+        for row in ClientAssignment.objects.order_by().values('id').annotate(**counters)
+    ], batch_size=1000)
+    ClientSessionStats.objects.bulk_create([
+        ClientSessionStats(client_id=row['client_id'], **{field: row[field] for field in counters})
+        for row in ClientAssignment.objects.order_by().values('client_id').annotate(**counters)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('servicios', '0017_chat_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentSessionStats',
+            fields=[
+                ('total_sessions', models.PositiveIntegerField(default=0)),
+                ('completed_sessions', models.PositiveIntegerField(default=0)),
+                ('scheduled_sessions', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='session_stats', serialize=False, to='servicios.clientassignment')),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Asignación',
+                'verbose_name_plural': 'Estadísticas de Asignaciones',
+                'db_table': 'assignment_session_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientSessionStats',
+            fields=[
+                ('total_sessions', models.PositiveIntegerField(default=0)),
+                ('completed_sessions', models.PositiveIntegerField(default=0)),
+                ('scheduled_sessions', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='session_stats', serialize=False, to='auth.user')),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Cliente',
+                'verbose_name_plural': 'Estadísticas de Clientes',
+                'db_table': 'client_session_stats',
+            },
+        ),
+        migrations.RunPython(build_session_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0019_session_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['assignment', 'scheduled_date'], name='session_assignment_date'),
+        ),
+    ]
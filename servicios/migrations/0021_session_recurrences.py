@@ -0,0 +1,50 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:44
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0020_session_assignment_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRecurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.JSONField(default=list, help_text='Días de la semana (0 = lunes ... 6 = domingo)')),
+                ('start_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('duration_minutes', models.IntegerField(default=60, validators=[django.core.validators.MinValueValidator(15, message='La duración mínima es 15 minutos'), django.core.validators.MaxValueValidator(480, message='La duración máxima es 8 horas')])),
+                ('count', models.PositiveIntegerField(blank=True, help_text='Cantidad de ocurrencias', null=True)),
+                ('until', models.DateField(blank=True, help_text='Última fecha (incluida)', null=True)),
+                ('exceptions', models.JSONField(blank=True, default=list, help_text='Fechas sin sesión (YYYY-MM-DD)')),
+                ('notes', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurrences', to='servicios.clientassignment')),
+            ],
+            options={
+                'verbose_name': 'Repetición de Sesiones',
+                'verbose_name_plural': 'Repeticiones de Sesiones',
+                'db_table': 'session_recurrences',
+            },
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='occurrence',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessions', to='servicios.sessionrecurrence'),
+        ),
+        migrations.AddConstraint(
+            model_name='session',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'occurrence'), name='session_recurrence_occurrence'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicios', '0021_session_recurrences'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='sessionrecurrence',
+            constraint=models.CheckConstraint(check=models.Q(('count__isnull', False), ('until__isnull', False), _connector='OR'), name='session_recurrence_bounded'),
+        ),
+    ]
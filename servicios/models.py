@@ -1,6 +1,10 @@
-from django.db import models
-from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.contrib.auth.models import User, Group
 from django.utils import timezone
+from datetime import datetime, time, timedelta
+from dateutil.rrule import rrule, WEEKLY
 from django.core.validators import FileExtensionValidator, MinValueValidator, MaxValueValidator, RegexValidator
 from django.core.exceptions import ValidationError
 
@@ -222,11 +226,105 @@ class ClientAssignment(models.Model):
         verbose_name = 'Asignación de Cliente'
         verbose_name_plural = 'Asignaciones de Clientes'
         ordering = ['-assigned_at']
+        indexes = [
+            models.Index(fields=['employee', 'is_active'], name='assignment_employee_active'),
+            models.Index(fields=['client', 'is_active'], name='assignment_client_active'),
+        ]
 
     def __str__(self):
         return f"{self.client.username} → {self.employee.username} ({self.service.name})"
 
 
+class SessionRecurrence(models.Model):
+    """
+    Regla de repetición semanal de las sesiones de una asignación.
+
+    Las ocurrencias se calculan al pedirlas (ver recurrence.py); una ocurrencia
+    solo tiene fila en Session cuando se registra algo sobre ella (estado,
+    notas, archivos, cambio de horario).
+    """
+    assignment = models.ForeignKey(ClientAssignment, on_delete=models.CASCADE, related_name='recurrences')
+    weekdays = models.JSONField(default=list, help_text='Días de la semana (0 = lunes ... 6 = domingo)')
+    start_date = models.DateField()
+    start_time = models.TimeField()
+    duration_minutes = models.IntegerField(
+        default=60,
+        validators=[
+            MinValueValidator(15, message='La duración mínima es 15 minutos'),
+            MaxValueValidator(480, message='La duración máxima es 8 horas')
+        ]
+    )
+    count = models.PositiveIntegerField(null=True, blank=True, help_text='Cantidad de ocurrencias')
+    until = models.DateField(null=True, blank=True, help_text='Última fecha (incluida)')
+    exceptions = models.JSONField(default=list, blank=True, help_text='Fechas sin sesión (YYYY-MM-DD)')
+    notes = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'session_recurrences'
+        verbose_name = 'Repetición de Sesiones'
+        verbose_name_plural = 'Repeticiones de Sesiones'
+        constraints = [
+            # Sin fin las estadísticas no podrían contar sus ocurrencias pendientes
+            models.CheckConstraint(
+                check=models.Q(count__isnull=False) | models.Q(until__isnull=False),
+                name='session_recurrence_bounded'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Repetición {self.id} - asignación {self.assignment_id}"
+
+    def clean(self):
+        if not self.weekdays or any(day not in range(7) for day in self.weekdays):
+            raise ValidationError({'weekdays': 'Indique días de la semana entre 0 (lunes) y 6 (domingo)'})
+        self._check_bounded()
+
+    def _check_bounded(self):
+        if self.count is None and self.until is None:
+            raise ValidationError('La repetición necesita una cantidad de sesiones o una fecha final')
+
+    def save(self, *args, **kwargs):
+        """Guardar solo reglas con fin (MySQL anterior a 8.0.16 ignora el CHECK)"""
+        self._check_bounded()
+        super().save(*args, **kwargs)
+
+    def rule(self):
+        """Regla de dateutil en hora local, sin las excepciones"""
+        return rrule(
+            WEEKLY,
+            byweekday=sorted(self.weekdays),
+            dtstart=datetime.combine(self.start_date, self.start_time),
+            count=self.count,
+            until=datetime.combine(self.until, time.max) if self.until else None,
+        )
+
+    def occurrences(self, start=None, end=None):
+        """
+        Inicios (aware) de las ocurrencias en [start, end), sin las excepciones.
+
+        Sin end recorre la regla hasta su fin: ValueError si la regla no lo tiene.
+        """
+        if end is None and self.count is None and self.until is None:
+            raise ValueError('La repetición no tiene fin: indique hasta cuándo calcular las ocurrencias')
+        rule = self.rule()
+        if start is not None:
+            first = timezone.make_naive(start) - timedelta(microseconds=1)
+            candidates = rule.xafter(first) if end is None else rule.between(first, timezone.make_naive(end))
+        else:
+            candidates = iter(rule) if end is None else rule.between(datetime.min, timezone.make_naive(end))
+        exceptions = set(self.exceptions)
+        return [
+            timezone.make_aware(candidate)
+            for candidate in candidates
+            if candidate.date().isoformat() not in exceptions
+        ]
+
+    def includes(self, occurrence):
+        """Si occurrence es una de las ocurrencias de la regla"""
+        return occurrence in self.occurrences(occurrence, occurrence + timedelta(microseconds=1))
+
+
 class Session(models.Model):
     """Modelo para sesiones/citas entre clientes y empleados"""
     STATUS_CHOICES = [
@@ -251,16 +349,90 @@ class Session(models.Model):
     employee_notes = models.TextField(blank=True, null=True, verbose_name='Notas del Empleado')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Ocurrencia de una repetición que esta fila materializa (su horario original)
+    recurrence = models.ForeignKey(
+        SessionRecurrence, on_delete=models.SET_NULL, null=True, blank=True, related_name='sessions'
+    )
+    occurrence = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'sessions'
         verbose_name = 'Sesión'
         verbose_name_plural = 'Sesiones'
         ordering = ['scheduled_date']
+        indexes = [
+            # Calendario de un empleado: rango de fechas sobre sus asignaciones (ver scheduling.py)
+            models.Index(fields=['assignment', 'scheduled_date'], name='session_assignment_date'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recurrence', 'occurrence'], name='session_recurrence_occurrence'),
+        ]
 
     def __str__(self):
         return f"Sesión {self.id} - {self.assignment.client.username} - {self.scheduled_date.strftime('%Y-%m-%d %H:%M')}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado guardado en la base, para detectar cambios (ver session_stats.py)
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+
+
+class SessionStatsBase(models.Model):
+    """Contadores de sesiones materializados (ver session_stats.py)"""
+    total_sessions = models.PositiveIntegerField(default=0)
+    completed_sessions = models.PositiveIntegerField(default=0)
+    scheduled_sessions = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def progress(self):
+        """Porcentaje de sesiones completadas"""
+        if not self.total_sessions:
+            return 0
+        return round(self.completed_sessions / self.total_sessions * 100, 1)
+
+
+class AssignmentSessionStats(SessionStatsBase):
+    """Estadísticas de sesiones de una asignación"""
+    assignment = models.OneToOneField(
+        ClientAssignment,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='session_stats'
+    )
+
+    class Meta:
+        db_table = 'assignment_session_stats'
+        verbose_name = 'Estadísticas de Asignación'
+        verbose_name_plural = 'Estadísticas de Asignaciones'
+
+    def __str__(self):
+        return f"Estadísticas asignación {self.assignment_id}"
+
+
+class ClientSessionStats(SessionStatsBase):
+    """Estadísticas de sesiones de un cliente (todas sus asignaciones)"""
+    client = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='session_stats'
+    )
+
+    class Meta:
+        db_table = 'client_session_stats'
+        verbose_name = 'Estadísticas de Cliente'
+        verbose_name_plural = 'Estadísticas de Clientes'
+
+    def __str__(self):
+        return f"Estadísticas cliente {self.client_id}"
+
 
 class FileUpload(models.Model):
     """Modelo para archivos compartidos entre clientes y empleados"""
@@ -297,8 +469,17 @@ class FileUpload(models.Model):
         verbose_name_plural = 'Archivos'
         ordering = ['-uploaded_at']
 
+    # Campos que alimentan el índice de búsqueda (ver search.py)
+    SEARCH_FIELDS = ('file_name', 'description', 'assignment')
+
     def __str__(self):
         return f"{self.file_name} - {self.uploaded_by.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._search_values = search_values(instance)
+        return instance
     
     def clean(self):
         """Validar tamaño de archivo (máximo 10MB)"""
@@ -359,6 +540,7 @@ class ChatMessage(models.Model):
     assignment = models.ForeignKey(ClientAssignment, on_delete=models.CASCADE, related_name='chat_messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     message = models.TextField()
+    # Histórico: la lectura se registra con las marcas de ChatConversation
     is_read = models.BooleanField(default=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
@@ -367,9 +549,22 @@ class ChatMessage(models.Model):
         verbose_name = 'Mensaje de Chat'
         verbose_name_plural = 'Mensajes de Chat'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['assignment', 'id'], name='chat_msg_assignment_id'),
+            models.Index(fields=['assignment', 'created_at'], name='chat_msg_assignment_created'),
+        ]
     
+    # Campos que alimentan el índice de búsqueda (ver search.py)
+    SEARCH_FIELDS = ('message', 'assignment')
+
     def __str__(self):
         return f"{self.sender.username} -> {self.assignment} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._search_values = search_values(instance)
+        return instance
     
     def mark_as_read(self):
         """Marcar mensaje como leído"""
@@ -377,3 +572,356 @@ class ChatMessage(models.Model):
             self.is_read = True
             self.save(update_fields=['is_read'])
 
+
+class ChatConversation(models.Model):
+    """Resumen desnormalizado de la conversación de una asignación (bandeja de chat)"""
+    PREVIEW_LENGTH = 50
+
+    assignment = models.OneToOneField(
+        ClientAssignment,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='chat_summary'
+    )
+    last_message_id = models.IntegerField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    client_unread_count = models.PositiveIntegerField(default=0)
+    employee_unread_count = models.PositiveIntegerField(default=0)
+    # Marcas de lectura: último mensaje leído por cada participante
+    client_last_read_id = models.IntegerField(default=0)
+    employee_last_read_id = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'chat_conversations'
+        verbose_name = 'Conversación de Chat'
+        verbose_name_plural = 'Conversaciones de Chat'
+
+    def __str__(self):
+        return f"Conversación {self.assignment_id}"
+
+    def unread_count_for(self, user):
+        """Mensajes no leídos por el participante indicado"""
+        if user.id == self.assignment.client_id:
+            return self.client_unread_count
+        return self.employee_unread_count
+
+    def last_read_id_for(self, user):
+        """Marca de lectura del participante indicado"""
+        if user.id == self.assignment.client_id:
+            return self.client_last_read_id
+        return self.employee_last_read_id
+
+    def other_last_read_id_for(self, user):
+        """Marca de lectura del interlocutor del participante indicado"""
+        if user.id == self.assignment.client_id:
+            return self.employee_last_read_id
+        return self.client_last_read_id
+
+    def refresh_unread_counts(self):
+        """Recalcular los contadores de no leídos a partir de las marcas de lectura"""
+        assignment = self.assignment
+        messages = ChatMessage.objects.filter(assignment_id=assignment.id)
+        self.client_unread_count = messages.filter(
+            id__gt=self.client_last_read_id
+        ).exclude(sender_id=assignment.client_id).count()
+        self.employee_unread_count = messages.filter(
+            id__gt=self.employee_last_read_id
+        ).exclude(sender_id=assignment.employee_id).count()
+        ChatConversation.objects.filter(assignment_id=assignment.id).update(
+            client_unread_count=self.client_unread_count,
+            employee_unread_count=self.employee_unread_count
+        )
+
+    @classmethod
+    def register_message(cls, message):
+        """Actualizar el resumen con un mensaje recién creado (último mensaje y no leídos del destinatario)"""
+        assignment = message.assignment
+        if message.sender_id == assignment.client_id:
+            unread_field = 'employee_unread_count'
+        else:
+            unread_field = 'client_unread_count'
+
+        values = {
+            'last_message_id': message.id,
+            'last_message_preview': message.message[:cls.PREVIEW_LENGTH],
+            'last_message_at': message.created_at,
+            'last_sender_id': message.sender_id,
+            'updated_at': timezone.now(),
+        }
+        updated = cls.objects.filter(assignment_id=assignment.id).update(
+            **values, **{unread_field: models.F(unread_field) + 1}
+        )
+        if not updated:
+            conversation, created = cls.objects.get_or_create(
+                assignment_id=assignment.id,
+                defaults={**values, unread_field: 1}
+            )
+            if not created:
+                cls.objects.filter(assignment_id=assignment.id).update(
+                    **values, **{unread_field: models.F(unread_field) + 1}
+                )
+
+    @classmethod
+    def unread_state_for(cls, user):
+        """
+        Total de no leídos del usuario y fecha de su último mensaje.
+
+        Suma una fila por conversación. Retorna (unread_count, last_message_at).
+        """
+        totals = cls.objects.filter(
+            models.Q(assignment__client=user) | models.Q(assignment__employee=user)
+        ).aggregate(
+            unread=models.Sum(models.Case(
+                models.When(assignment__client=user, then=models.F('client_unread_count')),
+                default=models.F('employee_unread_count')
+            )),
+            last_message_at=models.Max('last_message_at')
+        )
+        return totals['unread'] or 0, totals['last_message_at']
+
+    @classmethod
+    def unread_total_for(cls, user):
+        """Total de no leídos del usuario"""
+        return cls.unread_state_for(user)[0]
+
+    @classmethod
+    def mark_read(cls, assignment, user, up_to_id):
+        """
+        Avanzar la marca de lectura del participante hasta up_to_id.
+
+        Es una actualización de una sola fila: si up_to_id alcanza el último
+        mensaje, los no leídos del participante quedan en cero. Retorna
+        cuántos mensajes pasaron a leídos (0 si la marca no avanzó).
+        """
+        if user.id == assignment.client_id:
+            watermark_field, unread_field = 'client_last_read_id', 'client_unread_count'
+        else:
+            watermark_field, unread_field = 'employee_last_read_id', 'employee_unread_count'
+
+        conversation = cls.objects.filter(assignment_id=assignment.id)
+        previous_unread = conversation.values_list(unread_field, flat=True).first() or 0
+
+        updated = conversation.filter(
+            last_message_id__lte=up_to_id,
+            **{f'{watermark_field}__lt': up_to_id}
+        ).update(**{watermark_field: up_to_id, unread_field: 0})
+        if updated:
+            return previous_unread
+
+        # Llegaron mensajes más nuevos que up_to_id: avanzar la marca y recontar
+        updated = conversation.filter(
+            **{f'{watermark_field}__lt': up_to_id}
+        ).update(**{watermark_field: up_to_id})
+        if not updated:
+            return 0
+        summary = cls.objects.select_related('assignment').get(assignment_id=assignment.id)
+        summary.refresh_unread_counts()
+        return max(previous_unread - summary.unread_count_for(user), 0)
+
+
+class ChatArchiveSegment(models.Model):
+    """Bloque comprimido de mensajes antiguos de una asignación (ver chat_archive.py)"""
+    assignment = models.ForeignKey(ClientAssignment, on_delete=models.CASCADE, related_name='chat_archive_segments')
+    first_message_id = models.IntegerField()
+    last_message_id = models.IntegerField()
+    first_message_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    payload = models.BinaryField(help_text='JSON comprimido con zlib')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'chat_archive_segments'
+        verbose_name = 'Segmento de Chat Archivado'
+        verbose_name_plural = 'Segmentos de Chat Archivados'
+        indexes = [
+            models.Index(fields=['assignment', 'last_message_id'], name='chat_archive_assignment_last'),
+        ]
+
+    def __str__(self):
+        return f"Archivo {self.assignment_id}: {self.first_message_id}-{self.last_message_id}"
+
+
+class SearchToken(models.Model):
+    """Índice invertido de búsqueda: un término de un mensaje o archivo (ver search.py)"""
+    token = models.CharField(max_length=64)
+    assignment = models.ForeignKey(ClientAssignment, on_delete=models.CASCADE, related_name='+')
+    # Sin restricción en la base: los términos de mensajes archivados se conservan
+    message = models.ForeignKey(
+        ChatMessage, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    file = models.ForeignKey(FileUpload, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    frequency = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        db_table = 'search_tokens'
+        verbose_name = 'Término de búsqueda'
+        verbose_name_plural = 'Términos de búsqueda'
+        indexes = [
+            models.Index(fields=['token', 'assignment'], name='search_token_assignment'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
+def search_values(instance):
+    """Valores actuales de los campos indexados (SEARCH_FIELDS) de un mensaje o archivo"""
+    return tuple(
+        instance.__dict__.get(instance._meta.get_field(name).attname) for name in instance.SEARCH_FIELDS
+    )
+
+
+def _search_fields_changed(instance, created, update_fields):
+    """Si el guardado tocó lo indexado: los de solo banderas (mark_as_read) no reindexan"""
+    if created:
+        return True
+    if update_fields is not None:
+        return any(
+            name in update_fields or instance._meta.get_field(name).attname in update_fields
+            for name in instance.SEARCH_FIELDS
+        )
+    # Guardado completo: comparar con lo que se leyó (o indexó) la última vez
+    return getattr(instance, '_search_values', None) != search_values(instance)
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_chat_message(sender, instance, created, update_fields=None, **kwargs):
+    """Mantener el índice de búsqueda cuando cambia el texto de un mensaje"""
+    if _search_fields_changed(instance, created, update_fields):
+        from .search import index_message
+        index_message(instance)
+        instance._search_values = search_values(instance)
+
+
+@receiver(post_save, sender=FileUpload)
+def index_file_upload(sender, instance, created, update_fields=None, **kwargs):
+    """Mantener el índice de búsqueda cuando cambian el nombre o la descripción de un archivo"""
+    if _search_fields_changed(instance, created, update_fields):
+        from .search import index_file
+        index_file(instance)
+        instance._search_values = search_values(instance)
+
+
+@receiver(post_save, sender=ClientAssignment)
+def create_session_stats(sender, instance, created, **kwargs):
+    """Crear las estadísticas de sesiones de una asignación nueva"""
+    if created:
+        from .session_stats import assignment_created
+        assignment_created(instance)
+
+
+@receiver(post_save, sender=Session)
+def update_session_stats_on_save(sender, instance, created, **kwargs):
+    """Mantener las estadísticas al crear una sesión o cambiar su estado"""
+    from .session_stats import session_saved
+    if created or ('_loaded_status' in instance.__dict__ and instance.status != instance._loaded_status):
+        session_saved(instance, created)
+
+
+@receiver(post_delete, sender=Session)
+def update_session_stats_on_delete(sender, instance, **kwargs):
+    """Descontar la sesión borrada de las estadísticas"""
+    from .session_stats import session_deleted
+    session_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=SessionRecurrence)
+def update_recurrence_caches(sender, instance, **kwargs):
+    """Cambió una repetición: recalcular sus ocurrencias pendientes e invalidar lo cacheado"""
+    from .session_stats import rebuild_assignments
+    assignment_id = instance.assignment_id
+    transaction.on_commit(lambda: rebuild_assignments([assignment_id]))
+    assignments = ClientAssignment.objects.filter(id=assignment_id)
+    invalidate_assignments_on_commit(assignments)
+
+
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=Price)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """Invalidar lo cacheado del catálogo (páginas públicas, dashboard de admin)"""
+    from .cache_namespaces import catalog
+    # Tras el commit: antes, otra petición podría reconstruir la instantánea
+    # con los datos viejos bajo la versión nueva
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_groups_cache(sender, instance, **kwargs):
+    """Invalidar la lista de grupos cacheada"""
+    from .cache_namespaces import groups
+    groups.invalidate()
+
+
+def _invalidate_users_on_commit(*user_ids):
+    from .cache_namespaces import user
+    for user_id in set(user_ids):
+        if user_id:
+            transaction.on_commit(user(user_id).invalidate)
+
+
+@receiver([post_save, post_delete], sender=ClientAssignment)
+def invalidate_assignment_users(sender, instance, **kwargs):
+    """Cambió una asignación: invalidar lo cacheado de su cliente y su empleado"""
+    _invalidate_users_on_commit(instance.client_id, instance.employee_id)
+
+
+@receiver([post_save, post_delete], sender=Session)
+@receiver([post_save, post_delete], sender=FileUpload)
+def invalidate_assignment_caches(sender, instance, **kwargs):
+    """Cambió una sesión o un archivo: invalidar su asignación y sus participantes"""
+    try:
+        related = instance.assignment
+    except ClientAssignment.DoesNotExist:
+        # Borrado en cascada junto con la asignación (ya invalidada)
+        return
+    invalidate_assignments_on_commit([related])
+
+
+def invalidate_assignments_on_commit(assignments):
+    """
+    Invalidar lo cacheado de las asignaciones y sus participantes al confirmar.
+
+    Las señales lo hacen al guardar una sesión o un archivo; llamarlo a mano
+    tras escrituras masivas (bulk_create, QuerySet.update).
+    """
+    from .cache_namespaces import assignment
+    user_ids = []
+    for related in assignments:
+        transaction.on_commit(assignment(related.id).invalidate)
+        user_ids += [related.client_id, related.employee_id]
+    _invalidate_users_on_commit(*user_ids)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender='cuentas.UserProfile')
+def invalidate_user_cache(sender, instance, **kwargs):
+    """
+    Cambió el usuario o su perfil.
+
+    También se invalida lo cacheado de sus contrapartes (los clientes de un
+    empleado, los empleados de un cliente): su bandeja de chat y sus listas de
+    archivos muestran el nombre de este usuario.
+    """
+    if kwargs.get('update_fields') == frozenset({'last_login'}):
+        # Inicio de sesión: no cambia nada de lo que se muestra
+        return
+    user_id = instance.id if sender is User else instance.user_id
+    participants = ClientAssignment.objects.filter(
+        models.Q(client_id=user_id) | models.Q(employee_id=user_id)
+    ).values_list('client_id', 'employee_id')
+    _invalidate_users_on_commit(user_id, *(participant for pair in participants for participant in pair))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_groups_cache(sender, instance, action, pk_set, **kwargs):
+    """Cambiaron los grupos de un usuario (o los miembros de un grupo)"""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, User):
+        _invalidate_users_on_commit(instance.id)
+    elif pk_set:
+        _invalidate_users_on_commit(*pk_set)
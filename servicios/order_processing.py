@@ -0,0 +1,121 @@
+"""
+Generación de sesiones para muchas órdenes pendientes a la vez.
+
+Usado por el comando process_pending_orders y por la acción del admin de
+Django. Cada orden se procesa en su propia transacción dentro de un pool de
+hilos acotado; los generadores bloquean la fila de la orden y vuelven a leer
+sessions_generated, así que volver a ejecutar (o dos ejecuciones a la vez) no
+duplica sesiones. Las órdenes de un mismo cliente van en el mismo hilo, una
+tras otra, porque pueden crear su usuario (ver get_or_create_order_client).
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import AuditLog, Order
+
+# Órdenes procesadas en paralelo por defecto (cada hilo usa su conexión)
+DEFAULT_WORKERS = 4
+
+GENERATED = 'generated'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+@dataclass
+class OrderResult:
+    order_id: int
+    outcome: str
+    message: str
+
+
+def approvable_orders():
+    """Órdenes pendientes con los datos que necesitan sus generadores"""
+    student_plan = Q(service__slug='plan-estudiante')
+    regular_ready = (
+        ~student_plan &
+        Q(preferred_employee__isnull=False, preferred_time__isnull=False, number_of_sessions__gt=0) &
+        ~Q(preferred_days=[])
+    )
+    student_plan_ready = student_plan & Q(
+        preferred_tutor__isnull=False,
+        preferred_therapist__isnull=False,
+        tutoring_start_date__isnull=False,
+        therapy_start_date__isnull=False,
+        tutoring_time__isnull=False,
+        therapy_time__isnull=False,
+    )
+    return Order.objects.filter(status='pending', sessions_generated=False).filter(
+        regular_ready | student_plan_ready
+    ).order_by('created_at', 'id')
+
+
+def process_order(order_id, user=None):
+    """Generar las sesiones de una orden (y su registro de auditoría) en una transacción"""
+    from .views import generate_order_sessions
+
+    try:
+        with transaction.atomic():
+            order = Order.objects.select_related('customer', 'service').get(pk=order_id)
+            if order.sessions_generated:
+                return OrderResult(order_id, SKIPPED, 'Las sesiones ya fueron generadas para esta orden')
+            result = generate_order_sessions(order)
+            if not result['success']:
+                return OrderResult(order_id, SKIPPED, result['message'])
+            if user is not None:
+                AuditLog.objects.create(
+                    user=user,
+                    action='other',
+                    description=f'Sesiones generadas para orden #{order.id} - {result["message"]}',
+                    related_object_type='Order',
+                    related_object_id=order.id
+                )
+        return OrderResult(order_id, GENERATED, result['message'])
+    except Exception as e:
+        return OrderResult(order_id, FAILED, str(e))
+
+
+def _customer_groups(order_ids):
+    """Órdenes agrupadas por email del cliente, en el orden recibido"""
+    emails = dict(Order.objects.filter(pk__in=order_ids).values_list('id', 'customer__email'))
+    groups = defaultdict(list)
+    for order_id in order_ids:
+        groups[(emails.get(order_id) or '').lower() or order_id].append(order_id)
+    return list(groups.values())
+
+
+def _process_in_worker(order_ids, user):
+    try:
+        return [process_order(order_id, user) for order_id in order_ids]
+    finally:
+        # Cada hilo del pool abre su propia conexión
+        connection.close()
+
+
+def process_orders(order_ids, workers=DEFAULT_WORKERS, user=None, on_result=None):
+    """
+    Procesar las órdenes con a lo sumo `workers` a la vez.
+
+    on_result(result, done, total) se llama por cada orden a medida que terminan
+    las órdenes de cada cliente.
+    Retorna la lista de OrderResult en orden de finalización.
+    """
+    order_ids = list(order_ids)
+    if connection.vendor == 'sqlite':
+        # SQLite admite un solo escritor: las transacciones en paralelo fallan con
+        # "database is locked" en vez de esperar
+        workers = 1
+    results = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [
+            executor.submit(_process_in_worker, group, user) for group in _customer_groups(order_ids)
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                if on_result is not None:
+                    on_result(result, len(results), len(order_ids))
+    return results
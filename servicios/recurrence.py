@@ -0,0 +1,237 @@
+"""
+Sesiones a partir de reglas de repetición (SessionRecurrence).
+
+Una regla reemplaza a una serie de filas de Session: sus ocurrencias se
+calculan para la ventana que se pida y se devuelven como sesiones virtuales
+(instancias sin guardar, con pk None). Cuando algo se registra sobre una
+ocurrencia (estado, notas, archivos, otro horario) se materializa: se crea su
+fila con recurrence y occurrence, y desde entonces la fila la representa.
+
+Las estadísticas de sesiones cuentan las ocurrencias pendientes como
+programadas (ver session_stats.py); los cambios en una regla las recalculan.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Session, SessionRecurrence, invalidate_assignments_on_commit
+from .session_stats import SCHEDULED_STATUSES, rebuild_assignments, record_created
+
+
+def virtual_session(recurrence, occurrence):
+    """Sesión sin guardar que representa una ocurrencia pendiente"""
+    session = Session(
+        assignment_id=recurrence.assignment_id,
+        scheduled_date=occurrence,
+        duration_minutes=recurrence.duration_minutes,
+        status='scheduled',
+        notes=recurrence.notes,
+        recurrence=recurrence,
+        occurrence=occurrence,
+    )
+    if 'assignment' in recurrence._state.fields_cache:
+        # Compartir la asignación ya cargada con la regla
+        session.assignment = recurrence.assignment
+    return session
+
+
+def _materialized(recurrences, start=None, end=None):
+    """Ocurrencias que ya tienen fila: {(recurrence_id, occurrence)}"""
+    rows = Session.objects.filter(recurrence__in=recurrences)
+    if start is not None:
+        rows = rows.filter(occurrence__gte=start)
+    if end is not None:
+        rows = rows.filter(occurrence__lt=end)
+    return set(rows.values_list('recurrence_id', 'occurrence'))
+
+
+def pending_sessions(recurrences, start=None, end=None):
+    """Sesiones virtuales de las ocurrencias sin fila en [start, end), ordenadas"""
+    recurrences = list(recurrences)
+    if not recurrences:
+        return []
+    materialized = _materialized(recurrences, start, end)
+    sessions = [
+        virtual_session(recurrence, occurrence)
+        for recurrence in recurrences
+        for occurrence in recurrence.occurrences(start, end)
+        if (recurrence.id, occurrence) not in materialized
+    ]
+    sessions.sort(key=lambda session: session.scheduled_date)
+    return sessions
+
+
+def pending_counts(recurrences):
+    """Ocurrencias sin fila por asignación: {assignment_id: n}"""
+    recurrences = list(recurrences)
+    materialized = _materialized(recurrences)
+    counts = defaultdict(int)
+    for recurrence in recurrences:
+        counts[recurrence.assignment_id] += sum(
+            1 for occurrence in recurrence.occurrences()
+            if (recurrence.id, occurrence) not in materialized
+        )
+    return dict(counts)
+
+
+def with_pending(sessions, recurrences, start=None, end=None):
+    """Sesiones reales más las ocurrencias pendientes de las repeticiones en [start, end), ordenadas por fecha"""
+    return sorted(
+        list(sessions) + pending_sessions(recurrences, start, end),
+        key=lambda session: session.scheduled_date
+    )
+
+
+def sessions_between(assignment_filter, start, end):
+    """
+    Sesiones reales y virtuales de las asignaciones en [start, end), ordenadas por fecha.
+
+    assignment_filter filtra ClientAssignment (por ejemplo {'employee_id': 3}).
+    """
+    lookups = {f'assignment__{field}': value for field, value in assignment_filter.items()}
+    real = Session.objects.filter(
+        scheduled_date__gte=start, scheduled_date__lt=end, **lookups
+    ).select_related('assignment__client', 'assignment__employee', 'assignment__service')
+    recurrences = SessionRecurrence.objects.filter(**lookups).select_related(
+        'assignment__client', 'assignment__employee', 'assignment__service'
+    )
+    return with_pending(real, recurrences, start, end)
+
+
+def upcoming_session(assignment_filter, now=None):
+    """Próxima sesión programada o confirmada desde now, real o virtual (None si no hay)"""
+    now = now or timezone.now()
+    lookups = {f'assignment__{field}': value for field, value in assignment_filter.items()}
+    real = Session.objects.filter(
+        status__in=SCHEDULED_STATUSES, scheduled_date__gte=now, **lookups
+    ).order_by('scheduled_date').first()
+    # Solo interesan las ocurrencias anteriores a la próxima fila
+    pending = pending_sessions(
+        SessionRecurrence.objects.filter(**lookups), now, real.scheduled_date if real else None
+    )
+    return pending[0] if pending else real
+
+
+def materialize(recurrence, occurrence, **values):
+    """
+    Fila de la ocurrencia, creándola si aún no existe.
+
+    values se aplica solo al crearla (por ejemplo otro scheduled_date o un
+    estado). Lanza ValueError si occurrence no es una ocurrencia de la regla.
+    """
+    existing = Session.objects.filter(recurrence=recurrence, occurrence=occurrence).first()
+    if existing is not None:
+        return existing, False
+    if not recurrence.includes(occurrence):
+        raise ValueError('La fecha no corresponde a una ocurrencia de la repetición')
+
+    session = virtual_session(recurrence, occurrence)
+    for field, value in values.items():
+        setattr(session, field, value)
+    try:
+        with transaction.atomic():
+            session.save()
+    except IntegrityError:
+        # Otra petición la materializó al mismo tiempo
+        return Session.objects.get(recurrence=recurrence, occurrence=occurrence), False
+    return session, True
+
+
+def materialize_pending(recurrences, start=None, end=None):
+    """
+    Crear de una vez las filas de las ocurrencias pendientes en [start, end).
+
+    Usa bulk_create (sin señales): las estadísticas no cambian, porque las
+    ocurrencias pendientes ya se contaban como programadas, pero quien lo
+    llame debe invalidar la caché de las asignaciones.
+    """
+    sessions = pending_sessions(recurrences, start, end)
+    Session.objects.bulk_create(sessions, batch_size=500)
+    return sessions
+
+
+def _session_ids_by_key(sessions):
+    """{(asignación, fecha): {ids}} de las filas con la clave de alguna de las sesiones"""
+    rows = Session.objects.filter(
+        assignment_id__in={session.assignment_id for session in sessions},
+        scheduled_date__in={session.scheduled_date for session in sessions}
+    ).values_list('id', 'assignment_id', 'scheduled_date')
+    ids = {}
+    for session_id, assignment_id, scheduled_date in rows:
+        ids.setdefault((assignment_id, scheduled_date), set()).add(session_id)
+    return ids
+
+
+def bulk_create_sessions(sessions):
+    """
+    Insertar las sesiones por lotes y completar sus ids.
+
+    bulk_create no dispara señales: las estadísticas y la caché se actualizan
+    aquí. Los backends que no retornan los ids insertados (MySQL, SQLite) los
+    obtienen releyendo por la clave natural (asignación, fecha) y descartando
+    las filas que ya existían con esa clave. Llamar dentro de una transacción,
+    con los empleados bloqueados (lock_employees): así nadie más inserta
+    sesiones de esas asignaciones hasta el commit.
+    """
+    if not sessions:
+        return sessions
+    returns_ids = connection.features.can_return_rows_from_bulk_insert
+    existing = {} if returns_ids else _session_ids_by_key(sessions)
+    Session.objects.bulk_create(sessions, batch_size=500)
+
+    if not returns_ids:
+        inserted = _session_ids_by_key(sessions)
+        for session in sessions:
+            key = (session.assignment_id, session.scheduled_date)
+            session.pk = min(inserted.get(key, set()) - existing.get(key, set()), default=None)
+    for session in sessions:
+        session._loaded_status = session.status
+
+    record_created(sessions)
+    invalidate_assignments_on_commit({session.assignment for session in sessions})
+    return sessions
+
+
+def create_recurrence(assignment, session_datetimes, weekdays, preferred_time, duration_minutes, notes=''):
+    """
+    Regla equivalente a una serie de sesiones ya calculada (generadores de órdenes).
+
+    La regla va del primer al último día de la serie en los días de la semana
+    dados: los días de la regla que la serie saltó quedan como excepciones y
+    las sesiones que no caen a preferred_time (corridas por choques) se
+    materializan con su horario real, en un solo bulk_create. Retorna las
+    sesiones de la serie, reales y virtuales, en orden.
+    """
+    local_datetimes = [timezone.localtime(session_datetime) for session_datetime in session_datetimes]
+    by_date = {local.date(): session_datetime for local, session_datetime in zip(local_datetimes, session_datetimes)}
+    recurrence = SessionRecurrence(
+        assignment=assignment,
+        weekdays=sorted(set(weekdays)),
+        start_date=local_datetimes[0].date(),
+        start_time=preferred_time,
+        duration_minutes=duration_minutes,
+        until=local_datetimes[-1].date(),
+        notes=notes,
+    )
+    occurrences = recurrence.occurrences()
+    recurrence.exceptions = [
+        occurrence.date().isoformat()
+        for occurrence in (timezone.localtime(occurrence) for occurrence in occurrences)
+        if occurrence.date() not in by_date
+    ]
+    recurrence.save()
+    # Contar ya las ocurrencias pendientes: materializar descuenta de las programadas
+    rebuild_assignments([assignment.id])
+
+    sessions = []
+    shifted = []
+    for occurrence in recurrence.occurrences():
+        session = virtual_session(recurrence, occurrence)
+        scheduled_date = by_date[timezone.localtime(occurrence).date()]
+        if scheduled_date != occurrence:
+            session.scheduled_date = scheduled_date
+            shifted.append(session)
+        sessions.append(session)
+    bulk_create_sessions(shifted)
+    return sessions
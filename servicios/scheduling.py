@@ -0,0 +1,251 @@
+"""
+Calendario de ocupación de los empleados, para no agendar dos sesiones a la vez.
+
+Las sesiones de un empleado cuelgan de todas sus asignaciones. Se leen con una
+consulta por rango sobre (assignment, scheduled_date) y se guardan en memoria
+como intervalos ocupados fusionados y ordenados: revisar un horario candidato
+es una búsqueda binaria, así que los generadores pueden validar todo un lote
+de sesiones aunque el empleado tenga miles. Las ocurrencias pendientes de
+las repeticiones (recurrence.py) ocupan el horario igual que una sesión.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import cache_namespaces
+from .models import Session, SessionRecurrence
+from .recurrence import pending_sessions
+
+# Estados que no ocupan el horario
+FREE_STATUSES = ('cancelled',)
+
+# Fechas candidatas extra que un generador puede descartar por falta de lugar
+SCHEDULING_LOOKAHEAD = 52
+
+# Jornada en la que se ofrecen horarios libres y paso entre inicios posibles
+WORKDAY_START = time(8, 0)
+WORKDAY_END = time(20, 0)
+SLOT_STEP_MINUTES = 30
+
+# Duración máxima de una sesión (validador de Session.duration_minutes): las
+# sesiones que empiezan antes de una ventana solo pueden invadirla hasta esto
+MAX_SESSION_DURATION = timedelta(minutes=480)
+
+
+def session_interval(scheduled_date, duration_minutes):
+    return scheduled_date, scheduled_date + timedelta(minutes=duration_minutes)
+
+
+def booked_sessions(employee_ids, start, end=None):
+    """
+    Sesiones que ocupan a los empleados en [start, end) (end None: sin límite).
+
+    Consulta por rango: la cota inferior se corre MAX_SESSION_DURATION para
+    incluir las sesiones que empiezan antes y aún no terminan.
+    """
+    sessions = Session.objects.filter(
+        assignment__employee_id__in=employee_ids,
+        scheduled_date__gte=start - MAX_SESSION_DURATION,
+    ).exclude(status__in=FREE_STATUSES)
+    if end is not None:
+        sessions = sessions.filter(scheduled_date__lt=end)
+    return sessions.order_by()
+
+
+def booked_occurrences(employee_ids, start, end=None):
+    """Sesiones virtuales de las repeticiones de los empleados en [start, end) (ver booked_sessions)"""
+    recurrences = SessionRecurrence.objects.filter(
+        assignment__employee_id__in=employee_ids
+    ).select_related('assignment__client')
+    return pending_sessions(recurrences, start - MAX_SESSION_DURATION, end)
+
+
+class BusyCalendar:
+    """
+    Intervalos ocupados [inicio, fin) de un empleado, fusionados y ordenados.
+
+    Como no se solapan, los inicios y los fines quedan ordenados a la vez y
+    basta una búsqueda binaria para saber si un horario choca.
+    """
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def conflict(self, start, end):
+        """Intervalo ocupado que se solapa con [start, end), o None"""
+        # Último intervalo que empieza antes de end: es el único candidato
+        index = bisect_left(self._starts, end) - 1
+        if index >= 0 and self._ends[index] > start:
+            return self._starts[index], self._ends[index]
+        return None
+
+    def is_free(self, start, end):
+        return self.conflict(start, end) is None
+
+    def next_free(self, start, duration):
+        """Primer inicio >= start con `duration` libre (salta al fin de cada choque)"""
+        while True:
+            busy = self.conflict(start, start + duration)
+            if busy is None:
+                return start
+            start = busy[1]
+
+    def add(self, start, end):
+        """Marcar [start, end) como ocupado, fusionando con sus vecinos"""
+        first = bisect_left(self._ends, start)
+        last = bisect_right(self._starts, end)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+            del self._starts[first:last]
+            del self._ends[first:last]
+        insort(self._starts, start)
+        self._ends.insert(bisect_left(self._starts, start), end)
+
+
+def book_on_day(calendar, day, preferred_time, duration_minutes):
+    """
+    Reservar en el calendario el primer horario libre del día desde preferred_time.
+
+    Si el horario preferido choca se corre al fin de la sesión que lo ocupa,
+    mientras siga empezando ese día. Retorna el inicio o None si ese día no
+    queda lugar.
+    """
+    duration = timedelta(minutes=duration_minutes)
+    preferred = timezone.make_aware(datetime.combine(day, preferred_time))
+    next_day = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    start = calendar.next_free(preferred, duration)
+    if start >= next_day:
+        return None
+    calendar.add(start, start + duration)
+    return start
+
+
+def employee_calendars(employee_ids, start, end=None, exclude_session_ids=()):
+    """
+    Calendarios de varios empleados con una sola consulta. Retorna {employee_id: BusyCalendar}
+
+    exclude_session_ids: sesiones que no ocupan el horario (las que se van a mover).
+    """
+    intervals = {employee_id: [] for employee_id in employee_ids}
+    rows = booked_sessions(employee_ids, start, end).exclude(id__in=exclude_session_ids).values_list(
+        'assignment__employee_id', 'scheduled_date', 'duration_minutes'
+    )
+    for employee_id, scheduled_date, duration_minutes in rows:
+        intervals[employee_id].append(session_interval(scheduled_date, duration_minutes))
+    for session in booked_occurrences(employee_ids, start, end):
+        intervals[session.assignment.employee_id].append(
+            session_interval(session.scheduled_date, session.duration_minutes)
+        )
+    return {employee_id: BusyCalendar(busy) for employee_id, busy in intervals.items()}
+
+
+def employee_calendar(employee_id, start, end=None):
+    return employee_calendars([employee_id], start, end)[employee_id]
+
+
+def find_conflict(employee_id, start, duration_minutes, exclude_session_id=None):
+    """Sesión (real o virtual) del empleado que choca con la indicada, o None"""
+    start, end = session_interval(start, duration_minutes)
+    sessions = booked_sessions([employee_id], start, end).select_related('assignment__client')
+    if exclude_session_id is not None:
+        sessions = sessions.exclude(id=exclude_session_id)
+    candidates = list(sessions) + booked_occurrences([employee_id], start, end)
+    for session in sorted(candidates, key=lambda session: session.scheduled_date):
+        if session_interval(session.scheduled_date, session.duration_minutes)[1] > start:
+            return session
+    return None
+
+
+def lock_employees(employee_ids):
+    """
+    Bloquear las filas de los empleados hasta el commit.
+
+    Serializa a quienes agendan sesiones para el mismo empleado: el calendario
+    leído después no cambia hasta confirmar.
+    """
+    list(User.objects.select_for_update().filter(id__in=sorted(set(employee_ids))).values_list('id', flat=True))
+
+
+def ceil_to_step(moment, step_minutes=SLOT_STEP_MINUTES):
+    """Redondear hacia arriba al siguiente múltiplo de step_minutes dentro de la hora"""
+    offset = timedelta(minutes=moment.minute % step_minutes, seconds=moment.second, microseconds=moment.microsecond)
+    return moment + timedelta(minutes=step_minutes) - offset if offset else moment
+
+
+def free_slots(calendar, start, end, duration_minutes, limit):
+    """
+    Primeros `limit` horarios libres de la jornada dentro de [start, end).
+
+    Los inicios se alinean a SLOT_STEP_MINUTES y no se solapan entre sí.
+    """
+    duration = timedelta(minutes=duration_minutes)
+    slots = []
+    day = timezone.localtime(start).date()
+    while len(slots) < limit:
+        opening = timezone.make_aware(datetime.combine(day, WORKDAY_START))
+        if opening >= end:
+            break
+        closing = min(timezone.make_aware(datetime.combine(day, WORKDAY_END)), end)
+        candidate = ceil_to_step(max(opening, start), SLOT_STEP_MINUTES)
+        while len(slots) < limit:
+            candidate = ceil_to_step(calendar.next_free(candidate, duration), SLOT_STEP_MINUTES)
+            if candidate + duration > closing:
+                break
+            # Al redondear pudo volver a caer sobre una sesión: se busca de nuevo
+            if calendar.is_free(candidate, candidate + duration):
+                slots.append(candidate)
+                candidate += duration
+        day += timedelta(days=1)
+    return slots
+
+
+def employee_free_slots(employee_ids, start, end, duration_minutes, limit):
+    """
+    Horarios libres de cada empleado. Retorna {employee_id: [inicios]}.
+
+    Se cachean en el espacio de cada empleado (se invalida cuando cambian sus
+    sesiones o asignaciones); los que faltan se calculan juntos con una sola
+    consulta por rango. Los horarios ya pasados se descartan al leer.
+    """
+    namespaces = {employee_id: cache_namespaces.user(employee_id) for employee_id in employee_ids}
+    versions = dict(zip(namespaces, cache_namespaces.versions(list(namespaces.values()))))
+    name = f'free_slots:{start.isoformat()}:{end.isoformat()}:{duration_minutes}:{limit}'
+    keys = {
+        employee_id: namespace.key(name, version=versions[employee_id])
+        for employee_id, namespace in namespaces.items()
+    }
+    found = cache.get_many(list(keys.values()))
+    slots = {employee_id: found[key] for employee_id, key in keys.items() if key in found}
+
+    missing = [employee_id for employee_id in employee_ids if employee_id not in slots]
+    if missing:
+        calendars = employee_calendars(missing, start, end)
+        computed = {
+            employee_id: free_slots(calendar, start, end, duration_minutes, limit)
+            for employee_id, calendar in calendars.items()
+        }
+        cache.set_many(
+            {keys[employee_id]: employee_slots for employee_id, employee_slots in computed.items()},
+            cache_namespaces.DEFAULT_TIMEOUT
+        )
+        slots.update(computed)
+
+    now = timezone.now()
+    return {employee_id: [slot for slot in slots[employee_id] if slot >= now] for employee_id in employee_ids}
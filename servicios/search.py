@@ -0,0 +1,131 @@
+"""
+Búsqueda de texto sobre el historial de chat y las descripciones de archivos.
+
+Se mantiene un índice invertido propio (tabla search_tokens): cada mensaje o
+archivo guarda una fila por término con su frecuencia. Las señales de
+models.py lo actualizan al escribir, así la búsqueda es una consulta agrupada
+por el índice (token, assignment) en lugar de un LIKE '%...%' sobre el texto.
+Funciona igual en MySQL y en SQLite.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+
+TOKEN_MAX_LENGTH = 64
+SNIPPET_RADIUS = 60
+
+_WORD_RE = re.compile(r'\w+')
+
+# Palabras demasiado frecuentes para aportar a la búsqueda
+STOPWORDS = frozenset("""
+a al algo como con de del el ella en era es esa ese eso esta este esto
+ha la las le les lo los me mi muy no nos o para pero por que se si sin
+sobre su sus te tu un una uno y ya yo
+""".split())
+
+
+def normalize(text):
+    """Minúsculas y sin tildes, para comparar términos"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """Términos indexables de un texto (sin palabras vacías ni términos de una letra)"""
+    if not text:
+        return []
+    return [
+        word[:TOKEN_MAX_LENGTH]
+        for word in _WORD_RE.findall(normalize(text))
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def _index(queryset_filter, assignment_id, text, **document):
+    from .models import SearchToken
+
+    SearchToken.objects.filter(**queryset_filter).delete()
+    SearchToken.objects.bulk_create([
+        SearchToken(token=token, frequency=min(frequency, 32767), assignment_id=assignment_id, **document)
+        for token, frequency in Counter(tokenize(text)).items()
+    ])
+
+
+def index_message(message):
+    """Indexar (o reindexar) un mensaje de chat"""
+    _index({'message_id': message.id}, message.assignment_id, message.message, message_id=message.id)
+
+
+def index_file(file_upload):
+    """Indexar (o reindexar) la descripción y el nombre de un archivo"""
+    text = f"{file_upload.file_name} {file_upload.description or ''}"
+    _index({'file_id': file_upload.id}, file_upload.assignment_id, text, file_id=file_upload.id)
+
+
+def make_snippet(text, terms, radius=SNIPPET_RADIUS):
+    """Fragmento del texto alrededor del primer término encontrado"""
+    text = text or ''
+    normalized = normalize(text)
+    positions = [
+        match.start() for match in _WORD_RE.finditer(normalized)
+        if match.group()[:TOKEN_MAX_LENGTH] in terms
+    ]
+    if not positions:
+        return text[:radius * 2]
+    start = max(positions[0] - radius, 0)
+    end = min(positions[0] + radius, len(text))
+    snippet = text[start:end].strip()
+    if start > 0:
+        snippet = '…' + snippet
+    if end < len(text):
+        snippet = snippet + '…'
+    return snippet
+
+
+def search(user, query, page=1, page_size=20, assignment_id=None):
+    """
+    Buscar en los mensajes y archivos de las asignaciones del usuario.
+
+    El orden es por cantidad de términos encontrados y luego por tf-idf.
+    Retorna (resultados, total, terms); cada resultado es un dict con el
+    documento (message_id o file_id), assignment_id y score.
+    """
+    from .models import ClientAssignment, SearchToken
+
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return [], 0, terms
+
+    assignments = ClientAssignment.objects.filter(Q(client=user) | Q(employee=user))
+    if assignment_id is not None:
+        assignments = assignments.filter(id=assignment_id)
+    hits = SearchToken.objects.filter(
+        token__in=terms,
+        assignment_id__in=assignments.values('id')
+    )
+
+    # Peso de cada término según su rareza dentro del alcance del usuario
+    document_frequency = dict(
+        hits.values_list('token').annotate(documents=Count('id')).values_list('token', 'documents')
+    )
+    if not document_frequency:
+        return [], 0, terms
+    most_common = max(document_frequency.values())
+    weights = [
+        When(token=term, then=F('frequency') * Value(1 + math.log(most_common / documents)))
+        for term, documents in document_frequency.items()
+    ]
+
+    documents = hits.values('message_id', 'file_id', 'assignment_id').annotate(
+        matched=Count('token', distinct=True),
+        score=Sum(Case(*weights, default=Value(0.0), output_field=FloatField()))
+    )
+    total = documents.count()
+    offset = (page - 1) * page_size
+    results = list(
+        documents.order_by('-matched', '-score', '-message_id', '-file_id')[offset:offset + page_size]
+    )
+    return results, total, terms
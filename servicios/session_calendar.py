@@ -0,0 +1,124 @@
+"""
+Calendario de sesiones por rango de fechas (vistas de mes y semana).
+
+Las sesiones de un empleado, un cliente o una asignación en [start, end) se
+leen con una consulta por rango sobre el índice (assignment, scheduled_date)
+a través de las asignaciones del dueño, junto con las ocurrencias pendientes
+de sus repeticiones (recurrence.py), y se agrupan por día. El resultado se
+cachea en el espacio del dueño por ventana: las señales lo invalidan cuando
+cambian sus sesiones, asignaciones o repeticiones.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache_namespaces
+from .recurrence import sessions_between
+
+# Días de la ventana por defecto y máximos (la grilla de un mes: 6 semanas)
+CALENDAR_DEFAULT_DAYS = 7
+CALENDAR_MAX_DAYS = 42
+
+# Parámetro de la petición -> campo de ClientAssignment que filtra las sesiones
+OWNER_FIELDS = {
+    'employee': 'employee_id',
+    'client': 'client_id',
+    'assignment': 'id',
+}
+
+
+class CalendarOwner:
+    """Dueño del calendario pedido: (tipo, id) y su espacio de caché"""
+
+    def __init__(self, kind, owner_id):
+        self.kind = kind
+        self.id = owner_id
+
+    @property
+    def namespace(self):
+        if self.kind == 'assignment':
+            return cache_namespaces.assignment(self.id)
+        return cache_namespaces.user(self.id)
+
+    @property
+    def assignment_filter(self):
+        return {OWNER_FIELDS[self.kind]: self.id}
+
+    def can_view(self, user):
+        """Los administradores ven todos; los demás, solo lo propio"""
+        if user.is_superuser or user.is_staff:
+            return True
+        if self.kind != 'assignment':
+            return user.id == self.id
+        from .models import ClientAssignment
+
+        return ClientAssignment.objects.filter(
+            Q(client_id=user.id) | Q(employee_id=user.id), id=self.id
+        ).exists()
+
+
+def parse_owner(params):
+    """CalendarOwner según employee, client o assignment (exactamente uno). ValueError si no"""
+    given = [(kind, params[kind]) for kind in OWNER_FIELDS if params.get(kind)]
+    if len(given) != 1:
+        raise ValueError('Indique employee, client o assignment')
+    kind, owner_id = given[0]
+    return CalendarOwner(kind, int(owner_id))
+
+
+def parse_window(params):
+    """
+    Fechas (start, end) de la ventana, end excluida. ValueError si no es válida.
+
+    Por defecto, CALENDAR_DEFAULT_DAYS días desde hoy.
+    """
+    start_date = timezone.localdate()
+    if params.get('start'):
+        start_date = datetime.strptime(params['start'], '%Y-%m-%d').date()
+    end_date = start_date + timedelta(days=CALENDAR_DEFAULT_DAYS)
+    if params.get('end'):
+        end_date = datetime.strptime(params['end'], '%Y-%m-%d').date()
+    if not 0 < (end_date - start_date).days <= CALENDAR_MAX_DAYS:
+        raise ValueError(f'El rango de fechas debe ser de 1 a {CALENDAR_MAX_DAYS} días')
+    return start_date, end_date
+
+
+def _session_entry(session):
+    local = timezone.localtime(session.scheduled_date)
+    assignment = session.assignment
+    entry = {
+        'id': session.id,
+        'time': local.strftime('%H:%M'),
+        'duration': session.duration_minutes,
+        'status': session.status,
+        'assignment_id': assignment.id,
+        'service': assignment.service.name,
+        'client': assignment.client.get_full_name() or assignment.client.username,
+        'employee': assignment.employee.get_full_name() or assignment.employee.username,
+    }
+    if session.recurrence_id:
+        # Ocurrencia de una repetición: con id None se materializa antes de editarla
+        entry['recurrence_id'] = session.recurrence_id
+        entry['occurrence'] = session.occurrence.isoformat()
+    return entry
+
+
+def build_calendar(owner, start_date, end_date):
+    """Sesiones reales y virtuales de la ventana agrupadas por día local"""
+    start = timezone.make_aware(datetime.combine(start_date, time.min))
+    end = timezone.make_aware(datetime.combine(end_date, time.min))
+    days = {}
+    for session in sessions_between(owner.assignment_filter, start, end):
+        day = timezone.localtime(session.scheduled_date).date().isoformat()
+        days.setdefault(day, []).append(_session_entry(session))
+    return [{'date': day, 'sessions': sessions} for day, sessions in days.items()]
+
+
+def get_calendar(owner, start_date, end_date, version=None):
+    """build_calendar cacheado por (dueño, ventana) en el espacio del dueño"""
+    return owner.namespace.get_or_compute(
+        f'calendar:{owner.kind}:{start_date.isoformat()}:{end_date.isoformat()}',
+        lambda: build_calendar(owner, start_date, end_date),
+        version=version,
+    )
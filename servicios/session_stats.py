@@ -0,0 +1,229 @@
+"""
+Estadísticas materializadas de sesiones (por asignación y por cliente).
+
+Las señales de models.py crean las filas junto con cada asignación y las
+actualizan al crear, borrar o cambiar el estado de una sesión. Las escrituras masivas que no disparan señales (bulk_create,
+QuerySet.update) deben llamar a record_created o rebuild_assignments. El
+comando rebuild_session_stats las recalcula desde cero.
+
+Las ocurrencias pendientes de las repeticiones (recurrence.py) cuentan como
+sesiones programadas: materializar una no cambia el total, solo la mueve del
+contador de programadas al de su estado.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+# Estados que cuentan como sesión programada
+SCHEDULED_STATUSES = ('scheduled', 'confirmed')
+
+
+def status_bucket(status):
+    """Contador afectado por un estado: 'completed_sessions', 'scheduled_sessions' o None"""
+    if status == 'completed':
+        return 'completed_sessions'
+    if status in SCHEDULED_STATUSES:
+        return 'scheduled_sessions'
+    return None
+
+
+def _aggregate(sessions):
+    return sessions.aggregate(
+        total_sessions=Count('id'),
+        completed_sessions=Count('id', filter=Q(status='completed')),
+        scheduled_sessions=Count('id', filter=Q(status__in=SCHEDULED_STATUSES)),
+    )
+
+
+def _add_pending(values, recurrences):
+    """Sumar a values las ocurrencias pendientes de las repeticiones"""
+    from .recurrence import pending_counts
+
+    pending = sum(pending_counts(recurrences).values())
+    values['total_sessions'] += pending
+    values['scheduled_sessions'] += pending
+    return values
+
+
+def rebuild_assignment(assignment_id):
+    """Recalcular las estadísticas de una asignación desde la tabla de sesiones"""
+    from .models import AssignmentSessionStats, Session, SessionRecurrence
+
+    values = _add_pending(
+        _aggregate(Session.objects.filter(assignment_id=assignment_id)),
+        SessionRecurrence.objects.filter(assignment_id=assignment_id)
+    )
+    return AssignmentSessionStats.objects.update_or_create(assignment_id=assignment_id, defaults=values)[0]
+
+
+def rebuild_client(client_id):
+    """Recalcular las estadísticas de un cliente (todas sus asignaciones)"""
+    from .models import ClientSessionStats, Session, SessionRecurrence
+
+    values = _add_pending(
+        _aggregate(Session.objects.filter(assignment__client_id=client_id)),
+        SessionRecurrence.objects.filter(assignment__client_id=client_id)
+    )
+    return ClientSessionStats.objects.update_or_create(client_id=client_id, defaults=values)[0]
+
+
+def get_assignment_stats(assignment_id):
+    """Estadísticas de una asignación (lectura por clave primaria)"""
+    from .models import AssignmentSessionStats
+
+    stats = AssignmentSessionStats.objects.filter(assignment_id=assignment_id).first()
+    return stats or rebuild_assignment(assignment_id)
+
+
+def get_client_stats(client_id):
+    """Estadísticas de un cliente (lectura por clave primaria)"""
+    from .models import ClientSessionStats
+
+    stats = ClientSessionStats.objects.filter(client_id=client_id).first()
+    return stats or rebuild_client(client_id)
+
+
+def apply_delta(assignment_id, client_id, deltas):
+    """
+    Sumar deltas ({campo: n}) a las filas de la asignación y del cliente.
+
+    Las filas que todavía no existen se omiten: se calculan completas en la
+    primera lectura (get_assignment_stats / get_client_stats).
+    """
+    from .models import AssignmentSessionStats, ClientSessionStats
+
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    with transaction.atomic():
+        AssignmentSessionStats.objects.filter(assignment_id=assignment_id).update(**changes)
+        ClientSessionStats.objects.filter(client_id=client_id).update(**changes)
+
+
+def assignment_created(assignment):
+    """Crear las filas de una asignación nueva (y de su cliente si no existía)"""
+    from .models import AssignmentSessionStats, ClientSessionStats
+
+    AssignmentSessionStats.objects.get_or_create(assignment_id=assignment.id)
+    if not ClientSessionStats.objects.filter(client_id=assignment.client_id).exists():
+        rebuild_client(assignment.client_id)
+
+
+def _session_client_id(session):
+    from .models import ClientAssignment
+
+    if 'assignment' in session._state.fields_cache:
+        return session.assignment.client_id
+    return ClientAssignment.objects.filter(id=session.assignment_id).values_list('client_id', flat=True).first()
+
+
+def session_saved(session, created):
+    """Aplicar la creación o el cambio de estado de una sesión"""
+    deltas = {}
+    if created and session.recurrence_id:
+        # Ocurrencia materializada: ya se contaba como programada
+        deltas['scheduled_sessions'] = -1
+    elif created:
+        deltas['total_sessions'] = 1
+    else:
+        old_bucket = status_bucket(session._loaded_status)
+        if old_bucket:
+            deltas[old_bucket] = -1
+    new_bucket = status_bucket(session.status)
+    if new_bucket:
+        deltas[new_bucket] = deltas.get(new_bucket, 0) + 1
+    session._loaded_status = session.status
+    apply_delta(session.assignment_id, _session_client_id(session), deltas)
+
+
+def session_deleted(session):
+    """Descontar una sesión borrada (según el estado guardado en la base)"""
+    if session.recurrence_id:
+        # La ocurrencia vuelve a quedar pendiente
+        deltas = {'scheduled_sessions': 1}
+    else:
+        deltas = {'total_sessions': -1}
+    bucket = status_bucket(getattr(session, '_loaded_status', session.status))
+    if bucket:
+        deltas[bucket] = deltas.get(bucket, 0) - 1
+    apply_delta(session.assignment_id, _session_client_id(session), deltas)
+
+
+def record_created(sessions):
+    """Registrar sesiones creadas con bulk_create (no disparan señales)"""
+    from .models import ClientAssignment
+
+    deltas_by_assignment = {}
+    for session in sessions:
+        deltas = deltas_by_assignment.setdefault(session.assignment_id, {'total_sessions': 0})
+        if session.recurrence_id:
+            # Ocurrencia materializada: ya se contaba como programada
+            deltas['scheduled_sessions'] = deltas.get('scheduled_sessions', 0) - 1
+        else:
+            deltas['total_sessions'] += 1
+        bucket = status_bucket(session.status)
+        if bucket:
+            deltas[bucket] = deltas.get(bucket, 0) + 1
+
+    client_ids = dict(
+        ClientAssignment.objects.filter(id__in=deltas_by_assignment).values_list('id', 'client_id')
+    )
+    for assignment_id, deltas in deltas_by_assignment.items():
+        apply_delta(assignment_id, client_ids[assignment_id], deltas)
+
+
+def rebuild_assignments(assignment_ids):
+    """Recalcular asignaciones y sus clientes (tras un QuerySet.update de sesiones)"""
+    from .models import ClientAssignment
+
+    # Las asignaciones ya borradas (en cascada) no tienen estadísticas
+    rows = list(ClientAssignment.objects.filter(id__in=set(assignment_ids)).values_list('id', 'client_id'))
+    assignment_ids = {assignment_id for assignment_id, _ in rows}
+    client_ids = {client_id for _, client_id in rows}
+    with transaction.atomic():
+        for assignment_id in assignment_ids:
+            rebuild_assignment(assignment_id)
+        for client_id in client_ids:
+            rebuild_client(client_id)
+
+
+def rebuild_all():
+    """Recalcular todas las estadísticas con dos consultas agrupadas. Retorna (asignaciones, clientes)"""
+    from .models import AssignmentSessionStats, ClientAssignment, ClientSessionStats, SessionRecurrence
+    from .recurrence import pending_counts
+
+    counters = {
+        'total_sessions': Count('sessions'),
+        'completed_sessions': Count('sessions', filter=Q(sessions__status='completed')),
+        'scheduled_sessions': Count('sessions', filter=Q(sessions__status__in=SCHEDULED_STATUSES)),
+    }
+    assignment_rows = ClientAssignment.objects.order_by().values('id').annotate(**counters)
+    client_rows = ClientAssignment.objects.order_by().values('client_id').annotate(**counters)
+
+    pending = pending_counts(SessionRecurrence.objects.all())
+    pending_by_client = {}
+    for assignment_id, client_id in ClientAssignment.objects.filter(id__in=pending).values_list('id', 'client_id'):
+        pending_by_client[client_id] = pending_by_client.get(client_id, 0) + pending[assignment_id]
+
+    def with_pending(row, count):
+        row['total_sessions'] += count
+        row['scheduled_sessions'] += count
+        return row
+
+    with transaction.atomic():
+        AssignmentSessionStats.objects.all().delete()
+        ClientSessionStats.objects.all().delete()
+        AssignmentSessionStats.objects.bulk_create([
+            AssignmentSessionStats(
+                assignment_id=row['id'],
+                **{field: row[field] for field in counters}
+            )
+            for row in (with_pending(row, pending.get(row['id'], 0)) for row in assignment_rows)
+        ], batch_size=1000)
+        ClientSessionStats.objects.bulk_create([
+            ClientSessionStats(
+                client_id=row['client_id'],
+                **{field: row[field] for field in counters}
+            )
+            for row in (with_pending(row, pending_by_client.get(row['client_id'], 0)) for row in client_rows)
+        ], batch_size=1000)
+    return AssignmentSessionStats.objects.count(), ClientSessionStats.objects.count()
@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import cache_namespaces
+from .admin_views import SessionsWithPending, clients_with_stats
+from .bulk_sessions import cancel_sessions, shift_sessions
+from .cache_backends import SQLiteCache
+from .catalog import get_snapshot
+from .chat_archive import archive_older_than
+from .chat_events import (
+    get_broker, get_unread_state, publish_message, set_unread_totals, suggest_poll_interval, wait_for_change
+)
+from .chat_stream import STREAM_PATH, chat_event_stream, with_chat_stream
+from .conditional import client_details_etag
+from .models import (
+    AuditLog, ChatArchiveSegment, ChatConversation, ChatMessage, ClientAssignment, Customer, FileUpload, Order, Price,
+    Service, Session, SessionRecurrence
+)
+from .order_processing import FAILED, GENERATED, SKIPPED, _customer_groups, approvable_orders, process_order
+from .recurrence import bulk_create_sessions, create_recurrence, materialize, pending_sessions
+from .scheduling import BusyCalendar, book_on_day, employee_free_slots, free_slots
+from .search import search, tokenize
+from .session_calendar import CalendarOwner, get_calendar
+from .session_stats import get_assignment_stats, get_client_stats
+from .views import _get_employee_dashboard_data, allocate_username, generate_sessions_for_order
+
+
+def at(hour, minute=0, day=date(2030, 1, 7)):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class BusyCalendarTests(SimpleTestCase):
+    """Intervalos ocupados fusionados y búsqueda de horarios libres"""
+
+    def test_add_merges_overlapping_intervals(self):
+        calendar = BusyCalendar([(at(9), at(10))])
+        calendar.add(at(9, 30), at(11))
+        calendar.add(at(8), at(9, 15))
+        self.assertEqual(list(calendar), [(at(8), at(11))])
+
+    def test_add_merges_adjacent_intervals(self):
+        calendar = BusyCalendar([(at(9), at(10)), (at(11), at(12))])
+        calendar.add(at(10), at(11))
+        self.assertEqual(list(calendar), [(at(9), at(12))])
+
+    def test_add_keeps_separate_intervals_sorted(self):
+        calendar = BusyCalendar([(at(12), at(13))])
+        calendar.add(at(9), at(10))
+        calendar.add(at(15), at(16))
+        self.assertEqual(list(calendar), [(at(9), at(10)), (at(12), at(13)), (at(15), at(16))])
+
+    def test_adjacent_interval_is_free(self):
+        calendar = BusyCalendar([(at(9), at(10))])
+        self.assertTrue(calendar.is_free(at(10), at(11)))
+        self.assertTrue(calendar.is_free(at(8), at(9)))
+        self.assertEqual(calendar.conflict(at(9, 59), at(11)), (at(9), at(10)))
+
+    def test_next_free_skips_chained_conflicts(self):
+        # 9-10 y 10:30-11:30 no dejan una hora libre hasta las 11:30
+        calendar = BusyCalendar([(at(9), at(10)), (at(10, 30), at(11, 30)), (at(13), at(14))])
+        self.assertEqual(calendar.next_free(at(9, 15), timedelta(hours=1)), at(11, 30))
+        self.assertEqual(calendar.next_free(at(9, 15), timedelta(minutes=30)), at(10))
+        self.assertEqual(calendar.next_free(at(12), timedelta(hours=1)), at(12))
+
+
+class BookOnDayTests(SimpleTestCase):
+    """Reserva del primer horario libre de un día desde la hora preferida"""
+
+    def test_books_preferred_time_when_free(self):
+        calendar = BusyCalendar()
+        self.assertEqual(book_on_day(calendar, at(0).date(), time(9), 60), at(9))
+        self.assertFalse(calendar.is_free(at(9), at(10)))
+
+    def test_shifts_past_conflicts_within_the_day(self):
+        calendar = BusyCalendar([(at(9), at(10)), (at(10), at(11))])
+        self.assertEqual(book_on_day(calendar, at(0).date(), time(9), 60), at(11))
+        self.assertEqual(list(calendar), [(at(9), at(12))])
+
+    def test_returns_none_when_the_day_is_full(self):
+        day = at(0).date()
+        next_day = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        calendar = BusyCalendar([(at(20), next_day)])
+        self.assertIsNone(book_on_day(calendar, day, time(20), 60))
+        self.assertEqual(list(calendar), [(at(20), next_day)])
+
+
+class RecurrenceTests(TestCase):
+    """Reglas de repetición creadas por los generadores y materialización de ocurrencias"""
+
+    def setUp(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.assignment = ClientAssignment.objects.create(
+            client=User.objects.create_user('cliente'),
+            employee=User.objects.create_user('tutor'),
+            service=service
+        )
+
+    def test_create_recurrence_turns_skipped_days_into_exceptions(self):
+        # Lunes y miércoles a las 10: la serie saltó el lunes 14 y corrió el miércoles 16 a las 11
+        series = [at(10, day=date(2030, 1, 7)), at(10, day=date(2030, 1, 9)), at(11, day=date(2030, 1, 16))]
+        sessions = create_recurrence(self.assignment, series, [0, 2], time(10), 60)
+
+        recurrence = SessionRecurrence.objects.get()
+        self.assertEqual(recurrence.exceptions, ['2030-01-14'])
+        self.assertEqual(recurrence.until, date(2030, 1, 16))
+        self.assertEqual([session.scheduled_date for session in sessions], series)
+        # Solo la sesión corrida tiene fila, con su horario original como ocurrencia
+        self.assertEqual([session.pk is None for session in sessions], [True, True, False])
+        self.assertEqual(sessions[2].occurrence, at(10, day=date(2030, 1, 16)))
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_materialize_returns_existing_row(self):
+        recurrence = SessionRecurrence.objects.create(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9), count=3
+        )
+        occurrence = at(9, day=date(2030, 1, 14))
+        session, created = materialize(recurrence, occurrence)
+        self.assertTrue(created)
+        self.assertEqual(materialize(recurrence, occurrence), (session, False))
+
+    def test_concurrent_materialize_returns_the_other_row(self):
+        recurrence = SessionRecurrence.objects.create(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9), count=3
+        )
+        occurrence = at(9, day=date(2030, 1, 14))
+        session, _ = materialize(recurrence, occurrence)
+        # Otra petición la creó entre la lectura y el INSERT: este choca con la restricción única
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            again, created = materialize(recurrence, occurrence, status='completed')
+        self.assertFalse(created)
+        self.assertEqual(again.pk, session.pk)
+        self.assertEqual(again.status, 'scheduled')
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_materialize_rejects_dates_outside_the_rule(self):
+        recurrence = SessionRecurrence.objects.create(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9), count=3
+        )
+        with self.assertRaises(ValueError):
+            materialize(recurrence, at(9, day=date(2030, 1, 8)))
+
+    def test_unbounded_rule_is_rejected(self):
+        recurrence = SessionRecurrence(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9)
+        )
+        with self.assertRaises(ValueError):
+            recurrence.occurrences()
+        with self.assertRaises(ValidationError):
+            recurrence.save()
+
+
+class BulkCreateSessionsTests(TestCase):
+    """Inserción por lotes de las sesiones generadas"""
+
+    def setUp(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.assignment = ClientAssignment.objects.create(
+            client=User.objects.create_user('cliente'),
+            employee=User.objects.create_user('tutor'),
+            service=service
+        )
+
+    def test_ids_skip_existing_rows_with_the_same_key(self):
+        # Una sesión cancelada ocupa la misma clave (asignación, fecha) que una de las nuevas
+        cancelled = Session.objects.create(assignment=self.assignment, scheduled_date=at(9), status='cancelled')
+        sessions = [Session(assignment=self.assignment, scheduled_date=at(9, day=day))
+                    for day in (date(2030, 1, 7), date(2030, 1, 8), date(2030, 1, 9))]
+        with transaction.atomic():
+            bulk_create_sessions(sessions)
+
+        ids = [session.pk for session in sessions]
+        self.assertNotIn(None, ids)
+        self.assertNotIn(cancelled.pk, ids)
+        self.assertEqual(
+            sorted(ids), sorted(Session.objects.exclude(pk=cancelled.pk).values_list('pk', flat=True))
+        )
+        self.assertEqual(
+            [Session.objects.get(pk=session.pk).scheduled_date for session in sessions],
+            [session.scheduled_date for session in sessions]
+        )
+
+
+class LazyGenerationTests(TestCase):
+    """Órdenes generadas como reglas de repetición y lecturas que incluyen sus ocurrencias"""
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.employee = User.objects.create_user('tutor')
+        self.start = timezone.localdate() + timedelta(days=1)
+        # Ocupa la hora preferida del primer lunes de la serie: esa sesión se corre
+        self.first_monday = self.start + timedelta(days=(7 - self.start.weekday()) % 7 or 7)
+        self.other = ClientAssignment.objects.create(
+            client=User.objects.create_user('otro'), employee=self.employee, service=self.service
+        )
+        Session.objects.create(
+            assignment=self.other, scheduled_date=at(10, day=self.first_monday), duration_minutes=60
+        )
+        order = Order.objects.create(
+            customer=Customer.objects.create(name='Ana Pérez', email='ana@example.com', phone='1'),
+            service=self.service,
+            price=Price.objects.create(service=self.service, plan='mensual', price=Decimal('10')),
+            preferred_employee=self.employee,
+            preferred_days=['monday', 'thursday'],
+            preferred_time=time(10),
+            number_of_sessions=6,
+            start_date=self.start
+        )
+        self.result = generate_sessions_for_order(order)
+        self.assignment = ClientAssignment.objects.get(id=self.result['assignment_id'])
+
+    def test_generator_creates_a_rule_and_only_shifted_rows(self):
+        self.assertTrue(self.result['success'])
+        self.assertEqual(SessionRecurrence.objects.filter(assignment=self.assignment).count(), 1)
+        shifted = Session.objects.get(assignment=self.assignment)
+        self.assertEqual(shifted.scheduled_date, at(11, day=self.first_monday))
+        self.assertEqual(
+            [summary['id'] for summary in self.result['sessions']], [shifted.id, None, None, None, None, None]
+        )
+
+    def test_client_dashboard_lists_what_the_stats_count(self):
+        self.client.force_login(self.assignment.client)
+        response = self.client.get('/cliente/dashboard/')
+        stats = get_client_stats(self.assignment.client_id)
+        self.assertEqual(stats.total_sessions, 6)
+        self.assertEqual(len(response.context['sessions']), stats.total_sessions)
+        self.assertEqual(response.context['next_session'].scheduled_date, at(11, day=self.first_monday))
+
+    def test_employee_dashboard_uses_pending_occurrences(self):
+        request = RequestFactory().get('/', {'order_by': 'next_appointment'})
+        rows = _get_employee_dashboard_data(self.employee, request)['clients_data']
+        # La cita de 'otro' (10:00) va antes que la sesión corrida de la orden (11:00)
+        self.assertEqual([row['client'] for row in rows], [self.other.client, self.assignment.client])
+        self.assertEqual(rows[1]['next_appointment'], at(11, day=self.first_monday))
+        self.assertEqual(rows[1]['last_activity'], max(
+            session.scheduled_date for session in pending_sessions(SessionRecurrence.objects.all())
+        ))
+
+    def test_admin_sessions_pages_merge_rows_and_pending(self):
+        rows = Session.objects.order_by('-scheduled_date', '-id')
+        pending = pending_sessions(SessionRecurrence.objects.all())[::-1]
+        merged = sorted(list(rows) + pending, key=lambda session: session.scheduled_date, reverse=True)
+        items = SessionsWithPending(rows, pending)
+        self.assertEqual(items.count(), 7)
+        for start in range(7):
+            for stop in range(start + 1, 8):
+                self.assertEqual(
+                    [session.scheduled_date for session in items[start:stop]],
+                    [session.scheduled_date for session in merged[start:stop]]
+                )
+
+
+class ChatTestCase(TestCase):
+    """Una asignación con su cliente y su empleado, y atajos para las APIs de chat"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user('cliente', first_name='Ana', last_name='Pérez')
+        self.employee = User.objects.create_user('tutor')
+        self.assignment = ClientAssignment.objects.create(
+            client=self.client_user,
+            employee=self.employee,
+            service=Service.objects.create(name='Tutoría', slug='tutoria')
+        )
+
+    def send(self, user, text):
+        self.client.force_login(user)
+        response = self.client.post(
+            f'/api/chat/{self.assignment.id}/send/', json.dumps({'message': text}), content_type='application/json'
+        )
+        return response.json()['message']
+
+    def get_messages(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(f'/api/chat/{self.assignment.id}/messages/', params).json()
+
+
+class ChatConversationTests(ChatTestCase):
+    """Resumen desnormalizado de cada conversación para la bandeja de chat"""
+
+    def test_send_updates_preview_and_recipient_unread(self):
+        self.send(self.client_user, 'Hola')
+        self.send(self.client_user, 'x' * 80)
+        summary = ChatConversation.objects.get(assignment=self.assignment)
+        self.assertEqual(summary.last_message_preview, 'x' * ChatConversation.PREVIEW_LENGTH)
+        self.assertEqual(summary.last_sender, self.client_user)
+        self.assertEqual((summary.employee_unread_count, summary.client_unread_count), (2, 0))
+
+    def test_inbox_reads_the_summary(self):
+        self.send(self.employee, 'Bienvenida')
+        self.client.force_login(self.client_user)
+        conversations = self.client.get('/api/chat/conversations/').json()['conversations']
+        self.assertEqual(len(conversations), 1)
+        self.assertEqual(conversations[0]['unread_count'], 1)
+        self.assertEqual(conversations[0]['last_message'], 'Bienvenida')
+        self.assertEqual(conversations[0]['employee_id'], self.employee.id)
+
+        self.client.force_login(self.employee)
+        conversations = self.client.get('/api/chat/conversations/').json()['conversations']
+        self.assertEqual((conversations[0]['client_name'], conversations[0]['unread_count']), ('Ana Pérez', 0))
+
+
+class ChatPaginationTests(ChatTestCase):
+    """Páginas del historial por cursor (since_id / before_id)"""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.send(self.client_user, f'Mensaje {number}')['id'] for number in range(5)]
+
+    def test_latest_page_then_older_pages(self):
+        page = self.get_messages(self.employee, limit=2)
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[3:])
+        self.assertTrue(page['has_more'])
+
+        page = self.get_messages(self.employee, limit=2, before_id=page['oldest_id'])
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[1:3])
+        page = self.get_messages(self.employee, limit=2, before_id=page['oldest_id'])
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[:1])
+        self.assertFalse(page['has_more'])
+
+    def test_since_id_returns_only_newer_messages(self):
+        page = self.get_messages(self.employee, since_id=self.ids[2])
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[3:])
+        self.assertEqual(page['newest_id'], self.ids[-1])
+        self.assertEqual(self.get_messages(self.employee, since_id=self.ids[-1])['messages'], [])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.employee)
+        url = f'/api/chat/{self.assignment.id}/messages/'
+        self.assertEqual(self.client.get(url, {'since_id': 1, 'before_id': 2}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since_id': 'x'}).status_code, 400)
+
+
+class ChatReadWatermarkTests(ChatTestCase):
+    """Lectura registrada con la marca de cada participante, sin tocar los mensajes"""
+
+    def test_reading_advances_the_reader_watermark(self):
+        first = self.send(self.client_user, 'Uno')['id']
+        second = self.send(self.client_user, 'Dos')['id']
+        messages = self.get_messages(self.client_user)['messages']
+        self.assertEqual([message['is_read'] for message in messages], [False, False])
+
+        self.get_messages(self.employee)
+        summary = ChatConversation.objects.get(assignment=self.assignment)
+        self.assertEqual((summary.employee_last_read_id, summary.employee_unread_count), (second, 0))
+        # El remitente ve sus mensajes como leídos; las filas no se actualizan
+        messages = self.get_messages(self.client_user)['messages']
+        self.assertEqual([message['is_read'] for message in messages], [True, True])
+        self.assertFalse(ChatMessage.objects.filter(id__in=[first, second], is_read=True).exists())
+
+    def test_mark_read_before_newer_messages_recounts(self):
+        first = self.send(self.client_user, 'Uno')['id']
+        self.send(self.client_user, 'Dos')
+        self.send(self.client_user, 'Tres')
+        self.assertEqual(ChatConversation.mark_read(self.assignment, self.employee, first), 1)
+        summary = ChatConversation.objects.get(assignment=self.assignment)
+        self.assertEqual((summary.employee_last_read_id, summary.employee_unread_count), (first, 2))
+        # Una marca que no avanza no cambia nada
+        self.assertEqual(ChatConversation.mark_read(self.assignment, self.employee, first), 0)
+
+    def test_older_pages_do_not_mark_read(self):
+        first = self.send(self.client_user, 'Uno')['id']
+        self.send(self.client_user, 'Dos')
+        self.get_messages(self.employee, before_id=first + 1)
+        self.assertEqual(ChatConversation.objects.get(assignment=self.assignment).employee_unread_count, 2)
+
+
+class ChatStreamTests(SimpleTestCase):
+    """Stream SSE de eventos de chat servido delante de la aplicación Django"""
+
+    scope = {'type': 'http', 'path': STREAM_PATH, 'headers': []}
+
+    def run_stream(self, on_send):
+        """Correr el stream hasta que on_send(mensajes enviados) pida la desconexión"""
+        sent = []
+
+        async def run():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if on_send(sent):
+                    disconnected.set()
+
+            await asyncio.wait_for(chat_event_stream(self.scope, receive, send), timeout=5)
+
+        asyncio.run(run())
+        return sent
+
+    def test_anonymous_request_is_rejected(self):
+        sent = self.run_stream(lambda sent: False)
+        self.assertEqual(sent[0]['status'], 403)
+
+    def test_published_events_reach_the_stream(self):
+        user = User(id=7, username='cliente')
+
+        def on_send(sent):
+            if len(sent) == 2:
+                # Tras el evento inicial de no leídos, publicar como lo haría una vista
+                get_broker().publish(user.id, {'type': 'message', 'assignment_id': 3})
+            return len(sent) == 3
+
+        with mock.patch('servicios.chat_stream._get_user', return_value=user), \
+                mock.patch('servicios.chat_stream.get_unread_state', return_value=(4, None, 1)):
+            sent = self.run_stream(on_send)
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertEqual(sent[1]['body'], b'event: unread\ndata: {"type": "unread", "unread_count": 4}\n\n')
+        self.assertTrue(sent[2]['body'].startswith(b'event: message\n'))
+        self.assertFalse(get_broker().has_subscribers(user.id))
+
+    def test_other_paths_go_to_django(self):
+        calls = []
+
+        async def django_application(scope, receive, send):
+            calls.append(scope['path'])
+
+        asyncio.run(with_chat_stream(django_application)({'type': 'http', 'path': '/'}, None, None))
+        self.assertEqual(calls, ['/'])
+
+
+class ChatLongPollTests(ChatTestCase):
+    """Long-polling de mensajes y no leídos, e intervalo de poll sugerido"""
+
+    def test_poll_interval_follows_activity(self):
+        now = timezone.now()
+        self.assertEqual(suggest_poll_interval(now - timedelta(seconds=30)), 3000)
+        self.assertEqual(suggest_poll_interval(now - timedelta(minutes=10)), 10000)
+        self.assertEqual(suggest_poll_interval(now - timedelta(days=1)), 30000)
+        self.assertEqual(suggest_poll_interval(None), 30000)
+        self.assertEqual(suggest_poll_interval(now, minimum=10000), 10000)
+
+    def test_wait_for_change_returns_when_the_version_moves(self):
+        versions = iter([1, 1, 2])
+        with self.settings(CHAT_LONG_POLL_INTERVAL=0):
+            self.assertTrue(wait_for_change(lambda: next(versions), 1, 5))
+            self.assertFalse(wait_for_change(lambda: 1, 1, 0.01))
+
+    @override_settings(CHAT_LONG_POLL_TIMEOUT=10)
+    def test_waits_only_without_newer_messages(self):
+        last = self.send(self.client_user, 'Hola')['id']
+        with mock.patch('servicios.chat_views.wait_for_change') as wait:
+            page = self.get_messages(self.employee, since_id=last - 1, wait=30)
+        wait.assert_not_called()
+        self.assertEqual(len(page['messages']), 1)
+
+        with mock.patch('servicios.chat_views.wait_for_change') as wait:
+            page = self.get_messages(self.employee, since_id=last, wait=30)
+        # La espera se limita a CHAT_LONG_POLL_TIMEOUT y se puede volver a consultar de inmediato
+        self.assertEqual(wait.call_args[0][2], 10)
+        self.assertEqual((page['messages'], page['poll_interval']), ([], 0))
+
+    @override_settings(CHAT_LONG_POLL_TIMEOUT=0)
+    def test_long_poll_can_be_disabled(self):
+        with mock.patch('servicios.chat_views.wait_for_change') as wait:
+            page = self.get_messages(self.employee, since_id=0, wait=30)
+        wait.assert_not_called()
+        self.assertGreater(page['poll_interval'], 0)
+
+
+class ChatUnreadCounterTests(ChatTestCase):
+    """Total de no leídos de cada usuario cacheado para el badge"""
+
+    def test_counter_follows_sends_and_reads_without_queries(self):
+        self.assertEqual(get_unread_state(self.employee)[0], 0)
+        message = ChatMessage.objects.get(id=self.send(self.client_user, 'Hola')['id'])
+        publish_message(message)
+        with self.assertNumQueries(0):
+            unread_count, last_activity, _ = get_unread_state(self.employee)
+        self.assertEqual((unread_count, last_activity), (1, message.created_at))
+
+        self.get_messages(self.employee)
+        self.assertEqual(get_unread_state(self.employee)[0], 0)
+
+    def test_badge_endpoint_reports_the_counter(self):
+        self.send(self.client_user, 'Hola')
+        self.client.force_login(self.employee)
+        data = self.client.get('/api/chat/unread-count/').json()
+        self.assertEqual(data['unread_count'], 1)
+        self.assertEqual(data['poll_interval'], 10000)
+
+    def test_reconcile_command_fixes_drift(self):
+        self.send(self.client_user, 'Hola')
+        set_unread_totals({self.employee.id: 9, self.client_user.id: 4})
+        call_command('reconcile_chat_unread', stdout=StringIO())
+        self.assertEqual(get_unread_state(self.employee)[0], 1)
+        self.assertEqual(get_unread_state(self.client_user)[0], 0)
+
+
+class ChatSearchTests(ChatTestCase):
+    """Índice invertido propio y ranking de la búsqueda de chat y archivos"""
+
+    def message(self, text, sender=None):
+        return ChatMessage.objects.create(assignment=self.assignment, sender=sender or self.client_user, message=text)
+
+    def test_tokenize_normalizes_and_drops_stopwords(self):
+        self.assertEqual(tokenize('La Sesión de ÁLGEBRA, y a las 10'), ['sesion', 'algebra', '10'])
+
+    def test_more_matched_terms_rank_first_then_frequency(self):
+        one_term = self.message('Repasamos fracciones')
+        repeated = self.message('Fracciones, fracciones y más fracciones')
+        both_terms = self.message('Fracciones y decimales para el viernes')
+        results, total, terms = search(self.employee, 'fracciones decimales')
+        self.assertEqual(terms, ['fracciones', 'decimales'])
+        self.assertEqual(total, 3)
+        self.assertEqual([result['message_id'] for result in results], [both_terms.id, repeated.id, one_term.id])
+
+    def test_results_stay_within_the_user_assignments(self):
+        self.message('Tarea de geometría')
+        outsider = User.objects.create_user('otro')
+        self.assertEqual(search(outsider, 'geometria'), ([], 0, ['geometria']))
+
+    def test_api_returns_messages_and_files_with_snippets(self):
+        self.message('Mañana vemos el informe de lectura')
+        FileUpload.objects.create(
+            assignment=self.assignment, uploaded_by=self.employee, file='uploads/informe.pdf',
+            file_name='informe.pdf', file_size=10, description='Informe trimestral'
+        )
+        self.client.force_login(self.client_user)
+        data = self.client.get('/api/chat/search/', {'q': 'informe'}).json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual({result['type'] for result in data['results']}, {'message', 'file'})
+        self.assertIn('informe', data['results'][0]['snippet'].lower())
+
+    def test_only_content_changes_reindex(self):
+        message = self.message('Texto original')
+        with mock.patch('servicios.search.index_message') as index:
+            message.mark_as_read()
+            ChatMessage.objects.get(id=message.id).save()
+        index.assert_not_called()
+
+        message.message = 'Texto corregido'
+        message.save()
+        self.assertEqual(search(self.employee, 'corregido')[1], 1)
+        self.assertEqual(search(self.employee, 'original')[1], 0)
+
+
+class ChatArchiveTests(ChatTestCase):
+    """Mensajes antiguos movidos a segmentos comprimidos y leídos de vuelta"""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.send(self.client_user, f'Mensaje número {number}')['id'] for number in range(5)]
+        ChatMessage.objects.update(created_at=timezone.now() - timedelta(days=400))
+
+    def test_archive_round_trip(self):
+        # Ambos participantes leyeron todo
+        self.get_messages(self.employee)
+        self.get_messages(self.client_user)
+        self.assertEqual(archive_older_than(180, segment_size=2), 5)
+        self.assertFalse(ChatMessage.objects.exists())
+        self.assertEqual(ChatArchiveSegment.objects.count(), 3)
+
+        page = self.get_messages(self.employee, limit=3)
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[2:])
+        self.assertEqual(page['messages'][0]['sender_name'], 'Ana Pérez')
+        page = self.get_messages(self.employee, limit=3, before_id=page['oldest_id'])
+        self.assertEqual([message['id'] for message in page['messages']], self.ids[:2])
+        self.assertFalse(page['has_more'])
+
+        # La búsqueda sigue encontrando los mensajes archivados
+        self.client.force_login(self.employee)
+        results = self.client.get('/api/chat/search/', {'q': 'numero'}).json()['results']
+        self.assertEqual(sorted(result['id'] for result in results), self.ids)
+
+    def test_unread_and_recent_messages_stay(self):
+        # El empleado leyó hasta el tercero; el cliente, todo lo suyo
+        ChatConversation.mark_read(self.assignment, self.employee, self.ids[2])
+        ChatConversation.mark_read(self.assignment, self.client_user, self.ids[-1])
+        ChatMessage.objects.filter(id=self.ids[0]).update(created_at=timezone.now())
+        self.assertEqual(archive_older_than(180), 2)
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True).order_by('id')), [
+            self.ids[0], self.ids[3], self.ids[4]
+        ])
+
+
+class EmployeeDashboardTestCase(TestCase):
+    """Un empleado con clientes asignados y atajo para los datos de su dashboard"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.employee = User.objects.create_user('tutor')
+
+    def assign(self, username, employee=None, **fields):
+        return ClientAssignment.objects.create(
+            client=User.objects.create_user(username, **fields),
+            employee=employee or self.employee,
+            service=self.service
+        )
+
+    def dashboard(self, **params):
+        request = RequestFactory().get('/', params)
+        return _get_employee_dashboard_data(self.employee, request)
+
+
+class EmployeeDashboardStatsTests(EmployeeDashboardTestCase):
+    """Estadísticas por cliente del dashboard del empleado en una consulta agrupada"""
+
+    def test_stats_cover_all_assignments_of_the_client(self):
+        assignment = self.assign('ana')
+        other = ClientAssignment.objects.create(
+            client=assignment.client, employee=User.objects.create_user('psicologo'), service=self.service
+        )
+        Session.objects.create(assignment=assignment, scheduled_date=at(9, day=date(2020, 1, 6)), status='completed')
+        Session.objects.create(assignment=other, scheduled_date=at(9, day=date(2020, 1, 7)), status='completed')
+        upcoming = Session.objects.create(assignment=other, scheduled_date=timezone.now() + timedelta(days=2))
+        FileUpload.objects.create(
+            assignment=other, uploaded_by=other.employee, file='uploads/tarea.pdf', file_name='tarea.pdf', file_size=1
+        )
+
+        row, = self.dashboard()['clients_data']
+        self.assertEqual((row['total_sessions'], row['completed_sessions'], row['progress']), (3, 2, 66.7))
+        self.assertEqual(row['next_appointment'], upcoming.scheduled_date)
+        self.assertEqual(row['recent_files_count'], 1)
+
+    def test_query_count_does_not_grow_with_clients(self):
+        self.assign('ana')
+        with CaptureQueriesContext(connection) as few:
+            self.dashboard()
+        for number in range(5):
+            assignment = self.assign(f'cliente{number}')
+            Session.objects.create(assignment=assignment, scheduled_date=timezone.now() + timedelta(days=number + 1))
+        with CaptureQueriesContext(connection) as many:
+            data = self.dashboard()
+        self.assertEqual(len(data['clients_data']), 6)
+        self.assertEqual(len(many), len(few))
+
+
+class EmployeeDashboardSearchTests(EmployeeDashboardTestCase):
+    """Búsqueda, orden y paginación del dashboard del empleado en la base de datos"""
+
+    def setUp(self):
+        super().setUp()
+        self.assign('mgarcia', first_name='María', last_name='García', email='maria@example.com')
+        self.assign('jlopez', first_name='Juan', last_name='López', email='juan@correo.com')
+        self.assign('zeta')
+
+    def usernames(self, **params):
+        return [row['client'].username for row in self.dashboard(**params)['clients_data']]
+
+    def test_search_matches_substrings_of_name_username_and_email(self):
+        self.assertEqual(self.usernames(search='ía Gar'), ['mgarcia'])
+        self.assertEqual(self.usernames(search='LOPEZ'), ['jlopez'])
+        self.assertEqual(self.usernames(search='correo'), ['jlopez'])
+        self.assertEqual(self.usernames(search='nadie'), [])
+
+    def test_sort_by_name_uses_username_without_full_name(self):
+        self.assertEqual(self.usernames(order_by='name'), ['jlopez', 'mgarcia', 'zeta'])
+        # Un orden desconocido vuelve al de actividad reciente
+        self.assertEqual(self.dashboard(order_by='x')['order_by'], 'recent_activity')
+
+    def test_pages_come_from_the_database(self):
+        with mock.patch('servicios.views.EMPLOYEE_CLIENTS_PAGE_SIZE', 2):
+            first = self.dashboard(order_by='name')
+            second = self.dashboard(order_by='name', page=2)
+        self.assertEqual(first['total_clients'], 3)
+        self.assertEqual([row['client'].username for row in first['clients_data']], ['jlopez', 'mgarcia'])
+        self.assertEqual([row['client'].username for row in second['clients_data']], ['zeta'])
+
+
+class SessionStatsTests(TestCase):
+    """Contadores de sesiones materializados por asignación y por cliente"""
+
+    def setUp(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        client = User.objects.create_user('cliente')
+        self.assignment = ClientAssignment.objects.create(
+            client=client, employee=User.objects.create_user('tutor'), service=service
+        )
+        self.other = ClientAssignment.objects.create(
+            client=client, employee=User.objects.create_user('psicologo'), service=service
+        )
+
+    def counters(self, stats):
+        return stats.total_sessions, stats.completed_sessions, stats.scheduled_sessions
+
+    def test_signals_follow_creation_status_changes_and_deletion(self):
+        session = Session.objects.create(assignment=self.assignment, scheduled_date=at(9))
+        Session.objects.create(assignment=self.other, scheduled_date=at(11), status='cancelled')
+        self.assertEqual(self.counters(get_assignment_stats(self.assignment.id)), (1, 0, 1))
+        self.assertEqual(self.counters(get_client_stats(self.assignment.client_id)), (2, 0, 1))
+
+        session.status = 'completed'
+        session.save()
+        self.assertEqual(self.counters(get_client_stats(self.assignment.client_id)), (2, 1, 0))
+        self.assertEqual(get_client_stats(self.assignment.client_id).progress, 50.0)
+
+        session.delete()
+        self.assertEqual(self.counters(get_assignment_stats(self.assignment.id)), (0, 0, 0))
+        self.assertEqual(self.counters(get_client_stats(self.assignment.client_id)), (1, 0, 0))
+
+    def test_bulk_inserts_are_recorded(self):
+        bulk_create_sessions([
+            Session(assignment=self.assignment, scheduled_date=at(hour), status=status)
+            for hour, status in ((9, 'scheduled'), (10, 'completed'), (11, 'no_show'))
+        ])
+        self.assertEqual(self.counters(get_assignment_stats(self.assignment.id)), (3, 1, 1))
+
+    def test_incremental_counters_match_a_rebuild(self):
+        for hour, status in ((9, 'scheduled'), (10, 'completed'), (11, 'confirmed')):
+            Session.objects.create(assignment=self.assignment, scheduled_date=at(hour), status=status)
+        Session.objects.filter(status='confirmed').get().delete()
+        before = self.counters(get_client_stats(self.assignment.client_id))
+        call_command('rebuild_session_stats', stdout=StringIO())
+        self.assertEqual(self.counters(get_client_stats(self.assignment.client_id)), before)
+
+    def test_reading_stats_is_a_primary_key_lookup(self):
+        get_client_stats(self.assignment.client_id)
+        with self.assertNumQueries(1):
+            get_client_stats(self.assignment.client_id)
+
+
+class AdminSectionTests(TestCase):
+    """Pestañas del dashboard de administración paginadas y filtradas en la base"""
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Tutoría', slug='tutoria')
+        employee = User.objects.create_user('tutor')
+        for index in range(5):
+            ClientAssignment.objects.create(
+                client=User.objects.create_user(f'cliente{index}'), employee=employee,
+                service=self.service, is_active=index % 2 == 0
+            )
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+
+    def section(self, section, **params):
+        return self.client.get(f'/admin/api/{section}/', params)
+
+    def test_pages_report_total_and_next(self):
+        first = self.section('asignaciones', page_size=2).json()
+        self.assertEqual((first['total'], first['has_next']), (5, True))
+        self.assertEqual(first['html'].count('<tr'), 2)
+        last = self.section('asignaciones', page_size=2, page=3).json()
+        self.assertEqual((last['has_next'], last['html'].count('<tr')), (False, 1))
+        beyond = self.section('asignaciones', page_size=2, page=4).json()
+        self.assertEqual((beyond['success'], beyond['html']), (True, ''))
+
+    def test_filters_apply_to_the_query(self):
+        data = self.section('asignaciones', estado='activa', q='cliente').json()
+        self.assertEqual(data['total'], 3)
+        self.assertNotIn('cliente1', data['html'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.section('desconocida').status_code, 404)
+        self.assertEqual(self.section('asignaciones', page='x').status_code, 400)
+        self.assertEqual(self.section('asignaciones', estado='borrada').status_code, 400)
+        self.assertEqual(self.section('sesiones', fecha_desde='07/01/2030').status_code, 400)
+
+    def test_only_admins(self):
+        self.client.force_login(User.objects.create_user('curioso'))
+        self.assertEqual(self.section('asignaciones').status_code, 302)
+
+
+class ClientsWithStatsTests(TestCase):
+    """Contadores de la pestaña de clientes sin multiplicar filas"""
+
+    def test_counters_are_independent(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        client = User.objects.create_user('cliente')
+        client.groups.add(Group.objects.create(name='Cliente'))
+        assignments = [
+            ClientAssignment.objects.create(
+                client=client, employee=User.objects.create_user(username), service=service, is_active=active
+            )
+            for username, active in (('tutor', True), ('psicologo', True), ('antiguo', False))
+        ]
+        for hour in (9, 10, 11):
+            Session.objects.create(assignment=assignments[0], scheduled_date=at(hour))
+        for index in range(2):
+            FileUpload.objects.create(
+                assignment=assignments[1], uploaded_by=client, file=f'uploads/{index}.pdf',
+                file_name=f'{index}.pdf', file_size=1
+            )
+        for action in ('login', 'logout', 'login', 'logout'):
+            AuditLog.objects.create(user=client, action=action, description=action)
+
+        with self.assertNumQueries(2):
+            row = list(clients_with_stats())[0]
+        self.assertEqual(
+            (row.active_assignments_count, row.total_sessions, row.files_count, row.audit_count),
+            (2, 3, 2, 4)
+        )
+        self.assertEqual(len(row.active_assignments), 2)
+
+
+def run_on_commit_now():
+    """Ejecutar en el acto los callbacks de on_commit (TestCase nunca confirma)"""
+    return mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+
+
+class CacheNamespaceTests(TestCase):
+    """Invalidación por versión de espacios de nombres de la caché"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidate_only_drops_the_namespace(self):
+        first, second = cache_namespaces.user(1), cache_namespaces.user(2)
+        first.set('inbox', 'a')
+        second.set('inbox', 'b')
+        cache.set(first.state_key('chat_unread'), 3)
+        cache.set('rl:contador', 5)
+
+        first.invalidate()
+        self.assertIsNone(first.get('inbox'))
+        self.assertEqual(second.get('inbox'), 'b')
+        self.assertEqual(cache.get(first.state_key('chat_unread')), 3)
+        self.assertEqual(cache.get('rl:contador'), 5)
+
+    def test_lost_version_never_reuses_an_old_one(self):
+        namespace = cache_namespaces.catalog
+        namespace.set('services', 'viejo')
+        namespace.invalidate()
+        cache.delete(namespace.version_key)
+        # La versión nueva sale del reloj, que avanzó desde la anterior
+        with mock.patch('servicios.cache_namespaces.time.time', return_value=time_module.time() + 1):
+            self.assertIsNone(namespace.get('services'))
+
+    def test_versions_reads_several_namespaces(self):
+        namespaces = [cache_namespaces.user(1), cache_namespaces.assignment(1)]
+        expected = [namespace.version() for namespace in namespaces]
+        with mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            self.assertEqual(cache_namespaces.versions(namespaces), expected)
+        get.assert_not_called()
+
+    def test_model_signals_invalidate_their_namespaces(self):
+        catalog, groups = cache_namespaces.catalog, cache_namespaces.groups
+        catalog.set('services', 'viejo')
+        groups.set('all', 'viejo')
+        with run_on_commit_now():
+            service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.assertIsNone(catalog.get('services'))
+        Group.objects.create(name='Cliente')
+        self.assertIsNone(groups.get('all'))
+
+        client, employee = User.objects.create_user('cliente'), User.objects.create_user('tutor')
+        assignment = ClientAssignment.objects.create(client=client, employee=employee, service=service)
+        cache_namespaces.user(employee.id).set('inbox', 'viejo')
+        cache_namespaces.assignment(assignment.id).set('files', 'viejo')
+        with run_on_commit_now():
+            Session.objects.create(assignment=assignment, scheduled_date=at(9))
+        self.assertIsNone(cache_namespaces.user(employee.id).get('inbox'))
+        self.assertIsNone(cache_namespaces.assignment(assignment.id).get('files'))
+
+    def test_login_does_not_invalidate(self):
+        client = User.objects.create_user('cliente')
+        namespace = cache_namespaces.user(client.id)
+        namespace.set('inbox', 'vigente')
+        with run_on_commit_now():
+            client.last_login = timezone.now()
+            client.save(update_fields=['last_login'])
+        self.assertEqual(namespace.get('inbox'), 'vigente')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """Backend de caché compartido sobre un archivo SQLite"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = f'{directory.name}/cache.sqlite3'
+        self.cache = self.open()
+
+    def open(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        self.assertTrue(self.cache.add('a', 1))
+        self.assertFalse(self.cache.add('a', 2))
+        self.cache.set_many({'b': [2], 'c': {'x': 3}})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd']), {'a': 1, 'b': [2], 'c': {'x': 3}})
+        self.assertEqual(self.cache.incr('a', 4), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('d')
+        self.assertTrue(self.cache.delete('a'))
+        self.assertFalse(self.cache.has_key('a'))
+
+    def test_expired_entries_are_missing(self):
+        self.cache.set('a', 1, timeout=60)
+        with mock.patch('servicios.cache_backends.time.time', return_value=time_module.time() + 61):
+            self.assertIsNone(self.cache.get('a'))
+            self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_instances_share_the_file(self):
+        self.cache.set('catalog:version', 7)
+        other = self.open()
+        self.assertEqual(other.incr('catalog:version'), 8)
+        self.assertEqual(self.cache.get('catalog:version'), 8)
+
+    def test_concurrent_increments_are_atomic(self):
+        self.cache.set('contador', 0)
+
+        def increment():
+            cache = self.open()
+            for _ in range(25):
+                cache.incr('contador')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('contador'), 100)
+
+    def test_cull_keeps_max_entries(self):
+        cache = self.open(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        with mock.patch('servicios.cache_backends.CULL_EVERY', 1):
+            for index in range(20):
+                cache.set(f'k{index}', index)
+        count = cache._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        self.assertLessEqual(count, 11)
+
+
+class CatalogPageTests(TestCase):
+    """Páginas públicas servidas desde la instantánea del catálogo"""
+
+    def setUp(self):
+        cache.clear()
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.price = Price.objects.create(service=service, plan='Plan Básico', price=Decimal('20'))
+        Price.objects.create(service=service, plan='Plan Intensivo', price=Decimal('10'))
+
+    def test_snapshot_orders_prices_and_is_reused(self):
+        snapshot = get_snapshot()
+        self.assertEqual([price.plan for price in snapshot.prices('tutoria')], ['Plan Intensivo', 'Plan Básico'])
+        self.assertEqual(snapshot.prices('terapia'), ())
+        with self.assertNumQueries(0):
+            self.assertIs(get_snapshot(), snapshot)
+
+    def test_anonymous_page_is_cached_until_the_catalog_changes(self):
+        self.assertContains(self.client.get('/tutoria/'), 'Plan Básico')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/tutoria/'), 'Plan Básico')
+
+        with run_on_commit_now():
+            self.price.plan = 'Plan Mensual'
+            self.price.save()
+        response = self.client.get('/tutoria/')
+        self.assertContains(response, 'Plan Mensual')
+        self.assertNotContains(response, 'Plan Básico')
+
+
+class GetOrComputeTests(SimpleTestCase):
+    """Llenado de la caché con un solo cálculo a la vez"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='valor', delay=0):
+        def run():
+            self.calls += 1
+            time_module.sleep(delay)
+            return value
+        return run
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        compute = self.compute(delay=0.3)
+        threads = [
+            threading.Thread(target=lambda: results.append(cache_namespaces.get_or_compute('clave', compute)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['valor'] * 4)
+        self.assertEqual(self.calls, 1)
+
+    def test_soft_timeout_serves_stale_value_while_refreshing(self):
+        cache_namespaces.get_or_compute('clave', self.compute('viejo'), soft_timeout=60)
+        later = time_module.time() + 61
+        with mock.patch('servicios.cache_namespaces.time.time', return_value=later), \
+                mock.patch('servicios.cache_namespaces._refresh_in_background') as refresh:
+            self.assertEqual(cache_namespaces.get_or_compute('clave', self.compute('nuevo'), soft_timeout=60), 'viejo')
+            # El segundo llamador no lanza otro refresco mientras el primero tiene el bloqueo
+            cache_namespaces.get_or_compute('clave', self.compute('nuevo'), soft_timeout=60)
+        refresh.assert_called_once()
+
+    def test_waiters_compute_if_the_filler_never_finishes(self):
+        cache.add('clave:filling', 1)
+        with mock.patch('servicios.cache_namespaces.FILL_WAIT', 0.1):
+            self.assertEqual(cache_namespaces.get_or_compute('clave', self.compute()), 'valor')
+        self.assertEqual(self.calls, 1)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag y respuestas 304 de los endpoints JSON de los dashboards"""
+
+    def setUp(self):
+        cache.clear()
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.client_user = User.objects.create_user('cliente', first_name='Ana')
+        self.employee = User.objects.create_user('tutor')
+        self.assignment = ClientAssignment.objects.create(
+            client=self.client_user, employee=self.employee, service=service
+        )
+        self.url = f'/api/client/{self.client_user.id}/details/'
+        self.client.force_login(self.employee)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_details_answer_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(self.url, response).status_code, 304)
+
+    def test_client_changes_invalidate_the_etag(self):
+        response = self.client.get(self.url)
+        with run_on_commit_now():
+            self.client_user.first_name = 'Beatriz'
+            self.client_user.save()
+        fresh = self.revalidate(self.url, response)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()['client']['name'], 'Beatriz')
+
+        with run_on_commit_now():
+            Session.objects.create(assignment=self.assignment, scheduled_date=at(9))
+        self.assertEqual(self.revalidate(self.url, fresh).status_code, 200)
+
+    def test_passing_the_next_appointment_changes_the_etag(self):
+        Session.objects.create(assignment=self.assignment, scheduled_date=at(9))
+        request = RequestFactory().get(self.url)
+        request.user = self.employee
+        etags = []
+        for now in (at(8), at(8, 30), at(10)):
+            with mock.patch('django.utils.timezone.now', return_value=now):
+                etags.append(client_details_etag(request, self.client_user.id))
+        self.assertEqual(etags[0], etags[1])
+        self.assertNotEqual(etags[1], etags[2])
+
+    def test_strangers_are_never_validated(self):
+        self.client.force_login(User.objects.create_user('curioso'))
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_assignment_files_follow_uploads(self):
+        url = f'/api/assignment/{self.assignment.id}/files/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        with run_on_commit_now():
+            FileUpload.objects.create(
+                assignment=self.assignment, uploaded_by=self.employee, file='uploads/guia.pdf',
+                file_name='guia.pdf', file_size=1
+            )
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class OrderGenerationTests(TestCase):
+    """Generación de las sesiones de una orden en una sola transacción"""
+
+    def setUp(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.order = Order.objects.create(
+            customer=Customer.objects.create(name='Ana Pérez', email='ana@example.com', phone='1'),
+            service=service,
+            price=Price.objects.create(service=service, plan='mensual', price=Decimal('10')),
+            preferred_employee=User.objects.create_user('tutor'),
+            preferred_days=['monday'],
+            preferred_time=time(10),
+            number_of_sessions=4,
+            start_date=date(2030, 1, 6)
+        )
+
+    def test_allocate_username_ignores_case(self):
+        User.objects.create_user('Ana')
+        User.objects.create_user('ana1')
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_username('ana'), 'ana2')
+
+    def test_failure_leaves_nothing_behind(self):
+        with mock.patch('servicios.views.create_recurrence', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                generate_sessions_for_order(self.order)
+        self.assertFalse(User.objects.filter(email='ana@example.com').exists())
+        self.assertFalse(ClientAssignment.objects.exists())
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.sessions_generated)
+
+    def test_existing_account_is_reused_once(self):
+        account = User.objects.create_user('ana', email='ANA@example.com')
+        result = generate_sessions_for_order(self.order)
+        self.assertEqual(result['client_username'], 'ana')
+        self.assertEqual(ClientAssignment.objects.get().client, account)
+        self.assertEqual(get_client_stats(account.id).total_sessions, 4)
+
+        stale = Order.objects.get(pk=self.order.pk)
+        stale.sessions_generated = False
+        self.assertFalse(generate_sessions_for_order(stale)['success'])
+        self.assertEqual(SessionRecurrence.objects.count(), 1)
+
+
+class PendingOrderProcessingTests(TransactionTestCase):
+    """Procesamiento en lote de las órdenes pendientes (hilos con su propia conexión)"""
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.price = Price.objects.create(service=self.service, plan='mensual', price=Decimal('10'))
+        self.employee = User.objects.create_user('tutor')
+
+    def order(self, email, **fields):
+        values = {
+            'preferred_employee': self.employee,
+            'preferred_days': ['monday'],
+            'preferred_time': time(10),
+            'number_of_sessions': 2,
+            'start_date': date(2030, 1, 6),
+            **fields,
+        }
+        return Order.objects.create(
+            customer=Customer.objects.create(name='Ana Pérez', email=email, phone='1'),
+            service=self.service, price=self.price, **values
+        )
+
+    def test_only_complete_orders_are_approvable(self):
+        ready = self.order('ana@example.com')
+        self.order('beto@example.com', preferred_employee=None)
+        self.order('carla@example.com', preferred_days=[])
+        self.assertEqual(list(approvable_orders()), [ready])
+
+    def test_orders_of_a_customer_share_a_worker(self):
+        first = self.order('ana@example.com')
+        other = self.order('beto@example.com')
+        second = self.order('ANA@example.com', preferred_time=time(12))
+        self.assertEqual(_customer_groups([first.id, other.id, second.id]), [[first.id, second.id], [other.id]])
+
+    def test_command_generates_once_and_reruns_are_noops(self):
+        self.order('ana@example.com')
+        self.order('ANA@example.com', preferred_time=time(12))
+        self.order('beto@example.com', preferred_days=['tuesday'])
+        output = StringIO()
+        call_command('process_pending_orders', '--workers', '2', stdout=output)
+        self.assertIn('Generadas: 3', output.getvalue())
+        # Las dos órdenes de Ana comparten su usuario
+        self.assertEqual(User.objects.filter(email__iexact='ana@example.com').count(), 1)
+        self.assertEqual(SessionRecurrence.objects.count(), 3)
+
+        output = StringIO()
+        call_command('process_pending_orders', stdout=output)
+        self.assertIn('No hay órdenes pendientes', output.getvalue())
+
+    def test_outcomes_of_a_single_order(self):
+        order = self.order('ana@example.com')
+        admin = User.objects.create_user('admin', is_staff=True)
+        with mock.patch('servicios.views.create_recurrence', side_effect=RuntimeError('sin conexión')):
+            self.assertEqual(process_order(order.id, admin).outcome, FAILED)
+        self.assertFalse(AuditLog.objects.exists())
+
+        self.assertEqual(process_order(order.id, admin).outcome, GENERATED)
+        self.assertEqual(AuditLog.objects.get().related_object_id, order.id)
+        self.assertEqual(process_order(order.id, admin).outcome, SKIPPED)
+
+
+class FreeSlotsTests(TestCase):
+    """Horarios libres por empleado y la API de disponibilidad"""
+
+    def setUp(self):
+        cache.clear()
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        group = Group.objects.create(name='Tutor')
+        self.busy, self.free = User.objects.create_user('ocupado'), User.objects.create_user('libre')
+        for employee in (self.busy, self.free):
+            employee.groups.add(group)
+        self.assignment = ClientAssignment.objects.create(
+            client=User.objects.create_user('cliente'), employee=self.busy, service=service
+        )
+
+    def test_slots_skip_busy_time_and_align_to_the_step(self):
+        calendar = BusyCalendar([(at(8), at(9, 10)), (at(10, 30), at(19, 30))])
+        tomorrow = date(2030, 1, 8)
+        # 19:30 no alcanza para una hora antes del cierre de la jornada
+        self.assertEqual(
+            free_slots(calendar, at(7), at(10, day=tomorrow), 60, 5),
+            [at(9, 30), at(8, day=tomorrow), at(9, day=tomorrow)]
+        )
+        self.assertEqual(free_slots(calendar, at(7), at(10, day=tomorrow), 60, 2), [at(9, 30), at(8, day=tomorrow)])
+
+    def test_cached_slots_follow_new_sessions(self):
+        employees = [self.busy.id, self.free.id]
+        first = employee_free_slots(employees, at(8), at(20), 60, 3)
+        self.assertEqual(first[self.busy.id], [at(8), at(9), at(10)])
+        with self.assertNumQueries(0):
+            self.assertEqual(employee_free_slots(employees, at(8), at(20), 60, 3), first)
+
+        with run_on_commit_now():
+            Session.objects.create(assignment=self.assignment, scheduled_date=at(8, 30), duration_minutes=60)
+        with self.assertNumQueries(2):
+            slots = employee_free_slots(employees, at(8), at(20), 60, 3)
+        self.assertEqual(slots[self.busy.id], [at(9, 30), at(10, 30), at(11, 30)])
+        self.assertEqual(slots[self.free.id], first[self.free.id])
+
+    def test_api_orders_employees_by_their_first_slot(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        Session.objects.create(
+            assignment=self.assignment, duration_minutes=240,
+            scheduled_date=timezone.make_aware(datetime.combine(tomorrow, time(8)))
+        )
+        response = self.client.get('/api/availability/', {
+            'service': 'tutoria', 'start': tomorrow.isoformat(), 'end': tomorrow.isoformat(),
+            'duration': 45, 'limit': 2
+        })
+        employees = response.json()['employees']
+        self.assertEqual([employee['username'] for employee in employees], ['libre', 'ocupado'])
+        self.assertEqual([slot['time'] for slot in employees[0]['slots']], ['08:00', '09:00'])
+        self.assertEqual([slot['time'] for slot in employees[1]['slots']], ['12:00', '13:00'])
+
+    def test_api_rejects_unbounded_requests(self):
+        today = timezone.localdate()
+        for params in (
+            {'service': 'cocina'},
+            {'service': 'tutoria', 'duration': 5},
+            {'service': 'tutoria', 'start': 'mañana'},
+            {'service': 'tutoria', 'start': today.isoformat(), 'end': (today + timedelta(days=40)).isoformat()},
+            {'service': 'tutoria', 'start': (today + timedelta(days=200)).isoformat()},
+        ):
+            self.assertEqual(self.client.get('/api/availability/', params).status_code, 400, params)
+
+
+class SessionCalendarTests(TestCase):
+    """Calendario por rango de fechas (filas y ocurrencias pendientes, agrupadas por día)"""
+
+    def setUp(self):
+        cache.clear()
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.employee = User.objects.create_user('tutor')
+        self.assignment = ClientAssignment.objects.create(
+            client=User.objects.create_user('cliente', first_name='Ana'), employee=self.employee, service=service
+        )
+        # Lunes 7 (fila) y lunes 14 (pendiente) de la repetición; una fila suelta el martes 8
+        SessionRecurrence.objects.create(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9), count=2
+        )
+        materialize(SessionRecurrence.objects.get(), at(9))
+        Session.objects.create(assignment=self.assignment, scheduled_date=at(16, day=date(2030, 1, 8)))
+        self.client.force_login(self.employee)
+
+    def calendar(self, **params):
+        return self.client.get('/api/calendar/', {'employee': self.employee.id, **params})
+
+    def test_window_groups_rows_and_pending_by_day(self):
+        days = self.calendar(start='2030-01-07', end='2030-01-15').json()['days']
+        self.assertEqual([day['date'] for day in days], ['2030-01-07', '2030-01-08', '2030-01-14'])
+        pending = days[2]['sessions'][0]
+        self.assertEqual((pending['id'], pending['time'], pending['client']), (None, '09:00', 'Ana'))
+        self.assertEqual(pending['occurrence'], at(9, day=date(2030, 1, 14)).isoformat())
+        # end no se incluye
+        days = self.calendar(start='2030-01-07', end='2030-01-14').json()['days']
+        self.assertEqual([day['date'] for day in days], ['2030-01-07', '2030-01-08'])
+
+    def test_cached_window_follows_changes(self):
+        owner = CalendarOwner('employee', self.employee.id)
+        window = (date(2030, 1, 7), date(2030, 1, 14))
+        first = get_calendar(owner, *window)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_calendar(owner, *window), first)
+        with run_on_commit_now():
+            Session.objects.create(assignment=self.assignment, scheduled_date=at(12, day=date(2030, 1, 9)))
+        self.assertEqual(len(get_calendar(owner, *window)), 3)
+
+    def test_invalid_or_foreign_calendars(self):
+        self.assertEqual(self.calendar(start='2030-01-07', end='2030-04-07').status_code, 400)
+        self.assertEqual(self.calendar(start='2030-01-07', end='2030-01-07').status_code, 400)
+        both = {'employee': self.employee.id, 'client': self.assignment.client_id}
+        self.assertEqual(self.client.get('/api/calendar/', both).status_code, 400)
+        self.client.force_login(User.objects.create_user('curioso'))
+        self.assertEqual(self.calendar().status_code, 403)
+        self.assertEqual(
+            self.client.get('/api/calendar/', {'assignment': self.assignment.id}).status_code, 403
+        )
+
+
+class BulkSessionTests(TestCase):
+    """Reprogramación, cancelación y cambio de estado masivos"""
+
+    def setUp(self):
+        service = Service.objects.create(name='Tutoría', slug='tutoria')
+        self.employee = User.objects.create_user('tutor')
+        self.assignment = ClientAssignment.objects.create(
+            client=User.objects.create_user('cliente'), employee=self.employee, service=service
+        )
+        self.owner = CalendarOwner('assignment', self.assignment.id)
+        # Lunes 7 y 14 (pendientes) y una fila el martes 8
+        self.recurrence = SessionRecurrence.objects.create(
+            assignment=self.assignment, weekdays=[0], start_date=date(2030, 1, 7), start_time=time(9), count=2
+        )
+        self.row = Session.objects.create(assignment=self.assignment, scheduled_date=at(9, day=date(2030, 1, 8)))
+        self.past = Session.objects.create(
+            assignment=self.assignment, scheduled_date=timezone.now() - timedelta(days=1), status='completed'
+        )
+
+    def dates(self):
+        return list(
+            Session.objects.filter(assignment=self.assignment, status='scheduled')
+            .order_by('scheduled_date').values_list('scheduled_date', flat=True)
+        )
+
+    def test_shift_moves_rows_and_pending_occurrences(self):
+        self.assertEqual(shift_sessions(self.owner, self.employee, at=time(15)), 3)
+        self.assertEqual(self.dates(), [
+            at(15), at(15, day=date(2030, 1, 8)), at(15, day=date(2030, 1, 14))
+        ])
+        self.past.refresh_from_db()
+        self.assertLess(self.past.scheduled_date, timezone.now())
+        self.assertEqual(get_assignment_stats(self.assignment.id).total_sessions, 4)
+        self.assertIn('3 movidas', AuditLog.objects.get().description)
+
+    def test_conflicting_shift_moves_nothing(self):
+        other = ClientAssignment.objects.create(
+            client=User.objects.create_user('otro'), employee=self.employee, service=self.assignment.service
+        )
+        Session.objects.create(assignment=other, scheduled_date=at(9, 30, day=date(2030, 1, 9)))
+        with self.assertRaises(ValueError):
+            shift_sessions(self.owner, self.employee, days=1)
+        # Tampoco quedan filas de las ocurrencias materializadas para moverlas
+        self.assertEqual(self.dates(), [at(9, day=date(2030, 1, 8))])
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_cancel_covers_the_range_and_updates_stats(self):
+        self.assertEqual(cancel_sessions(self.owner, self.employee, date(2030, 1, 8), date(2030, 1, 14)), 2)
+        self.assertEqual(self.dates(), [])
+        stats = get_assignment_stats(self.assignment.id)
+        self.assertEqual((stats.total_sessions, stats.scheduled_sessions), (4, 1))
+
+    def test_status_api_is_limited_to_the_employee(self):
+        body = {'assignment': self.assignment.id, 'action': 'status', 'session_ids': [self.row.id], 'status': 'completed'}
+        self.client.force_login(User.objects.create_user('curioso'))
+        response = self.client.post('/api/sessions/bulk/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.employee)
+        response = self.client.post(
+            '/api/sessions/bulk/', json.dumps({**body, 'status': 'scheduled'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/sessions/bulk/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(get_assignment_stats(self.assignment.id).completed_sessions, 2)
@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 from . import file_views
 from . import chat_views
+from . import admin_views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -15,6 +16,8 @@ urlpatterns = [
     path('api/submit-order/', views.submit_order, name='submit_order'),
     path('api/submit-student-plan/', views.submit_student_plan, name='submit_student_plan'),
     path('api/available-employees/', views.get_available_employees, name='get_available_employees'),
+    path('api/availability/', views.get_employee_availability, name='get_employee_availability'),
+    path('api/calendar/', views.get_session_calendar, name='get_session_calendar'),
     path('cliente/dashboard/', views.cliente_dashboard, name='cliente_dashboard'),
     path('cliente/perfil/', views.cliente_perfil, name='cliente_perfil'),
     path('api/cliente/actualizar-perfil/', views.update_client_profile, name='update_client_profile'),
@@ -26,9 +29,13 @@ urlpatterns = [
     path('api/client/<int:client_id>/details/', views.get_client_details, name='get_client_details'),
     path('api/client/<int:client_id>/assignment/', views.get_client_assignment, name='get_client_assignment'),
     path('api/session/<int:session_id>/update-status/', views.update_session_status, name='update_session_status'),
+    path('api/sessions/bulk/', views.bulk_update_sessions, name='bulk_update_sessions'),
+    path('api/recurrence/<int:recurrence_id>/materialize/', views.materialize_recurrence_session, name='materialize_recurrence_session'),
     
     # Admin Dashboard URLs
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin/api/opciones/<str:kind>/', admin_views.admin_options, name='admin_options'),
+    path('admin/api/<str:section>/', admin_views.admin_section, name='admin_section'),
     path('admin/servicio/crear/', views.admin_create_service, name='admin_create_service'),
     path('admin/servicio/eliminar/<int:service_id>/', views.admin_delete_service, name='admin_delete_service'),
     path('admin/precio/crear/', views.admin_create_price, name='admin_create_price'),
@@ -63,6 +70,7 @@ urlpatterns = [
     path('api/chat/<int:assignment_id>/messages/', chat_views.get_chat_messages, name='get_chat_messages'),
     path('api/chat/<int:assignment_id>/send/', chat_views.send_chat_message, name='send_chat_message'),
     path('api/chat/unread-count/', chat_views.get_unread_messages_count, name='get_unread_messages_count'),
+    path('api/chat/search/', chat_views.search_chat, name='search_chat'),
     path('api/chat/upload-file/', chat_views.upload_file_to_client, name='upload_file_to_client'),
     
     # Assignment Files URLs (new - client and employee file management)
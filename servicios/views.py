@@ -5,63 +5,50 @@ from django.http import JsonResponse, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.models import User, Group
-from django.db.models import Q, Count
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import (
+    Q, Count, Max, Min, OuterRef, Subquery, IntegerField, FloatField, CharField, DateTimeField, Value, F, Case, When
+)
+from django.db.models.functions import Concat, Coalesce, Greatest, Least, Lower
 from django.utils import timezone
 from datetime import datetime, timedelta, time
+from itertools import islice
 import json
 
-from .models import Service, Price, Customer, Order, ClientAssignment, Session, FileUpload, AuditLog
+from .models import (
+    Service, Price, Customer, Order, ClientAssignment, Session, SessionRecurrence, FileUpload, AuditLog
+)
+from .session_stats import get_client_stats
+from .scheduling import (
+    SCHEDULING_LOOKAHEAD, SLOT_STEP_MINUTES, book_on_day, ceil_to_step, employee_calendar, employee_calendars,
+    employee_free_slots, find_conflict, lock_employees
+)
+from . import cache_namespaces
+from .conditional import (
+    conditional_json, available_employees_etag, client_details_etag, assignment_files_etag, calendar_etag
+)
+from .catalog import render_catalog_page
+from .recurrence import create_recurrence, materialize, pending_sessions, upcoming_session, with_pending
+from .session_calendar import get_calendar, parse_owner, parse_window
+from .bulk_sessions import cancel_sessions, set_sessions_status, shift_sessions
+
+# Clientes por página en los dashboards de empleados
+EMPLOYEE_CLIENTS_PAGE_SIZE = 24
 
 
 def index(request):
     """Página principal"""
-    from django.core.cache import cache
-    
-    # Intentar obtener desde cache
-    cached_data = cache.get('index_services_data')
-    
-    if cached_data is None:
-        # Obtener servicios con sus precios destacados o los primeros 3
-        tutoria_service = Service.objects.filter(slug='tutoria').first()
-        terapia_service = Service.objects.filter(slug='terapia').first()
-        plan_estudiante_service = Service.objects.filter(slug='plan-estudiante').first()
-        
-        # Para tutoría: priorizar planes destacados
-        if tutoria_service:
-            tutoria_prices = list(tutoria_service.prices.filter(is_featured=True)[:3])
-            if not tutoria_prices:
-                tutoria_prices = list(tutoria_service.prices.all()[:3])
-        else:
-            tutoria_prices = []
-        
-        # Para terapia: priorizar planes destacados
-        if terapia_service:
-            terapia_prices = list(terapia_service.prices.filter(is_featured=True)[:3])
-            if not terapia_prices:
-                terapia_prices = list(terapia_service.prices.all()[:3])
-        else:
-            terapia_prices = []
-        
-        # Para Plan Estudiante: solo planes destacados
-        if plan_estudiante_service:
-            plan_estudiante_prices = list(plan_estudiante_service.prices.filter(is_featured=True)[:3])
-        else:
-            plan_estudiante_prices = []
-        
-        cached_data = {
-            'tutoria_service': tutoria_service,
-            'terapia_service': terapia_service,
-            'plan_estudiante_service': plan_estudiante_service,
-            'tutoria_prices': tutoria_prices,
-            'terapia_prices': terapia_prices,
-            'plan_estudiante_prices': plan_estudiante_prices,
-        }
-        
-        # Cachear por 15 minutos
-        cache.set('index_services_data', cached_data, 60 * 15)
-    
-    context = cached_data
-    return render(request, 'index.html', context)
+    return render_catalog_page(request, 'index.html', lambda snapshot: {
+        'tutoria_service': snapshot.service('tutoria'),
+        'terapia_service': snapshot.service('terapia'),
+        'plan_estudiante_service': snapshot.service('plan-estudiante'),
+        # Tutoría y terapia: planes destacados o los primeros 3
+        'tutoria_prices': snapshot.preview('tutoria'),
+        'terapia_prices': snapshot.preview('terapia'),
+        # Plan Estudiante: solo planes destacados
+        'plan_estudiante_prices': snapshot.featured('plan-estudiante'),
+    })
 
 
 def quienes_somos(request):
@@ -76,39 +63,25 @@ def testimonios(request):
 
 def tutoria(request):
     """Página de tutoría"""
-    try:
-        service = Service.objects.get(slug='tutoria')
-        prices = service.prices.all().order_by('price')
-    except Service.DoesNotExist:
-        service = None
-        prices = []
-    return render(request, 'tutoria.html', {'service': service, 'prices': prices})
+    return render_catalog_page(request, 'tutoria.html', lambda snapshot: {
+        'service': snapshot.service('tutoria'),
+        'prices': snapshot.prices('tutoria'),
+    })
 
 
 def terapia(request):
     """Página de terapia"""
-    try:
-        service = Service.objects.get(slug='terapia')
-        prices = service.prices.all().order_by('price')
-    except Service.DoesNotExist:
-        service = None
-        prices = []
-    return render(request, 'terapia.html', {'service': service, 'prices': prices})
+    return render_catalog_page(request, 'terapia.html', lambda snapshot: {
+        'service': snapshot.service('terapia'),
+        'prices': snapshot.prices('terapia'),
+    })
 
 
 def plan_estudiante(request):
     """Página de Plan Estudiante - muestra todos los planes disponibles"""
-    try:
-        plan_estudiante = Service.objects.get(slug='plan-estudiante')
-        # Obtener todos los planes ordenados por precio
-        prices = plan_estudiante.prices.all().order_by('price')
-    except Service.DoesNotExist:
-        plan_estudiante = None
-        prices = []
-    
-    return render(request, 'plan-estudiante.html', {
-        'service': plan_estudiante,
-        'prices': prices
+    return render_catalog_page(request, 'plan-estudiante.html', lambda snapshot: {
+        'service': snapshot.service('plan-estudiante'),
+        'prices': snapshot.prices('plan-estudiante'),
     })
 
 
@@ -303,6 +276,7 @@ def extract_sessions_from_plan(plan_name):
 
 
 @require_http_methods(["GET"])
+@conditional_json(available_employees_etag)
 def get_available_employees(request):
     """Obtener empleados disponibles para un servicio"""
     service_slug = request.GET.get('service')
@@ -368,10 +342,258 @@ def get_available_employees(request):
         }, status=404)
 
 
+# Ventana máxima, cuán adelante puede empezar y cantidad de horarios de la
+# búsqueda de disponibilidad
+AVAILABILITY_MAX_DAYS = 31
+AVAILABILITY_MAX_AHEAD_DAYS = 90
+AVAILABILITY_DEFAULT_SLOTS = 5
+AVAILABILITY_MAX_SLOTS = 20
+
+
+@require_http_methods(["GET"])
+def get_employee_availability(request):
+    """
+    Primeros horarios libres de cada empleado que atiende un servicio.
+
+    Parámetros: service (tutoria o terapia), start y end (YYYY-MM-DD, ambos
+    incluidos; por defecto los próximos 14 días), duration (minutos, 60 por
+    defecto) y limit (horarios por empleado).
+
+    Es pública (se consulta antes de solicitar), así que la caché no depende
+    de end ni de limit: siempre se calculan los primeros AVAILABILITY_MAX_SLOTS
+    horarios de una ventana de AVAILABILITY_MAX_DAYS días y se recortan al
+    responder; la duración se redondea al paso de los horarios y el inicio no
+    puede pasar de AVAILABILITY_MAX_AHEAD_DAYS días.
+    """
+    group_name = {'tutoria': 'Tutor', 'terapia': 'Psicologo'}.get(request.GET.get('service'))
+    if group_name is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Servicio no especificado o no soportado'
+        }, status=400)
+    
+    try:
+        start_date = timezone.localdate()
+        if request.GET.get('start'):
+            start_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+        end_date = start_date + timedelta(days=13)
+        if request.GET.get('end'):
+            end_date = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+        duration = int(request.GET.get('duration', 60))
+        limit = min(max(int(request.GET.get('limit', AVAILABILITY_DEFAULT_SLOTS)), 1), AVAILABILITY_MAX_SLOTS)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Parámetros inválidos'
+        }, status=400)
+    
+    if not 15 <= duration <= 480:
+        return JsonResponse({
+            'success': False,
+            'message': 'La duración debe estar entre 15 y 480 minutos'
+        }, status=400)
+    if end_date < start_date or (end_date - start_date).days >= AVAILABILITY_MAX_DAYS:
+        return JsonResponse({
+            'success': False,
+            'message': f'El rango de fechas debe ser de 1 a {AVAILABILITY_MAX_DAYS} días'
+        }, status=400)
+    if (start_date - timezone.localdate()).days > AVAILABILITY_MAX_AHEAD_DAYS:
+        return JsonResponse({
+            'success': False,
+            'message': f'La búsqueda puede empezar a lo sumo en {AVAILABILITY_MAX_AHEAD_DAYS} días'
+        }, status=400)
+    
+    # Desde ahora (redondeado al paso de los horarios, así la caché dura ese lapso)
+    start = max(
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        ceil_to_step(timezone.now())
+    )
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    window_end = timezone.make_aware(datetime.combine(start_date + timedelta(days=AVAILABILITY_MAX_DAYS), time.min))
+    # Un horario libre para la duración redondeada también lo está para la pedida
+    slot_duration = -(-duration // SLOT_STEP_MINUTES) * SLOT_STEP_MINUTES
+    
+    employees = list(User.objects.filter(groups__name=group_name, is_active=True).order_by('id'))
+    slots = {}
+    if start < end:
+        window_slots = employee_free_slots(
+            [employee.id for employee in employees], start, window_end, slot_duration, AVAILABILITY_MAX_SLOTS
+        )
+        # Los horarios están en orden: los primeros de la ventana son los primeros del rango
+        slots = {
+            employee_id: [slot for slot in employee_slots if slot < end][:limit]
+            for employee_id, employee_slots in window_slots.items()
+        }
+    
+    employees_data = [
+        {
+            'id': employee.id,
+            'name': employee.get_full_name() or employee.username,
+            'username': employee.username,
+            'slots': [
+                {
+                    'start': slot.isoformat(),
+                    'date': timezone.localtime(slot).strftime('%Y-%m-%d'),
+                    'time': timezone.localtime(slot).strftime('%H:%M'),
+                    'weekday': timezone.localtime(slot).strftime('%A')
+                }
+                for slot in slots.get(employee.id, [])
+            ]
+        }
+        for employee in employees
+    ]
+    # Primero quien tiene el horario libre más próximo
+    employees_data.sort(key=lambda employee: (not employee['slots'], [slot['start'] for slot in employee['slots'][:1]]))
+    
+    return JsonResponse({
+        'success': True,
+        'duration': duration,
+        'employees': employees_data
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+@conditional_json(calendar_etag)
+def get_session_calendar(request):
+    """
+    Sesiones de un empleado, un cliente o una asignación agrupadas por día.
+
+    Parámetros: employee, client o assignment (uno, con su id) y start/end
+    (YYYY-MM-DD, end excluido; por defecto la próxima semana). Incluye las
+    ocurrencias pendientes de las repeticiones con id null.
+    """
+    try:
+        owner = parse_owner(request.GET)
+        start_date, end_date = parse_window(request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    if not owner.can_view(request.user):
+        return JsonResponse({'success': False, 'error': 'No autorizado'}, status=403)
+    
+    return JsonResponse({
+        'success': True,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'days': get_calendar(owner, start_date, end_date)
+    })
+
+
+def allocate_username(base_username):
+    """
+    Primer username libre entre base, base1, base2... (una sola consulta).
+
+    Se compara sin distinguir mayúsculas: la collation de MySQL trata a
+    "Ana" y "ana" como el mismo username.
+    """
+    taken = {
+        username.lower()
+        for username in User.objects.filter(username__istartswith=base_username).values_list('username', flat=True)
+    }
+    username = base_username
+    counter = 1
+    while username.lower() in taken:
+        username = f"{base_username}{counter}"
+        counter += 1
+    return username
+
+
+def get_or_create_order_client(order):
+    """
+    Usuario del cliente de la orden: se busca por email o se crea en el grupo Cliente.
+
+    Va dentro de la transacción del generador: la fila del Customer queda
+    bloqueada hasta el commit, así dos órdenes del mismo cliente no crean dos
+    usuarios con el mismo email (que no es único). La búsqueda también es una
+    lectura con bloqueo para ver el usuario que otra transacción acaba de crear.
+    """
+    Customer.objects.select_for_update().filter(pk=order.customer_id).exists()
+    client_user = User.objects.select_for_update().filter(email__iexact=order.customer.email).order_by('id').first()
+    if client_user is not None:
+        return client_user
+
+    client_user = User.objects.create_user(
+        username=allocate_username(order.customer.email.split('@')[0]),
+        email=order.customer.email,
+        first_name=order.customer.name.split()[0] if order.customer.name else '',
+        last_name=' '.join(order.customer.name.split()[1:]) if len(order.customer.name.split()) > 1 else ''
+    )
+    # Asignar al grupo Cliente (crear el grupo si no existe)
+    cliente_group, created = Group.objects.get_or_create(name='Cliente')
+    client_user.groups.add(cliente_group)
+    if created:
+        print(f"✓ Grupo 'Cliente' creado automáticamente")
+    return client_user
+
+
+def _order_already_generated(order):
+    """Bloquear la fila de la orden hasta el commit y releer sessions_generated"""
+    return Order.objects.select_for_update().filter(pk=order.pk).values_list(
+        'sessions_generated', flat=True
+    ).first()
+
+
+def _preferred_dates(start_date, weekdays):
+    """Fechas sucesivas en los días de la semana preferidos, en el orden indicado"""
+    current_date = start_date
+    day_index = 0
+    while True:
+        days_ahead = (weekdays[day_index % len(weekdays)] - current_date.weekday()) % 7
+        current_date += timedelta(days=days_ahead or 7)
+        yield current_date
+        day_index += 1
+
+
+def _weekly_dates(start_date):
+    """La fecha de inicio y las de las semanas siguientes"""
+    current_date = start_date
+    while True:
+        yield current_date
+        current_date += timedelta(weeks=1)
+
+
+def _book_dates(calendar, dates, preferred_time, count):
+    """
+    Reservar `count` sesiones de 60 minutos en las fechas dadas (en orden).
+
+    Las fechas sin lugar se saltan, hasta SCHEDULING_LOOKAHEAD de más.
+    Retorna los inicios o None si no alcanzan.
+    """
+    session_datetimes = []
+    for day in islice(dates, count + SCHEDULING_LOOKAHEAD):
+        if len(session_datetimes) == count:
+            break
+        session_datetime = book_on_day(calendar, day, preferred_time, 60)
+        if session_datetime is not None:
+            session_datetimes.append(session_datetime)
+    return session_datetimes if len(session_datetimes) == count else None
+
+
+def _session_summary(session):
+    summary = {
+        'id': session.id,
+        'date': session.scheduled_date.strftime('%Y-%m-%d'),
+        'time': session.scheduled_date.strftime('%H:%M'),
+        'weekday': session.scheduled_date.strftime('%A')
+    }
+    if session.recurrence_id:
+        # Ocurrencia de una repetición (id None mientras no se materialice)
+        summary['recurrence_id'] = session.recurrence_id
+        summary['occurrence'] = session.occurrence.isoformat()
+    return summary
+
+
 def generate_sessions_for_order(order, user_account=None):
     """
     Genera sesiones automáticamente para una orden confirmada
     
+    El calendario se arma en memoria, corriendo los horarios que chocan con
+    otras sesiones del empleado (ver scheduling.py), y se guarda como una regla
+    de repetición: solo las sesiones corridas tienen fila (ver recurrence.py).
+    El usuario, la asignación, la regla y la marca de la orden se guardan en
+    una transacción (un fallo no deja sesiones a medias).
+    
     Args:
         order: Objeto Order
         user_account: Cuenta de usuario del cliente (opcional)
@@ -403,42 +625,6 @@ def generate_sessions_for_order(order, user_account=None):
             'message': 'No se ha especificado hora preferida'
         }
     
-    # Crear o buscar el usuario del cliente
-    client_user = user_account
-    if not client_user:
-        # Intentar encontrar por email
-        try:
-            client_user = User.objects.get(email=order.customer.email)
-        except User.DoesNotExist:
-            # Crear usuario para el cliente
-            username = order.customer.email.split('@')[0]
-            # Asegurarse de que el username sea único
-            base_username = username
-            counter = 1
-            while User.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            
-            client_user = User.objects.create_user(
-                username=username,
-                email=order.customer.email,
-                first_name=order.customer.name.split()[0] if order.customer.name else '',
-                last_name=' '.join(order.customer.name.split()[1:]) if len(order.customer.name.split()) > 1 else ''
-            )
-            # Asignar al grupo Cliente (crear el grupo si no existe)
-            cliente_group, created = Group.objects.get_or_create(name='Cliente')
-            client_user.groups.add(cliente_group)
-            if created:
-                print(f"✓ Grupo 'Cliente' creado automáticamente")
-    
-    # Crear o buscar asignación
-    assignment, created = ClientAssignment.objects.get_or_create(
-        client=client_user,
-        employee=order.preferred_employee,
-        service=order.service,
-        defaults={'is_active': True}
-    )
-    
     # Mapeo de días de la semana
     weekday_map = {
         'monday': 0,
@@ -459,60 +645,67 @@ def generate_sessions_for_order(order, user_account=None):
             'message': 'Días de la semana inválidos'
         }
     
-    # Generar sesiones
-    sessions_created = []
     # Usar la fecha de inicio especificada por el usuario, o mañana si no se especificó
     if order.start_date:
-        current_date = order.start_date
+        start_date = order.start_date
     else:
-        current_date = timezone.now().date() + timedelta(days=1)
-    
-    sessions_count = 0
-    day_index = 0
+        start_date = timezone.now().date() + timedelta(days=1)
     
-    # Buscar el próximo día disponible
-    while sessions_count < order.number_of_sessions:
-        # Calcular el siguiente día
-        days_ahead = (preferred_weekdays[day_index % len(preferred_weekdays)] - current_date.weekday()) % 7
-        if days_ahead == 0 and sessions_count > 0:
-            days_ahead = 7
-        
-        next_date = current_date + timedelta(days=days_ahead if days_ahead > 0 else 7)
+    with transaction.atomic():
+        # Otra petición pudo generarlas mientras tanto
+        if _order_already_generated(order):
+            return {
+                'success': False,
+                'message': 'Las sesiones ya fueron generadas para esta orden'
+            }
         
-        # Combinar fecha y hora
-        session_datetime = timezone.make_aware(
-            datetime.combine(next_date, order.preferred_time)
+        # Calcular los horarios sin chocar con otras sesiones del empleado: si la
+        # hora preferida está ocupada se corre dentro del mismo día y, si el día
+        # está lleno, se pasa al siguiente día preferido
+        lock_employees([order.preferred_employee_id])
+        calendar = employee_calendar(
+            order.preferred_employee_id, timezone.make_aware(datetime.combine(start_date, time.min))
+        )
+        session_datetimes = _book_dates(
+            calendar, _preferred_dates(start_date, preferred_weekdays), order.preferred_time, order.number_of_sessions
         )
+        if session_datetimes is None:
+            return {
+                'success': False,
+                'message': 'El empleado no tiene horarios libres suficientes en los días preferidos'
+            }
         
-        # Crear sesión
-        session = Session.objects.create(
-            assignment=assignment,
-            scheduled_date=session_datetime,
-            duration_minutes=60,
-            status='scheduled',
-            notes=f'Sesión {sessions_count + 1} de {order.number_of_sessions} - Generada automáticamente'
+        # Crear o buscar el usuario del cliente
+        client_user = user_account or get_or_create_order_client(order)
+        
+        # Crear o buscar asignación
+        assignment, created = ClientAssignment.objects.get_or_create(
+            client=client_user,
+            employee=order.preferred_employee,
+            service=order.service,
+            defaults={'is_active': True}
         )
         
-        sessions_created.append({
-            'id': session.id,
-            'date': session_datetime.strftime('%Y-%m-%d'),
-            'time': session_datetime.strftime('%H:%M'),
-            'weekday': session_datetime.strftime('%A')
-        })
+        # Una regla de repetición en vez de una fila por sesión (ver recurrence.py)
+        sessions = create_recurrence(
+            assignment, session_datetimes, preferred_weekdays, order.preferred_time, 60,
+            f'{order.number_of_sessions} sesiones - Generadas automáticamente'
+        )
         
-        sessions_count += 1
-        current_date = next_date
-        day_index += 1
+        # Marcar orden como con sesiones generadas
+        order.sessions_generated = True
+        order.status = 'confirmed'
+        order.save()
     
-    # Marcar orden como con sesiones generadas
-    order.sessions_generated = True
-    order.status = 'confirmed'
-    order.save()
+    shifted = sum(1 for session in sessions if timezone.localtime(session.scheduled_date).time() != order.preferred_time)
+    message = f'Se generaron {len(sessions)} sesiones correctamente'
+    if shifted:
+        message += f' ({shifted} en otro horario por choques con la agenda del empleado)'
     
     return {
         'success': True,
-        'message': f'Se generaron {sessions_count} sesiones correctamente',
-        'sessions': sessions_created,
+        'message': message,
+        'sessions': [_session_summary(session) for session in sessions],
         'assignment_id': assignment.id,
         'client_username': client_user.username
     }
@@ -530,31 +723,40 @@ def cliente_dashboard(request):
         is_active=True
     ).select_related('employee', 'service').prefetch_related('sessions')
     
-    # Obtener sesiones del cliente ordenadas por fecha con prefetch
-    sessions = Session.objects.filter(
-        assignment__client=request.user
-    ).select_related(
-        'assignment__employee', 'assignment__service'
-    ).prefetch_related(
-        'files'
-    ).order_by('scheduled_date')
+    # Obtener sesiones del cliente ordenadas por fecha con prefetch, junto a
+    # las ocurrencias pendientes de sus repeticiones
+    sessions = with_pending(
+        Session.objects.filter(
+            assignment__client=request.user
+        ).select_related(
+            'assignment__employee', 'assignment__service'
+        ).prefetch_related(
+            'files'
+        ).order_by('scheduled_date'),
+        SessionRecurrence.objects.filter(
+            assignment__client=request.user
+        ).select_related('assignment__employee', 'assignment__service')
+    )
     
     # Calcular estadísticas
-    total_sessions = sessions.count()
-    completed_sessions = sessions.filter(status='completed').count()
-    scheduled_sessions = sessions.filter(Q(status='scheduled') | Q(status='confirmed')).count()
-    progress = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
+    stats = get_client_stats(request.user.id)
+    total_sessions = stats.total_sessions
+    completed_sessions = stats.completed_sessions
+    scheduled_sessions = stats.scheduled_sessions
+    progress = stats.progress
     
     # Obtener próxima sesión
-    next_session = sessions.filter(
-        Q(status='scheduled') | Q(status='confirmed'),
-        scheduled_date__gte=timezone.now()
-    ).first()
+    now = timezone.now()
+    next_session = next(
+        (session for session in sessions
+         if session.status in ('scheduled', 'confirmed') and session.scheduled_date >= now),
+        None
+    )
     
     # Calcular días hasta próxima sesión
     days_until_next = None
     if next_session:
-        days_until_next = (next_session.scheduled_date.date() - timezone.now().date()).days
+        days_until_next = (next_session.scheduled_date.date() - now.date()).days
     
     # Obtener archivos del cliente
     files = FileUpload.objects.filter(
@@ -592,11 +794,11 @@ def empleado_dashboard(request):
     # Calcular estadísticas para cada cliente
     clients_data = []
     for assignment in assigned_clients:
-        # Contar TODAS las sesiones del cliente (no solo de esta asignación)
-        all_sessions = Session.objects.filter(assignment__client=assignment.client)
-        total_sessions = all_sessions.count()
-        completed_sessions = all_sessions.filter(status='completed').count()
-        progress = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
+        # Estadísticas de TODAS las sesiones del cliente (no solo de esta asignación)
+        stats = get_client_stats(assignment.client_id)
+        total_sessions = stats.total_sessions
+        completed_sessions = stats.completed_sessions
+        progress = stats.progress
         
         clients_data.append({
             'assignment': assignment,
@@ -657,10 +859,16 @@ def auditoria_estudiante(request):
         is_active=True
     ).select_related('employee', 'service').prefetch_related('sessions')
     
-    # Obtener todas las sesiones del cliente ordenadas por fecha (ascendente)
-    sessions = Session.objects.filter(
-        assignment__client=client
-    ).select_related('assignment__employee', 'assignment__service').order_by('scheduled_date')
+    # Obtener todas las sesiones del cliente ordenadas por fecha (ascendente),
+    # con las ocurrencias pendientes de sus repeticiones
+    sessions = with_pending(
+        Session.objects.filter(
+            assignment__client=client
+        ).select_related('assignment__employee', 'assignment__service').order_by('scheduled_date'),
+        SessionRecurrence.objects.filter(
+            assignment__client=client
+        ).select_related('assignment__employee', 'assignment__service')
+    )
     
     # Obtener archivos del cliente
     files = FileUpload.objects.filter(
@@ -673,10 +881,11 @@ def auditoria_estudiante(request):
     ).order_by('-timestamp')[:50]
     
     # Calcular estadísticas
-    total_sessions = sessions.count()
-    completed_sessions = sessions.filter(status='completed').count()
-    scheduled_sessions = sessions.filter(Q(status='scheduled') | Q(status='confirmed')).count()
-    progress = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
+    stats = get_client_stats(client.id)
+    total_sessions = stats.total_sessions
+    completed_sessions = stats.completed_sessions
+    scheduled_sessions = stats.scheduled_sessions
+    progress = stats.progress
     
     # Obtener la asignación principal (la más reciente)
     main_assignment = assignments.first()
@@ -697,6 +906,7 @@ def auditoria_estudiante(request):
     return render(request, 'auditoria-estudiante.html', context)
 
 
+@conditional_json(client_details_etag)
 def get_client_details(request, client_id):
     """API para obtener detalles de un cliente en formato JSON"""
     try:
@@ -722,19 +932,17 @@ def get_client_details(request, client_id):
         ).select_related('assignment__service', 'assignment__employee').order_by('scheduled_date')
         
         # Calcular estadísticas
-        total_sessions = sessions.count()
-        completed_sessions = sessions.filter(status='completed').count()
-        scheduled_sessions = sessions.filter(Q(status='scheduled') | Q(status='confirmed')).count()
-        progress = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
+        stats = get_client_stats(client.id)
+        total_sessions = stats.total_sessions
+        completed_sessions = stats.completed_sessions
+        scheduled_sessions = stats.scheduled_sessions
+        progress = stats.progress
         
         # Obtener última sesión completada (más reciente)
         last_session = sessions.filter(status='completed').order_by('-scheduled_date').first()
         
-        # Obtener próxima cita
-        next_session = sessions.filter(
-            Q(status='scheduled') | Q(status='confirmed'),
-            scheduled_date__gte=timezone.now()
-        ).order_by('scheduled_date').first()
+        # Obtener próxima cita (puede ser una ocurrencia pendiente de una repetición)
+        next_session = upcoming_session({'client': client})
         
         # Calcular días desde última sesión
         last_session_days = None
@@ -802,6 +1010,41 @@ def get_client_details(request, client_id):
 # EMPLOYEE DASHBOARD HELPER FUNCTION
 # ============================================
 
+def _pending_dates_by_client(client_ids, now):
+    """
+    Fechas de las ocurrencias pendientes de las repeticiones de los clientes:
+    ({cliente: próxima desde now}, {cliente: última}).
+    """
+    next_dates = {}
+    last_dates = {}
+    recurrences = SessionRecurrence.objects.filter(assignment__client_id__in=client_ids).select_related('assignment')
+    for session in pending_sessions(recurrences):
+        client_id = session.assignment.client_id
+        last_dates[client_id] = session.scheduled_date
+        if session.scheduled_date >= now:
+            next_dates.setdefault(client_id, session.scheduled_date)
+    return next_dates, last_dates
+
+
+def _client_value(values):
+    """Valor de cada cliente ({cliente: fecha}) como expresión SQL; NULL para los demás"""
+    return Case(
+        *[When(client_id=client_id, then=Value(value)) for client_id, value in values.items()],
+        default=Value(None),
+        output_field=DateTimeField()
+    )
+
+
+def _earliest(first, second):
+    """Least ignorando los NULL (Least devuelve NULL si algún argumento lo es)"""
+    return Least(Coalesce(first, second), Coalesce(second, first))
+
+
+def _latest(first, second):
+    """Greatest ignorando los NULL"""
+    return Greatest(Coalesce(first, second), Coalesce(second, first))
+
+
 def _get_employee_dashboard_data(user, request=None):
     """
     Función auxiliar para obtener datos comunes de dashboards de empleados.
@@ -812,122 +1055,137 @@ def _get_employee_dashboard_data(user, request=None):
         request: Objeto request para obtener parámetros de filtrado
         
     Returns:
-        dict: Diccionario con clients_data, total_clients y filtros aplicados
+        dict: Diccionario con clients_data (página actual), page_obj, total_clients y filtros aplicados
     """
     # Obtener parámetros de filtrado/ordenamiento
     search_query = request.GET.get('search', '').strip() if request else ''
     order_by = request.GET.get('order_by', 'recent_activity') if request else 'recent_activity'
     
-    # Obtener clientes asignados al empleado actual
+    now = timezone.now()
+    
+    # Estadísticas por cliente (todas sus asignaciones) en una sola consulta:
+    # agregación condicional sobre sesiones y subconsultas sobre archivos
+    client_files = FileUpload.objects.filter(
+        assignment__client=OuterRef('client_id')
+    ).order_by().values('assignment__client')
     assigned_clients = ClientAssignment.objects.filter(
         employee=user,
         is_active=True
-    ).select_related('client', 'service').prefetch_related(
-        'sessions',
-        'sessions__files',
-        'files'
+    ).select_related('client', 'service')
+    
+    # Filtro por nombre/usuario/email (subcadena). Recorre solo las filas de las
+    # asignaciones del empleado, que ya se leen por su índice
+    if search_query:
+        assigned_clients = assigned_clients.annotate(
+            client_full_name=Concat('client__first_name', Value(' '), 'client__last_name')
+        ).filter(
+            Q(client_full_name__icontains=search_query) |
+            Q(client__username__icontains=search_query) |
+            Q(client__email__icontains=search_query)
+        )
+    
+    # Las ocurrencias pendientes de las repeticiones no tienen fila: sus fechas
+    # se calculan aparte y se combinan con las de las sesiones en la consulta
+    pending_next, pending_last = _pending_dates_by_client(
+        ClientAssignment.objects.filter(employee=user, is_active=True).values('client_id'), now
+    )
+    
+    # Totales desde las estadísticas materializadas del cliente (ver session_stats.py)
+    assigned_clients = assigned_clients.annotate(
+        total_sessions=Coalesce(F('client__session_stats__total_sessions'), 0),
+        completed_sessions=Coalesce(F('client__session_stats__completed_sessions'), 0),
+        last_session_date=_latest(
+            Max('client__client_assignments__sessions__scheduled_date'),
+            _client_value(pending_last)
+        ),
+        next_appointment=_earliest(
+            Min(
+                'client__client_assignments__sessions__scheduled_date',
+                filter=Q(
+                    client__client_assignments__sessions__status__in=['scheduled', 'confirmed'],
+                    client__client_assignments__sessions__scheduled_date__gte=now
+                )
+            ),
+            _client_value(pending_next)
+        ),
+        last_file_date=Subquery(
+            client_files.annotate(last=Max('uploaded_at')).values('last')[:1]
+        ),
+        recent_files_count=Coalesce(Subquery(
+            client_files.filter(
+                uploaded_at__gte=now - timedelta(days=7)
+            ).annotate(total=Count('id')).values('total')[:1],
+            output_field=IntegerField()
+        ), 0)
+    ).annotate(
+        progress_value=Case(
+            When(total_sessions=0, then=Value(0.0)),
+            default=F('completed_sessions') * 100.0 / F('total_sessions'),
+            output_field=FloatField()
+        ),
+        # Greatest devuelve NULL si algún argumento lo es
+        last_activity=Greatest(
+            Coalesce('last_session_date', 'last_file_date'),
+            Coalesce('last_file_date', 'last_session_date')
+        ),
+        sort_name=Case(
+            When(client__first_name='', then=Lower('client__username')),
+            default=Lower(Concat('client__first_name', Value(' '), 'client__last_name')),
+            output_field=CharField()
+        )
+    )
+    
+    # Ordenamiento en SQL sobre las columnas agregadas
+    orderings = {
+        'recent_activity': F('last_activity').desc(nulls_last=True),
+        'next_appointment': F('next_appointment').asc(nulls_last=True),
+        'name': F('sort_name').asc(),
+        'progress': F('progress_value').desc(),
+        'new_files': F('recent_files_count').desc(),
+    }
+    if order_by not in orderings:
+        order_by = 'recent_activity'
+    assigned_clients = assigned_clients.order_by(orderings[order_by], 'id')
+    
+    page_obj = Paginator(assigned_clients, EMPLOYEE_CLIENTS_PAGE_SIZE).get_page(
+        request.GET.get('page') if request else 1
     )
     
-    # Calcular estadísticas para cada cliente
     clients_data = []
-    for assignment in assigned_clients:
-        client = assignment.client
-        
-        # Filtro por nombre/email
-        if search_query:
-            client_name = f"{client.first_name} {client.last_name}".lower()
-            username = client.username.lower()
-            email = client.email.lower()
-            
-            if not (search_query.lower() in client_name or 
-                    search_query.lower() in username or 
-                    search_query.lower() in email):
-                continue
-        
-        # Contar TODAS las sesiones del cliente
-        all_sessions = Session.objects.filter(assignment__client=client)
-        total_sessions = all_sessions.count()
-        completed_sessions = all_sessions.filter(status='completed').count()
-        progress = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
-        
-        # Obtener última actividad (última sesión o archivo subido)
-        last_session = all_sessions.order_by('-scheduled_date').first()
-        last_file = FileUpload.objects.filter(
-            assignment__client=client
-        ).order_by('-uploaded_at').first()
-        
-        # Determinar la actividad más reciente
-        last_activity = None
-        if last_session and last_file:
-            last_activity = max(last_session.scheduled_date, last_file.uploaded_at)
-        elif last_session:
-            last_activity = last_session.scheduled_date
-        elif last_file:
-            last_activity = last_file.uploaded_at
-        
-        # Próxima cita (sesión pendiente más cercana)
-        next_appointment = all_sessions.filter(
-            status='pending',
-            scheduled_date__gte=timezone.now()
-        ).order_by('scheduled_date').first()
-        
-        # Contar archivos nuevos (últimos 7 días)
-        recent_files_count = FileUpload.objects.filter(
-            assignment__client=client,
-            uploaded_at__gte=timezone.now() - timedelta(days=7)
-        ).count()
-        
+    for assignment in page_obj:
         clients_data.append({
             'assignment': assignment,
-            'client': client,
+            'client': assignment.client,
             'service': assignment.service,
-            'total_sessions': total_sessions,
-            'completed_sessions': completed_sessions,
-            'progress': round(progress, 1),
-            'last_activity': last_activity,
-            'next_appointment': next_appointment,
-            'recent_files_count': recent_files_count
+            'total_sessions': assignment.total_sessions,
+            'completed_sessions': assignment.completed_sessions,
+            'progress': round(assignment.progress_value, 1),
+            'last_activity': assignment.last_activity,
+            'next_appointment': assignment.next_appointment,
+            'recent_files_count': assignment.recent_files_count
         })
     
-    # Aplicar ordenamiento
-    if order_by == 'recent_activity':
-        # Ordenar por última actividad (más reciente primero)
-        clients_data.sort(key=lambda x: x['last_activity'] or timezone.datetime.min.replace(tzinfo=timezone.utc), reverse=True)
-    elif order_by == 'next_appointment':
-        # Ordenar por próxima cita (más cercana primero)
-        clients_data.sort(key=lambda x: (
-            x['next_appointment'].scheduled_date if x['next_appointment'] 
-            else timezone.datetime.max.replace(tzinfo=timezone.utc)
-        ))
-    elif order_by == 'name':
-        # Ordenar alfabéticamente por nombre
-        clients_data.sort(key=lambda x: (
-            f"{x['client'].first_name} {x['client'].last_name}".lower() 
-            if x['client'].first_name else x['client'].username.lower()
-        ))
-    elif order_by == 'progress':
-        # Ordenar por progreso (mayor primero)
-        clients_data.sort(key=lambda x: x['progress'], reverse=True)
-    elif order_by == 'new_files':
-        # Ordenar por archivos recientes (más primero)
-        clients_data.sort(key=lambda x: x['recent_files_count'], reverse=True)
-    
     # Obtener solicitudes asignadas al empleado que están confirmadas (aprobadas por admin)
-    pending_requests = Order.objects.filter(
+    pending_requests = list(Order.objects.filter(
         Q(preferred_employee=user) | Q(preferred_tutor=user) | Q(preferred_therapist=user),
         status='confirmed'  # Solo mostrar las aprobadas por admin
-    ).select_related('customer', 'service', 'price').order_by('-created_at')
+    ).select_related('customer', 'service', 'price').order_by('-created_at'))
     
     orders = Order.objects.all()
     
     return {
         'orders': orders,
         'clients_data': clients_data,
-        'total_clients': len(clients_data),
+        'total_clients': page_obj.paginator.count,
+        'page_obj': page_obj,
+        # Todas las asignaciones (sin estadísticas) para selectores como el de subir archivos
+        'assignment_options': ClientAssignment.objects.filter(
+            employee=user, is_active=True
+        ).select_related('client', 'service'),
         'search_query': search_query,
         'order_by': order_by,
         'pending_requests': pending_requests,
-        'pending_requests_count': pending_requests.count()
+        'pending_requests_count': len(pending_requests)
     }
 
 
@@ -969,76 +1227,21 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Dashboard principal del administrador"""
-    from django.core.cache import cache
-    
-    # Intentar obtener servicios y grupos desde cache
-    services = cache.get('all_services')
-    if services is None:
-        services = list(Service.objects.all())
-        cache.set('all_services', services, 60 * 15)  # 15 minutos
-    
-    groups = cache.get('all_groups')
-    if groups is None:
-        groups = list(Group.objects.all())
-        cache.set('all_groups', groups, 60 * 15)
-    
-    # Obtener solo empleados (staff o con grupos de Psicólogo/Tutor, excluyendo Cliente)
-    employees = User.objects.filter(
-        Q(is_staff=True) | 
-        Q(groups__name='Psicólogo') | 
-        Q(groups__name='Tutor')
-    ).exclude(groups__name='Cliente').distinct().prefetch_related('groups')
-    
-    # Obtener clientes con estadísticas anotadas
-    clients = User.objects.filter(groups__name='Cliente').distinct().annotate(
-        active_assignments_count=Count(
-            'client_assignments',
-            filter=Q(client_assignments__is_active=True),
-            distinct=True
-        ),
-        total_sessions=Count('client_assignments__sessions', distinct=True),
-        files_count=Count('client_assignments__files', distinct=True),
-        audit_count=Count('audit_logs', distinct=True)
-    ).prefetch_related('groups', 'client_assignments')
-    
-    # Obtener órdenes/solicitudes con prefetch
-    orders = Order.objects.select_related(
-        'customer', 'service', 'price', 'preferred_employee', 
-        'preferred_tutor', 'preferred_therapist'
-    ).prefetch_related(
-        'service__prices'
-    ).order_by('-created_at')[:50]
-    
-    assignments = ClientAssignment.objects.select_related(
-        'client', 'employee', 'service'
-    ).prefetch_related(
-        'sessions', 'files'
-    ).all()
-    
-    # Obtener sesiones ordenadas de más reciente a más antigua (para ver las nuevas primero)
-    sessions = Session.objects.select_related(
-        'assignment__client', 'assignment__employee', 'assignment__service'
-    ).prefetch_related(
-        'files'
-    ).order_by('-scheduled_date')[:100]
-    
-    files = FileUpload.objects.select_related(
-        'assignment', 'assignment__client', 'assignment__employee', 'uploaded_by'
-    ).order_by('-uploaded_at')[:50]
-    
-    # Obtener logs de auditoría ordenados por fecha descendente (más recientes primero)
-    audit_logs = AuditLog.objects.select_related('user').order_by('-timestamp')[:100]
+    from .admin_views import dashboard_summary
+    
+    # Servicios y grupos desde cache: 15 minutos, refrescados en segundo plano a los 5
+    services = cache_namespaces.catalog.get_or_compute(
+        'all_services', lambda: list(Service.objects.all()), 60 * 15, soft_timeout=60 * 5
+    )
+    groups = cache_namespaces.groups.get_or_compute(
+        'all_groups', lambda: list(Group.objects.all()), 60 * 15, soft_timeout=60 * 5
+    )
     
+    # Las pestañas se cargan bajo demanda desde admin_views.admin_section
     context = {
         'services': services,
         'groups': groups,
-        'employees': employees,
-        'clients': clients,
-        'orders': orders,
-        'assignments': assignments,
-        'sessions': sessions,
-        'files': files,
-        'audit_logs': audit_logs,
+        'summary': dashboard_summary(),
     }
     
     return render(request, 'admin-dashboard.html', context)
@@ -1089,10 +1292,6 @@ def admin_create_service(request):
             related_object_id=service.id
         )
         
-        # Limpiar caché
-        from django.core.cache import cache
-        cache.clear()
-        
         messages.success(request, f'Servicio "{service_name}" creado exitosamente')
         
     except Exception as e:
@@ -1123,10 +1322,6 @@ def admin_delete_service(request, service_id):
         # Eliminar servicio (los precios se eliminan en cascada)
         service.delete()
         
-        # Limpiar caché
-        from django.core.cache import cache
-        cache.clear()
-        
         messages.success(request, f'Servicio "{service_name}" y {prices_count} precio(s) eliminados exitosamente')
         
     except Exception as e:
@@ -1140,8 +1335,6 @@ def admin_delete_service(request, service_id):
 @require_http_methods(["POST"])
 def admin_create_price(request):
     """Crear un nuevo precio y opcionalmente un nuevo servicio"""
-    from django.core.cache import cache
-    
     try:
         servicio_id = request.POST.get('servicio')
         plan = request.POST.get('plan', '').strip()
@@ -1232,9 +1425,6 @@ def admin_create_price(request):
             related_object_id=price.id
         )
         
-        # Limpiar cache
-        cache.clear()
-        
         messages.success(request, f'Precio "{plan}" creado exitosamente para {service.name}')
         
     except Exception as e:
@@ -1371,25 +1561,40 @@ def admin_create_session(request):
         assignment = get_object_or_404(ClientAssignment, id=asignacion_id)
         
         # Combinar fecha y hora
-        fecha_hora = datetime.strptime(f'{fecha} {hora}', '%Y-%m-%d %H:%M')
-        
-        session = Session.objects.create(
-            assignment=assignment,
-            scheduled_date=fecha_hora,
-            duration_minutes=int(duracion),
-            status=estado,
-            notes=notas
-        )
-        
-        # Registrar en auditoría
-        AuditLog.objects.create(
-            user=request.user,
-            action='session_scheduled',
-            description=f'Sesión programada: {assignment.client.username} - {fecha_hora.strftime("%Y-%m-%d %H:%M")}',
-            ip_address=get_client_ip(request),
-            related_object_type='Session',
-            related_object_id=session.id
-        )
+        fecha_hora = timezone.make_aware(datetime.strptime(f'{fecha} {hora}', '%Y-%m-%d %H:%M'))
+        
+        # La sesión y sus estadísticas (señales) en la misma transacción
+        with transaction.atomic():
+            # No agendar al empleado dos veces en el mismo horario
+            if estado != 'cancelled':
+                lock_employees([assignment.employee_id])
+                conflicto = find_conflict(assignment.employee_id, fecha_hora, int(duracion))
+                if conflicto:
+                    inicio = timezone.localtime(conflicto.scheduled_date)
+                    messages.error(
+                        request,
+                        f'El empleado ya tiene una sesión con {conflicto.assignment.client.username} '
+                        f'el {inicio.strftime("%Y-%m-%d %H:%M")} ({conflicto.duration_minutes} min)'
+                    )
+                    return redirect('admin_dashboard')
+            
+            session = Session.objects.create(
+                assignment=assignment,
+                scheduled_date=fecha_hora,
+                duration_minutes=int(duracion),
+                status=estado,
+                notes=notas
+            )
+            
+            # Registrar en auditoría
+            AuditLog.objects.create(
+                user=request.user,
+                action='session_scheduled',
+                description=f'Sesión programada: {assignment.client.username} - {fecha_hora.strftime("%Y-%m-%d %H:%M")}',
+                ip_address=get_client_ip(request),
+                related_object_type='Session',
+                related_object_id=session.id
+            )
         
         messages.success(request, 'Sesión creada exitosamente')
         
@@ -1408,12 +1613,7 @@ def admin_generate_sessions(request, order_id):
     try:
         order = get_object_or_404(Order, id=order_id)
         
-        # Verificar si es Plan Estudiante (requiere tutor y terapeuta)
-        if order.service.slug == 'plan-estudiante':
-            result = generate_student_plan_sessions(order)
-        else:
-            # Servicios regulares (tutoría o terapia individual)
-            result = generate_sessions_for_order(order)
+        result = generate_order_sessions(order)
         
         if result['success']:
             messages.success(request, result['message'])
@@ -1563,10 +1763,6 @@ def admin_toggle_featured(request, price_id):
                 related_object_id=price.id
             )
             
-            # Limpiar caché para reflejar cambios inmediatamente
-            from django.core.cache import cache
-            cache.delete('index_services_data')
-            
             return JsonResponse({
                 'success': True,
                 'message': f'Plan {"destacado" if is_featured else "no destacado"} actualizado correctamente'
@@ -1922,15 +2118,17 @@ def admin_delete_file(request, file_id):
 def update_session_status(request, session_id):
     """API para actualizar el estado de una sesión"""
     try:
-        session = Session.objects.get(id=session_id)
         data = json.loads(request.body)
         new_status = data.get('status')
         
         if new_status not in ['completed', 'cancelled', 'scheduled', 'confirmed', 'no_show']:
             return JsonResponse({'success': False, 'error': 'Estado inválido'}, status=400)
         
-        session.status = new_status
-        session.save()
+        # Bloquear la fila para que el cambio de estado y las estadísticas sean consistentes
+        with transaction.atomic():
+            session = Session.objects.select_for_update().get(id=session_id)
+            session.status = new_status
+            session.save()
         
         return JsonResponse({
             'success': True,
@@ -1945,6 +2143,106 @@ def update_session_status(request, session_id):
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def bulk_update_sessions(request):
+    """
+    API para reprogramar, cancelar o cambiar el estado de varias sesiones a la vez.
+
+    Cuerpo JSON con employee o assignment (id) y action:
+    - shift: days (N días) o weekday (0 = lunes) y/o time (HH:MM); mueve las sesiones futuras
+    - cancel: start y end (YYYY-MM-DD, ambos incluidos)
+    - status: session_ids y status (completed o no_show)
+
+    Solo el empleado de las sesiones o un administrador. Cada acción es un solo
+    UPDATE con un registro de auditoría (ver bulk_sessions.py).
+    """
+    try:
+        data = json.loads(request.body)
+        owner = parse_owner(data)
+        if owner.kind == 'client':
+            raise ValueError('Indique employee o assignment')
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    if not is_admin(request.user):
+        if owner.kind == 'employee':
+            allowed = owner.id == request.user.id
+        else:
+            allowed = ClientAssignment.objects.filter(id=owner.id, employee=request.user).exists()
+        if not allowed:
+            return JsonResponse({'success': False, 'error': 'No autorizado'}, status=403)
+
+    action = data.get('action')
+    ip_address = get_client_ip(request)
+    try:
+        if action == 'shift':
+            count = shift_sessions(
+                owner, request.user,
+                days=int(data['days']) if data.get('days') else None,
+                weekday=int(data['weekday']) if data.get('weekday') not in (None, '') else None,
+                at=datetime.strptime(data['time'], '%H:%M').time() if data.get('time') else None,
+                ip_address=ip_address
+            )
+            message = f'Se reprogramaron {count} sesiones'
+        elif action == 'cancel':
+            count = cancel_sessions(
+                owner, request.user,
+                datetime.strptime(data.get('start', ''), '%Y-%m-%d').date(),
+                datetime.strptime(data.get('end', ''), '%Y-%m-%d').date(),
+                ip_address=ip_address
+            )
+            message = f'Se cancelaron {count} sesiones'
+        elif action == 'status':
+            count = set_sessions_status(
+                owner, request.user, [int(session_id) for session_id in data.get('session_ids', [])],
+                data.get('status'), ip_address=ip_address
+            )
+            message = f'Se actualizaron {count} sesiones'
+        else:
+            return JsonResponse({'success': False, 'error': 'Acción inválida'}, status=400)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({'success': True, 'message': message, 'updated': count})
+
+
+@login_required
+@require_http_methods(["POST"])
+def materialize_recurrence_session(request, recurrence_id):
+    """
+    API para crear la sesión de una ocurrencia de una repetición.
+
+    Parámetro occurrence: inicio original de la ocurrencia (ISO 8601, tal como
+    lo retornan las APIs de sesiones). Si ya existía retorna la misma sesión;
+    con su id se usan las APIs de siempre (estado, archivos).
+    """
+    recurrence = get_object_or_404(SessionRecurrence.objects.select_related('assignment'), id=recurrence_id)
+    assignment = recurrence.assignment
+    if request.user.id not in (assignment.client_id, assignment.employee_id) and not is_admin(request.user):
+        return JsonResponse({'success': False, 'error': 'No autorizado'}, status=403)
+
+    try:
+        occurrence = datetime.fromisoformat(request.POST.get('occurrence', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Fecha de ocurrencia inválida'}, status=400)
+    if timezone.is_naive(occurrence):
+        occurrence = timezone.make_aware(occurrence)
+
+    try:
+        session, created = materialize(recurrence, occurrence)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'created': created,
+        'session_id': session.id,
+        'scheduled_date': session.scheduled_date.isoformat(),
+        'status': session.status
+    })
+
+
 def solicitar_plan_estudiante(request):
     """Formulario específico para solicitar Plan Estudiante"""
     # Obtener parámetros de la URL
@@ -2211,6 +2509,8 @@ def generate_student_plan_sessions(order, user_account=None):
     - Crea sesiones de tutoría (1 por semana)
     - Crea sesiones de terapia (1 por semana)
     - Usa las fechas y horas específicas configuradas
+    - Corre las que chocan con la agenda del tutor o del terapeuta
+    - Guarda cada serie como una regla de repetición, en una transacción
     
     Args:
         order: Objeto Order de tipo Plan Estudiante
@@ -2243,32 +2543,6 @@ def generate_student_plan_sessions(order, user_account=None):
             'message': 'No se han especificado horas'
         }
     
-    # Crear o buscar el usuario del cliente
-    client_user = user_account
-    if not client_user:
-        try:
-            client_user = User.objects.get(email=order.customer.email)
-        except User.DoesNotExist:
-            # Crear usuario para el cliente
-            username = order.customer.email.split('@')[0]
-            base_username = username
-            counter = 1
-            while User.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            
-            client_user = User.objects.create_user(
-                username=username,
-                email=order.customer.email,
-                first_name=order.customer.name.split()[0] if order.customer.name else '',
-                last_name=' '.join(order.customer.name.split()[1:]) if len(order.customer.name.split()) > 1 else ''
-            )
-            # Asignar al grupo Cliente (crear el grupo si no existe)
-            cliente_group, created = Group.objects.get_or_create(name='Cliente')
-            client_user.groups.add(cliente_group)
-            if created:
-                print(f"✓ Grupo 'Cliente' creado automáticamente")
-    
     # Obtener servicios de tutoría y terapia
     try:
         tutoria_service = Service.objects.get(slug='tutoria')
@@ -2279,91 +2553,94 @@ def generate_student_plan_sessions(order, user_account=None):
             'message': 'No se encontraron los servicios de tutoría o terapia'
         }
     
-    # Crear asignación con tutor
-    tutoring_assignment, _ = ClientAssignment.objects.get_or_create(
-        client=client_user,
-        employee=order.preferred_tutor,
-        service=tutoria_service,
-        defaults={'is_active': True}
-    )
-    
-    # Crear asignación con terapeuta
-    therapy_assignment, _ = ClientAssignment.objects.get_or_create(
-        client=client_user,
-        employee=order.preferred_therapist,
-        service=terapia_service,
-        defaults={'is_active': True}
-    )
-    
-    tutoring_sessions_created = []
-    therapy_sessions_created = []
-    
-    # Generar sesiones de tutoría (1 por semana)
-    current_date = order.tutoring_start_date
-    for i in range(order.tutoring_sessions):
-        session_datetime = timezone.make_aware(
-            datetime.combine(current_date, order.tutoring_time)
-        )
+    with transaction.atomic():
+        # Otra petición pudo generarlas mientras tanto
+        if _order_already_generated(order):
+            return {
+                'success': False,
+                'message': 'Las sesiones ya fueron generadas para esta orden'
+            }
         
-        session = Session.objects.create(
-            assignment=tutoring_assignment,
-            scheduled_date=session_datetime,
-            duration_minutes=60,
-            status='scheduled',
-            notes=f'Sesión de tutoría {i + 1} de {order.tutoring_sessions} - Plan Estudiante'
+        # Horarios semanales sin chocar con la agenda del tutor ni del terapeuta (y
+        # entre sí, si son la misma persona); las semanas sin lugar se saltan
+        lock_employees([order.preferred_tutor_id, order.preferred_therapist_id])
+        calendars = employee_calendars(
+            [order.preferred_tutor_id, order.preferred_therapist_id],
+            timezone.make_aware(datetime.combine(
+                min(order.tutoring_start_date, order.therapy_start_date), time.min
+            ))
         )
+        tutoring_datetimes = _book_dates(
+            calendars[order.preferred_tutor_id],
+            _weekly_dates(order.tutoring_start_date),
+            order.tutoring_time,
+            order.tutoring_sessions
+        )
+        therapy_datetimes = _book_dates(
+            calendars[order.preferred_therapist_id],
+            _weekly_dates(order.therapy_start_date),
+            order.therapy_time,
+            order.therapy_sessions
+        )
+        if tutoring_datetimes is None or therapy_datetimes is None:
+            return {
+                'success': False,
+                'message': 'El tutor o el terapeuta no tienen horarios libres suficientes'
+            }
         
-        tutoring_sessions_created.append({
-            'id': session.id,
-            'date': session_datetime.strftime('%Y-%m-%d'),
-            'time': session_datetime.strftime('%H:%M'),
-            'weekday': session_datetime.strftime('%A')
-        })
+        # Crear o buscar el usuario del cliente
+        client_user = user_account or get_or_create_order_client(order)
         
-        # Avanzar 1 semana
-        current_date += timedelta(weeks=1)
-    
-    # Generar sesiones de terapia (1 por semana)
-    current_date = order.therapy_start_date
-    for i in range(order.therapy_sessions):
-        session_datetime = timezone.make_aware(
-            datetime.combine(current_date, order.therapy_time)
+        # Crear asignación con tutor
+        tutoring_assignment, _ = ClientAssignment.objects.get_or_create(
+            client=client_user,
+            employee=order.preferred_tutor,
+            service=tutoria_service,
+            defaults={'is_active': True}
         )
         
-        session = Session.objects.create(
-            assignment=therapy_assignment,
-            scheduled_date=session_datetime,
-            duration_minutes=60,
-            status='scheduled',
-            notes=f'Sesión de terapia {i + 1} de {order.therapy_sessions} - Plan Estudiante'
+        # Crear asignación con terapeuta
+        therapy_assignment, _ = ClientAssignment.objects.get_or_create(
+            client=client_user,
+            employee=order.preferred_therapist,
+            service=terapia_service,
+            defaults={'is_active': True}
         )
         
-        therapy_sessions_created.append({
-            'id': session.id,
-            'date': session_datetime.strftime('%Y-%m-%d'),
-            'time': session_datetime.strftime('%H:%M'),
-            'weekday': session_datetime.strftime('%A')
-        })
+        tutoring_sessions = create_recurrence(
+            tutoring_assignment, tutoring_datetimes, [order.tutoring_start_date.weekday()],
+            order.tutoring_time, 60, f'{order.tutoring_sessions} sesiones de tutoría - Plan Estudiante'
+        )
+        therapy_sessions = create_recurrence(
+            therapy_assignment, therapy_datetimes, [order.therapy_start_date.weekday()],
+            order.therapy_time, 60, f'{order.therapy_sessions} sesiones de terapia - Plan Estudiante'
+        )
         
-        # Avanzar 1 semana
-        current_date += timedelta(weeks=1)
-    
-    # Marcar orden como con sesiones generadas
-    order.sessions_generated = True
-    order.status = 'confirmed'
-    order.save()
+        # Marcar orden como con sesiones generadas
+        order.sessions_generated = True
+        order.status = 'confirmed'
+        order.save()
     
     return {
         'success': True,
-        'message': f'Se generaron {len(tutoring_sessions_created)} sesiones de tutoría y {len(therapy_sessions_created)} sesiones de terapia',
-        'tutoring_sessions': tutoring_sessions_created,
-        'therapy_sessions': therapy_sessions_created,
+        'message': f'Se generaron {len(tutoring_sessions)} sesiones de tutoría y {len(therapy_sessions)} sesiones de terapia',
+        'tutoring_sessions': [_session_summary(session) for session in tutoring_sessions],
+        'therapy_sessions': [_session_summary(session) for session in therapy_sessions],
         'tutoring_assignment_id': tutoring_assignment.id,
         'therapy_assignment_id': therapy_assignment.id,
         'client_username': client_user.username
     }
 
 
+def generate_order_sessions(order, user_account=None):
+    """Generar las sesiones de una orden según su servicio"""
+    # Plan Estudiante: requiere tutor y terapeuta
+    if order.service.slug == 'plan-estudiante':
+        return generate_student_plan_sessions(order, user_account)
+    # Servicios regulares (tutoría o terapia individual)
+    return generate_sessions_for_order(order, user_account)
+
+
 @login_required
 def cliente_perfil(request):
     """Vista del perfil del cliente"""
@@ -2730,6 +3007,7 @@ def reject_request(request, order_id):
 
 @login_required
 @require_http_methods(["GET"])
+@conditional_json(assignment_files_etag)
 def get_assignment_files(request, assignment_id):
     """API para obtener archivos de una asesoría específica"""
     try: